@@ -0,0 +1,419 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: checkpoint
+   :platform: Unix
+   :synopsis: Records the plugins completed by a run, and the blocks of \
+       frames written by the plugin running, so that a failed run can be \
+       resumed.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import glob
+import time
+import logging
+import hashlib
+import tempfile
+import cPickle
+import h5py
+import numpy as np
+from mpi4py import MPI
+
+import savu.plugins.utils as pu
+import savu.core.utils as cu
+
+# the sub-directory of the output folder holding the manifest and journals
+CHECKPOINT_DIR = 'checkpoint'
+MANIFEST = 'manifest.pkl'
+# the longest time, in seconds, between updates of a journal
+JOURNAL_INTERVAL = 60
+
+
+def get_fingerprint(dset):
+    """ A digest of the shape, dtype and the first, middle and last frames
+    (in the first dimension) of a dataset.
+    """
+    sha = hashlib.sha1(repr((tuple(dset.shape), str(dset.dtype))))
+    n = dset.shape[0] if dset.shape else 0
+    for frame in sorted(set([0, n//2, n - 1])) if n else []:
+        sha.update(np.ascontiguousarray(dset[frame]).tobytes())
+    return sha.hexdigest()
+
+
+def get_ranges(blocks):
+    """ The (start, stop) of each run of consecutive integers in blocks. """
+    blocks = np.unique(np.asarray(blocks, dtype=np.int64))
+    if not blocks.size:
+        return []
+    breaks = np.flatnonzero(np.diff(blocks) != 1) + 1
+    starts = np.append(blocks[0], blocks[breaks])
+    stops = np.append(blocks[breaks - 1], blocks[-1]) + 1
+    return zip(starts.tolist(), stops.tolist())
+
+
+class Checkpoint(object):
+    """ Records each plugin completed by a run in a manifest, in the
+    checkpoint folder of the output folder, and with the resume option finds
+    the first plugin that a previous run, with the same output folder, did
+    not complete.
+
+    Each plugin is identified by a digest of its id and parameters and the
+    digest of the plugin before it, starting from the loaders and the size
+    and modification time of the input file, so a change to any plugin means
+    all later plugins are run again.  The manifest entry of a plugin holds
+    the file, shape and fingerprint (see get_fingerprint) of each dataset it
+    wrote and the meta data of every dataset once it had completed.  The
+    plugins before the first one to run are set up as usual but, instead of
+    running them, their output files are opened read-only, after checking
+    the fingerprint of those still to be read.
+
+    The blocks of frames written by a plugin are recorded, by each process,
+    in a journal (see Journal), so that a plugin that failed part way
+    through is continued, writing only the missing frames, if its output
+    files allow it.
+    """
+
+    def __init__(self, exp):
+        self.exp = exp
+        options = exp.meta_data.get_dictionary()
+        self.process = options.get('process', 0)
+        self.mpi = options.get('mpi', False) is True
+        self.path = os.path.join(options['out_path'], CHECKPOINT_DIR)
+        plugin_list = exp.meta_data.plugin_list
+        self.n_loaders = plugin_list._get_n_loaders()
+        self.datasets_list = plugin_list._get_datasets_list()
+        self.digests = self.__get_digests(options, plugin_list.plugin_list)
+        self.entries = {}
+        self.start = self.n_loaders
+        self.current = None
+        self.continuing = False
+        if options.get('resume', False):
+            self.__resume()
+
+    def __get_digests(self, options, plugin_list):
+        """ The digest of each plugin, by index in the plugin list. """
+        data_file = os.path.abspath(options['data_file'])
+        stat = os.stat(data_file)
+        digest = repr((data_file, stat.st_size, int(stat.st_mtime)))
+        digests = {}
+        for i, plugin in enumerate(plugin_list[:-1]):
+            params = sorted(plugin['data'].items())
+            digest = hashlib.sha1(
+                repr((digest, plugin['id'], params))).hexdigest()
+            if i >= self.n_loaders:
+                digests[i] = digest
+        return digests
+
+    def __bcast(self, value):
+        return MPI.COMM_WORLD.bcast(value, root=0) if self.mpi else value
+
+    def __resume(self):
+        result = None
+        if self.process == 0:
+            result = self.__find_start()
+        self.start, self.entries = self.__bcast(result)
+        n_plugins = len(self.digests) + self.n_loaders
+        if self.start == n_plugins:
+            cu.user_message("All plugins were completed by a previous run")
+        elif self.start > self.n_loaders:
+            cu.user_message("Resuming from plugin %i, plugins %i to %i were "
+                            "completed by a previous run" % (
+                                self.start, self.n_loaders, self.start - 1))
+
+    def __find_start(self):
+        """ The index of the first plugin that has not been completed, and
+        the manifest entries of the plugins before it.
+        """
+        entries = self.__load()
+        start = self.n_loaders
+        while start in self.digests and start in entries and \
+                entries[start]['digest'] == self.digests[start]:
+            start += 1
+        start = self.__get_chain_start(start)
+        # the datasets read by the plugins still to run must be intact
+        while True:
+            invalid = [p for p, name in self.__get_needed(start) if not
+                       self.__is_intact(entries[p]['files'].get(name))]
+            if not invalid:
+                break
+            start = self.__get_chain_start(min(invalid))
+        return start, dict((i, e) for i, e in entries.items() if i < start)
+
+    def __get_chain_start(self, index):
+        """ The first plugin of the fused chain containing index (fused
+        plugins are only run together).
+        """
+        if not self.exp.meta_data.get_dictionary().get('fusion', False):
+            return index
+        chains = self.exp.meta_data.plugin_list._get_fused_chains()
+        for first, last in chains.items():
+            if first <= index <= last:
+                return first
+        return index
+
+    def __get_needed(self, start):
+        """ The (index of the plugin that wrote it, name) of each dataset
+        written before start and read by a plugin from start onwards.
+        """
+        needed = set()
+        for q in range(start - self.n_loaders, len(self.datasets_list)):
+            for d in self.datasets_list[q]['in_datasets']:
+                for p in range(q - 1, -1, -1):
+                    names = [o['name'] for o in
+                             self.datasets_list[p]['out_datasets']]
+                    if d['name'] in names:
+                        if p + self.n_loaders < start:
+                            needed.add((p + self.n_loaders, d['name']))
+                        break
+        return needed
+
+    def __is_intact(self, info):
+        if not info:
+            return False
+        filename, path, shape, fingerprint = info
+        try:
+            with h5py.File(filename, 'r') as f:
+                dset = f[path]
+                return tuple(dset.shape) == shape and \
+                    get_fingerprint(dset) == fingerprint
+        except (IOError, KeyError, ValueError) as e:
+            logging.warning("Unable to read %s from %s: %s", path, filename,
+                            e)
+            return False
+
+    def __load(self):
+        path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(path):
+            cu.user_message("There is no manifest of a previous run in %s"
+                            % self.path)
+            return {}
+        try:
+            with open(path, 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError) as e:
+            logging.warning("Unable to read the manifest %s: %s", path, e)
+            return {}
+
+    def __save(self):
+        """ Write the manifest to a temporary file then rename it, so that
+        a failure never leaves a partial manifest. """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(self.entries, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, os.path.join(self.path, MANIFEST))
+
+    def begin(self, index, plugin):
+        """ Start running the plugin at index in the plugin list.
+
+        :returns: True if the plugin is continued from the frames written by
+            a previous run, in which case its output files must be opened
+            rather than created.
+        """
+        self.current = index
+        self.continuing = False
+        if index == self.start and not pu.has_post_process(plugin):
+            result = None
+            if self.process == 0:
+                result = self.__can_continue(index)
+            self.continuing = self.__bcast(result)
+        if not self.continuing:
+            if self.process == 0:
+                for journal in self.__get_journals(index):
+                    os.remove(journal)
+            self.exp._barrier()
+        return self.continuing
+
+    def __can_continue(self, index):
+        """ Whether the plugin's output files hold the frames recorded in
+        its journals, and can be written to.
+        """
+        if not self.__get_journals(index) or \
+                self.__read_journals(index) is None:
+            return False
+        for data in self.exp.index['out_data'].values():
+            info = data.data_info.get_meta_data('file_info')
+            try:
+                with h5py.File(info['filename'], 'r') as f:
+                    dset = f[info['group_name']]['data']
+                    if tuple(dset.shape) != tuple(data.get_shape()) or \
+                            dset.is_virtual or \
+                            dset.id.get_create_plist().get_nfilters():
+                        return False
+            except (IOError, KeyError, ValueError, TypeError):
+                return False
+        return True
+
+    def __get_journals(self, index):
+        return glob.glob(os.path.join(self.path, 'p%02i_*.journal' % index))
+
+    def __read_journals(self, index):
+        """ The blocks recorded in the journals of a plugin, or None if a
+        journal is not for this plugin. """
+        blocks = set()
+        for journal in self.__get_journals(index):
+            with open(journal, 'r') as f:
+                lines = f.read().split('\n')
+            if lines[0] != self.digests[index]:
+                return None
+            for line in lines[1:]:
+                if line.count(' ') == 1:
+                    start, stop = map(int, line.split())
+                    blocks.update(range(start, stop))
+        return blocks
+
+    def get_journal(self, out_data, writer, blocks=None,
+                    comm=MPI.COMM_WORLD):
+        """ Get the journal of this process for the plugin running, or None
+        if its frames can not be recorded.
+
+        :param list(Data) out_data: The output datasets of the plugin.
+        :param CompressedWriter writer: The writer of the output datasets.
+        :param blocks: The (global) index of each block of frames of this
+            process, or None if the blocks are given by their index.
+        :param comm: The processes running the plugin.
+        """
+        datasets = [d.data for d in out_data]
+        if self.current is None or not datasets or any(
+                not isinstance(d, h5py.Dataset) or d.compression for d in
+                datasets) or any(writer.virtual) or any(writer.collective):
+            return None
+        done = set()
+        if self.continuing:
+            if comm.rank == 0:
+                done = self.__read_journals(self.current) or set()
+                cu.user_message("%i blocks of frames were written by a "
+                                "previous run" % len(done))
+            done = comm.bcast(done, root=0) if self.mpi else done
+        if comm.rank == 0 and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.exp._barrier(communicator=comm)
+        filename = os.path.join(self.path, 'p%02i_%03i.journal' %
+                                (self.current, self.process))
+        return Journal(filename, self.digests[self.current], done, writer,
+                       blocks)
+
+    def complete(self, index):
+        """ Record the plugin at index in the plugin list as completed, once
+        its output datasets are in exp.index['in_data'].
+        """
+        in_data = self.exp.index['in_data']
+        names = [d['name'] for d in
+                 self.datasets_list[index - self.n_loaders]['out_datasets']]
+        # the files must hold the data before the fingerprint is taken
+        for name in names:
+            if name in in_data and \
+                    isinstance(in_data[name].backing_file, h5py.File):
+                in_data[name].backing_file.flush()
+        self.exp._barrier()
+        if self.process == 0:
+            self.entries[index] = {
+                'digest': self.digests[index],
+                'files': dict((name, self.__get_info(in_data[name])) for
+                              name in names if name in in_data),
+                'meta_data': self.__get_meta_data(in_data)}
+            self.__save()
+            for journal in self.__get_journals(index):
+                os.remove(journal)
+        self.current = None
+        self.exp._barrier()
+
+    def __get_info(self, data):
+        dset = data.data
+        if not isinstance(data.backing_file, h5py.File) or \
+                not isinstance(dset, h5py.Dataset):
+            return None
+        return (data.backing_file.filename, data.group_name + '/data',
+                tuple(dset.shape), get_fingerprint(dset))
+
+    def __get_meta_data(self, in_data):
+        meta_data = {}
+        for name, data in in_data.items():
+            try:
+                meta_data[name] = cPickle.loads(cPickle.dumps(
+                    data.meta_data.get_dictionary(), protocol=2))
+            except (cPickle.PicklingError, TypeError) as e:
+                logging.warning("Unable to record the meta data of %s: %s",
+                                name, e)
+        return meta_data
+
+    def restore(self, index):
+        """ Set the meta data of each dataset to that recorded once the
+        plugin at index in the plugin list had completed.
+        """
+        for name, meta_data in self.entries[index]['meta_data'].items():
+            if name in self.exp.index['in_data']:
+                self.exp.index['in_data'][name].meta_data._set_dictionary(
+                    meta_data)
+
+
+class Journal(object):
+    """ A record of the blocks of frames of a plugin written by a process.
+    The blocks written are added to the journal, as ranges, at most every
+    JOURNAL_INTERVAL seconds, after writing any blocks buffered by the
+    writer and flushing the output files (files opened with the mpio driver
+    are written directly).
+
+    :param str filename: The journal file, appended to if it exists.
+    :param str digest: The digest of the plugin (the first line).
+    :param set done: The blocks already written, which are skipped.
+    :param CompressedWriter writer: The writer of the output datasets.
+    :param blocks: The (global) index of each block of frames of this
+        process, or None if the blocks are given by their index.
+    """
+
+    def __init__(self, filename, digest, done, writer, blocks=None):
+        self.filename = filename
+        self.done = done
+        self.writer = writer
+        self.blocks = blocks
+        self.written = []
+        self.last = time.time()
+        if not os.path.exists(filename):
+            with open(filename, 'w') as f:
+                f.write(digest + '\n')
+
+    def __get_block(self, count):
+        return count if self.blocks is None else int(self.blocks[count])
+
+    def skip(self, count):
+        """ Whether block count was written by a previous run. """
+        return self.__get_block(count) in self.done
+
+    def add(self, count):
+        """ Record that block count has been written. """
+        self.written.append(self.__get_block(count))
+        if time.time() - self.last > JOURNAL_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """ Write the blocks recorded to the journal. """
+        self.last = time.time()
+        if not self.written:
+            return
+        self.writer.flush()
+        for dset in self.writer.datasets:
+            if dset.file.driver != 'mpio':
+                dset.file.flush()
+        with open(self.filename, 'a') as f:
+            for start, stop in get_ranges(self.written):
+                f.write('%i %i\n' % (start, stop))
+            f.flush()
+            os.fsync(f.fileno())
+        self.written = []
@@ -0,0 +1,261 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_cache
+   :platform: Unix
+   :synopsis: Sizes the hdf5 raw data chunk cache of each dataset for the \
+       blocks of frames the plugins read or write, and counts the \
+       (estimated) cache hits and misses.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+import threading
+import collections
+import itertools
+import h5py
+import numpy as np
+
+from savu.data.data_structures.data_add_ons import Padding
+
+# the hdf5 defaults
+DEFAULT_NBYTES = 1024**2
+DEFAULT_NSLOTS = 521
+DEFAULT_W0 = 0.75
+# default chunk cache memory of each process (MB), shared by the datasets
+# open at once
+DEFAULT_LIMIT = 256
+# hash table slots per chunk in the cache, as recommended by hdf5
+SLOTS_PER_CHUNK = 100
+
+
+def get_cache_kwargs(exp, shape, dtype, chunks, patterns):
+    """ The keyword arguments of h5py.File that size the chunk cache of the
+    datasets in a file to hold all chunks of a dataset touched by a block of
+    frames accessed with any of patterns, up to the dataset's share of the
+    chunk_cache option (see get_cache_limit).  hdf5 only applies chunk cache
+    settings when a dataset is opened, so they are set as the defaults of
+    the file holding it, when the file is opened.
+
+    :param tuple shape: The shape of the dataset.
+    :param dtype: The dtype of the dataset.
+    :param tuple chunks: The chunks of the dataset (or None, or True if
+        they are chosen by h5py).
+    :param list patterns: The patterns ({'slice_dir': ..., 'max_frames':
+        ...}) the dataset is read or written with.
+    :returns: A dictionary of rdcc_* arguments, empty if the dataset is not
+        chunked or the patterns are not known.
+    """
+    patterns = [p for p in patterns if p and p.get('slice_dir')]
+    if type(chunks) is not tuple or not patterns:
+        return {}
+    limit = get_cache_limit(exp)
+    chunk_bytes = int(np.prod(chunks))*np.dtype(dtype).itemsize
+    need = max(_get_chunks_touched(shape, chunks, p) for p in patterns) * \
+        chunk_bytes
+    nbytes = max(min(need, limit), DEFAULT_NBYTES)
+    nChunks = max(nbytes//chunk_bytes, 1)
+    nslots = max(_next_prime(nChunks*SLOTS_PER_CHUNK), DEFAULT_NSLOTS)
+    return {'rdcc_nbytes': int(nbytes), 'rdcc_nslots': nslots,
+            'rdcc_w0': DEFAULT_W0}
+
+
+def get_cache_limit(exp):
+    """ The chunk cache memory (in bytes) of each dataset: the chunk_cache
+    option (in MB) is the memory of each process, shared equally by the
+    most datasets open at once while the plugin list runs.
+    """
+    options = exp.meta_data.get_dictionary()
+    budget = int((options.get('chunk_cache', None) or DEFAULT_LIMIT)*1024**2)
+    return budget//_get_open_datasets(exp)
+
+
+def _get_open_datasets(exp):
+    """ The most datasets open at once while the plugin list runs: a plugin
+    writes its output datasets while those created before it (each kept open
+    until a dataset of the same name replaces it) are still open.
+    """
+    plugin_list = getattr(exp.meta_data, 'plugin_list', None)
+    if plugin_list is None:
+        return 1
+    names = set()
+    most = 1
+    for dsets in plugin_list._get_datasets_list():
+        names.update(d['name'] for d in dsets['in_datasets'])
+        out_names = [d['name'] for d in dsets['out_datasets']]
+        most = max(most, len(names) + len(out_names))
+        names.update(out_names)
+    return most
+
+
+def get_file_cache_kwargs(exp, filename, path, patterns):
+    """ get_cache_kwargs for the dataset at path in an existing file,
+    found by opening the file briefly.
+    """
+    try:
+        with h5py.File(filename, 'r') as f:
+            dataset = f[path]
+            shape, dtype, chunks = dataset.shape, dataset.dtype, \
+                dataset.chunks
+    except (IOError, KeyError, AttributeError) as e:
+        logging.debug("Unable to find the chunks of %s in %s: %s", path,
+                      filename, e)
+        return {}
+    return get_cache_kwargs(exp, shape, dtype, chunks, patterns)
+
+
+def get_read_patterns(exp, name):
+    """ The patterns dataset name is read with by the plugins in the plugin
+    list, until it is replaced by a plugin writing a dataset of that name.
+    """
+    patterns = []
+    for dsets in exp.meta_data.plugin_list._get_datasets_list():
+        patterns += [d['pattern'].values()[0] for d in dsets['in_datasets']
+                     if d['name'] == name and d['pattern']]
+        if name in [d['name'] for d in dsets['out_datasets']]:
+            break
+    return patterns
+
+
+def _get_chunks_touched(shape, chunks, pattern):
+    """ The number of chunks touched by a block of frames: all of each core
+    dimension, max_frames of the first slice dimension and one of any other
+    slice dimension (at any offset).
+    """
+    slab = list(shape)
+    slice_dirs = pattern['slice_dir']
+    for dim in slice_dirs:
+        slab[dim] = 1
+    slab[slice_dirs[0]] = max(int(pattern.get('max_frames', 1) or 1), 1)
+    touched = 1
+    for length, size, chunk in zip(shape, slab, chunks):
+        size = min(size, length)
+        touched *= min(-(-(size - 1)//chunk) + 1, -(-length//chunk))
+    return touched
+
+
+class ChunkCache(object):
+    """ Counts the (estimated) chunk cache hits and misses of the chunked
+    hdf5 datasets used by a plugin, with the chunk cache each was opened
+    with (see get_cache_kwargs).
+    """
+
+    def __init__(self):
+        self.__counters = {}
+
+    def watch(self, data_list):
+        """ Start counting the chunk cache hits and misses of each chunked
+        hdf5 dataset in data_list.
+        """
+        self.__counters = {}
+        for data in data_list:
+            dataset = data.data
+            if not isinstance(dataset, h5py.Dataset) or \
+                    not dataset.chunks or id(dataset) in self.__counters:
+                continue
+            nslots, nbytes, w0 = \
+                dataset.id.get_access_plist().get_chunk_cache()
+            chunk_bytes = int(np.prod(dataset.chunks)) * \
+                dataset.dtype.itemsize
+            name = "%s in %s" % (data.get_name(),
+                                 os.path.basename(dataset.file.filename))
+            self.__counters[id(dataset)] = _CacheCounter(
+                name, dataset.chunks, max(nbytes//chunk_bytes, 1), nbytes,
+                nslots, w0)
+
+    def record(self, data_list, slice_lists, count):
+        """ Count the chunk cache hits and misses of accessing block count of
+        each dataset.
+        """
+        for data, sl in zip(data_list, slice_lists):
+            counter = self.__counters.get(id(data.data))
+            if counter and count < len(sl):
+                counter.access(self.__get_region(data, sl[count]))
+
+    def report(self, name):
+        """ Log the chunk cache hits and misses of each dataset. """
+        for counter in self.__counters.values():
+            logging.info("%s - %s", name, counter)
+        self.__counters = {}
+
+    def __get_padding(self, data):
+        padding = data._get_plugin_data().padding
+        if not isinstance(padding, Padding):
+            return {}
+        return padding._get_padding_directions()
+
+    def __get_region(self, data, slice_tup):
+        """ The (start, stop) of the padded region accessed in each dim. """
+        shape = data.data.shape
+        region = []
+        for dim, sl in enumerate(slice_tup):
+            if isinstance(sl, slice):
+                start, stop, _ = sl.indices(shape[dim])
+            else:
+                start, stop = sl, sl + 1
+            region.append([start, stop])
+        for dim, pad in self.__get_padding(data).items():
+            region[dim] = [max(region[dim][0] - pad['before'], 0),
+                           min(region[dim][1] + pad['after'], shape[dim])]
+        return region
+
+
+class _CacheCounter(object):
+    """ Simulates the chunk cache of a dataset as a least recently used list
+    of chunks, counting the hits and misses.
+    """
+
+    def __init__(self, name, chunks, nChunks, nbytes, nslots, w0):
+        self.name = name
+        self.chunks = chunks
+        self.nChunks = nChunks
+        self.settings = (nbytes, nslots, w0)
+        self.hits = 0
+        self.misses = 0
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def access(self, region):
+        ranges = [range(start//c, -(-stop//c)) for (start, stop), c in
+                  zip(region, self.chunks)]
+        with self.__lock:
+            for chunk in itertools.product(*ranges):
+                if chunk in self.__cache:
+                    self.hits += 1
+                    del self.__cache[chunk]
+                else:
+                    self.misses += 1
+                    if len(self.__cache) >= self.nChunks:
+                        self.__cache.popitem(last=False)
+                self.__cache[chunk] = True
+
+    def __str__(self):
+        total = self.hits + self.misses
+        return ("chunk cache of %s (%.1f MB, %i slots, w0 %.2f): %i hits, "
+                "%i misses (%.0f%% hit rate, estimated)" % (
+                    self.name, self.settings[0]/1e6, self.settings[1],
+                    self.settings[2], self.hits, self.misses,
+                    100.0*self.hits/total if total else 0))
+
+
+def _next_prime(n):
+    """ The smallest prime number >= n. """
+    n = max(int(n), 2)
+    while any(n % i == 0 for i in xrange(2, int(n**0.5) + 1)):
+        n += 1
+    return n
@@ -0,0 +1,154 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_pipeline
+   :platform: Unix
+   :synopsis: A three stage (read-ahead, process, write-behind) pipeline that \
+       overlaps the transfer of frames with their processing.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import sys
+import time
+import Queue
+import logging
+import threading
+
+import savu.core.utils as cu
+
+_END = object()
+
+
+class FramePipeline(object):
+    """ Run the read, process and write stages of a plugin concurrently.
+
+    Frames are read ahead into a bounded queue by a reader thread, processed
+    in the calling thread and the results drained to the backing files by a
+    writer thread.  The queue depth bounds the number of frames held in memory
+    by each stage.  The time each stage spends waiting on its neighbours is
+    recorded in ``self.stalls``.
+    """
+
+    def __init__(self, depth):
+        if depth < 1:
+            raise ValueError("The pipeline depth must be at least 1.")
+        self.depth = depth
+        self.stalls = {'read': 0.0, 'process': 0.0, 'write': 0.0}
+        self.__abort = threading.Event()
+        self.__error = None
+
+    def run(self, counts, read, process, write):
+        """ Pass each frame index in ``counts`` through the three stages.
+
+        :param iterable counts: frame indices, in processing order.
+        :param function read: read(count) returns the data for a frame.
+        :param function process: process(count, data) returns the result.
+        :param function write: write(count, result) saves the result.
+        """
+        in_queue = Queue.Queue(maxsize=self.depth)
+        out_queue = Queue.Queue(maxsize=self.depth)
+
+        reader = threading.Thread(target=self.__stage, name='savu_reader',
+                                  args=(self.__read, counts, read, in_queue))
+        writer = threading.Thread(target=self.__stage, name='savu_writer',
+                                  args=(self.__write, out_queue, write))
+        reader.daemon = True
+        writer.daemon = True
+        reader.start()
+        writer.start()
+
+        try:
+            self.__process(in_queue, process, out_queue)
+        except:
+            self.__set_error()
+        finally:
+            self.__put(out_queue, _END, 'process')
+            writer.join()
+            self.__abort.set()
+            reader.join()
+
+        if self.__error:
+            raise self.__error[0], self.__error[1], self.__error[2]
+
+    def __stage(self, function, *args):
+        """ Run a pipeline stage, recording any exception raised. """
+        try:
+            function(*args)
+        except:
+            self.__set_error()
+
+    def __set_error(self):
+        if self.__error is None:
+            self.__error = sys.exc_info()
+        self.__abort.set()
+
+    def __read(self, counts, read, in_queue):
+        for count in counts:
+            if self.__abort.is_set():
+                break
+            self.__put(in_queue, (count, read(count)), 'read')
+        self.__put(in_queue, _END, 'read')
+
+    def __process(self, in_queue, process, out_queue):
+        while True:
+            item = self.__get(in_queue, 'process')
+            if item is _END:
+                break
+            count, data = item
+            self.__put(out_queue, (count, process(count, data)), 'process')
+
+    def __write(self, out_queue, write):
+        while True:
+            item = self.__get(out_queue, 'write')
+            if item is _END:
+                break
+            write(*item)
+
+    def __put(self, queue, item, stage):
+        """ Put an item on a queue, timing the wait for a free slot. """
+        start = time.time()
+        while not self.__abort.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                break
+            except Queue.Full:
+                pass
+        self.stalls[stage] += time.time() - start
+
+    def __get(self, queue, stage):
+        """ Get an item from a queue, timing the wait for it to arrive. """
+        start = time.time()
+        while not self.__abort.is_set():
+            try:
+                item = queue.get(timeout=0.1)
+                break
+            except Queue.Empty:
+                pass
+        else:
+            item = _END
+        self.stalls[stage] += time.time() - start
+        return item
+
+    def report(self, name):
+        """ Log the time each pipeline stage spent stalled. """
+        message = ("%s - pipeline stalls (depth %i): read %.2fs, process "
+                   "%.2fs, write %.2fs" % (name, self.depth,
+                                           self.stalls['read'],
+                                           self.stalls['process'],
+                                           self.stalls['write']))
+        logging.info(message)
+        cu.user_message(message)
@@ -0,0 +1,122 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_scheduler
+   :platform: Unix
+   :synopsis: Hands out chunks of frames to processes on demand, through a \
+       shared counter held in an MPI window on the first process.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import numpy as np
+from mpi4py import MPI
+
+import savu.core.utils as cu
+
+
+class FrameScheduler(object):
+    """ A dynamic alternative to splitting the frames evenly between
+    processes.  Each process claims the next ``chunk`` frames from a counter
+    (using an atomic one-sided MPI fetch and add), so faster processes take on
+    more of the work.
+
+    The frames claimed by this process are appended to ``self.frames`` in
+    processing order, and the time spent processing each one should be
+    recorded with :meth:`record`.
+    """
+
+    def __init__(self, chunk, comm=MPI.COMM_WORLD):
+        if chunk < 1:
+            raise ValueError("The scheduler chunk size must be at least 1.")
+        self.chunk = chunk
+        self.comm = comm
+        self.frames = []
+        self.costs = {}
+        self.nFrames = 0
+        self.__win = self.__create_counter()
+
+    def __create_counter(self):
+        """ Allocate a zeroed 64-bit counter in a window on the first
+        process.
+        """
+        itemsize = np.dtype(np.int64).itemsize
+        win = MPI.Win.Allocate(itemsize if self.comm.rank == 0 else 0,
+                               itemsize, comm=self.comm)
+        if self.comm.rank == 0:
+            win.Lock(0)
+            win.Put(np.zeros(1, dtype=np.int64), 0)
+            win.Unlock(0)
+        self.comm.barrier()
+        return win
+
+    def claim(self, nFrames, skip=None):
+        """ A generator of frame indices, in the range [0, nFrames), claimed
+        by this process.  Frames for which skip(frame) is True (written by a
+        previous run) are claimed but not returned or added to self.frames.
+        """
+        self.nFrames = nFrames
+        while True:
+            start = self.__fetch_and_add()
+            if start >= nFrames:
+                break
+            for frame in range(start, min(start + self.chunk, nFrames)):
+                if skip and skip(frame):
+                    continue
+                self.frames.append(frame)
+                yield frame
+
+    def __fetch_and_add(self):
+        increment = np.array([self.chunk], dtype=np.int64)
+        start = np.zeros(1, dtype=np.int64)
+        self.__win.Lock(0, MPI.LOCK_SHARED)
+        self.__win.Fetch_and_op(increment, start, 0, op=MPI.SUM)
+        self.__win.Unlock(0)
+        return int(start[0])
+
+    def record(self, frame, cost):
+        """ Record the time taken to process a frame. """
+        self.costs[frame] = cost
+
+    def close(self, name):
+        """ Free the counter and report the load balance achieved, compared
+        with an estimate for an even split of the frames.  Must be called by
+        all processes in the communicator.
+        """
+        self.__win.Free()
+        busy = sum(self.costs.values())
+        logging.info("%s - processed %i frames in %.2fs", name,
+                     len(self.frames), busy)
+        all_costs = self.comm.gather(self.costs, root=0)
+        if self.comm.rank == 0:
+            self.__report(name, all_costs)
+
+    def __report(self, name, all_costs):
+        costs = {}
+        for c in all_costs:
+            costs.update(c)
+        dynamic = [sum(c.values()) for c in all_costs]
+        blocks = np.array_split(np.arange(self.nFrames), len(all_costs))
+        static = [sum(costs.get(f, 0) for f in b) for b in blocks]
+        message = ("%s - dynamic scheduling: %i-%i frames per process, "
+                   "busiest process %.2fs (estimated %.2fs for an even split, "
+                   "%.2fs of imbalance removed)" %
+                   (name, min(len(c) for c in all_costs),
+                    max(len(c) for c in all_costs), max(dynamic), max(static),
+                    max(static) - max(dynamic)))
+        logging.info(message)
+        cu.user_message(message)
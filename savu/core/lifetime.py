@@ -0,0 +1,197 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: lifetime
+   :platform: Unix
+   :synopsis: Creates the backing file of each dataset just before the \
+       plugin that writes it runs and releases each intermediate dataset \
+       once the last plugin to read it has finished.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+import h5py
+
+import savu.plugins.utils as pu
+import savu.core.utils as cu
+import savu.core.trace as trace
+
+
+def get_releases(datasets_list, n_loaders):
+    """ Find the last plugin to read each dataset written by a plugin, before
+    the dataset is replaced by another plugin writing a dataset of the same
+    name.
+
+    :param list datasets_list: The in and out datasets of each plugin, see
+        PluginList._get_datasets_list.
+    :param int n_loaders: The number of loaders in the plugin list.
+    :returns: {index of the last plugin to read a dataset: [(index of the
+        plugin that wrote it, name), ...]}, with plugin list indices.
+        Datasets that are never read are not included.
+    """
+    names = [dict((key, [d['name'] for d in dsets[key]]) for key in
+                  ['in_datasets', 'out_datasets']) for dsets in datasets_list]
+    releases = {}
+    for p in range(len(names)):
+        for name in names[p]['out_datasets']:
+            last = None
+            for q in range(p+1, len(names)):
+                if name in names[q]['in_datasets']:
+                    last = q
+                if name in names[q]['out_datasets']:
+                    break
+            if last is not None:
+                releases.setdefault(last + n_loaders, []).append(
+                    (p + n_loaders, name))
+    return releases
+
+
+class DatasetLifetimes(object):
+    """ Manages the lifetime of the datasets written by the plugins.
+
+    The backing file (or memory) of each output dataset is created just
+    before the plugin that writes it runs, rather than for every plugin in
+    the list before the first one runs.  Once the last plugin to read an
+    intermediate dataset has finished, the dataset is closed, and its memory
+    released, and if the delete_intermediates option is set its files are
+    deleted and its link removed from the nxs file.  The final results,
+    datasets that are never read and datasets named in keep_datasets are
+    kept.
+
+    Must be created while exp.index['out_data'] is empty, as loading the
+    saver sets up the datasets in it.
+    """
+
+    def __init__(self, exp):
+        self.exp = exp
+        plugin_list = exp.meta_data.plugin_list
+        options = exp.meta_data.get_dictionary()
+        self.delete = options.get('delete_intermediates', False)
+        self.keep = options.get('keep_datasets', [])
+        self.process = options.get('process', 0)
+        self.saver = pu.plugin_loader(exp, plugin_list.plugin_list[-1])
+        self.releases = get_releases(plugin_list._get_datasets_list(),
+                                     plugin_list._get_n_loaders())
+        self.wanted = set(v for values in self.releases.values()
+                          for v in values)
+        # {(plugin index, name): (data object, backing file, files, nxs link)}
+        self.written = {}
+
+    def create(self):
+        """ Create the backing files of the datasets in
+        exp.index['out_data'], written by the plugin about to run.
+        """
+        self.__set_file_info()
+        with trace.span('create files', 'io'):
+            self.saver.setup()
+        self.exp.meta_data.delete('current_and_next')
+
+    def reopen(self, mode='r'):
+        """ Open the backing files of the datasets in exp.index['out_data'],
+        written by a previous run (see checkpoint.py), instead of creating
+        them.  Datasets without a file (deleted, fused or held in memory)
+        are kept, for the set up of later plugins, but not linked.
+        """
+        self.__set_file_info()
+        with trace.span('reopen files', 'io'):
+            missing = self.saver.reopen(mode)
+        for name in missing:
+            logging.info("There is no file holding dataset %s", name)
+        self.exp.meta_data.delete('current_and_next')
+
+    def __set_file_info(self):
+        """ Set the file information of the datasets in
+        exp.index['out_data'], stored when the plugin list was set up.
+        """
+        expInfo = self.exp.meta_data
+        current_and_next = []
+        for key, data in self.exp.index['out_data'].items():
+            info = data.data_info.get_meta_data('file_info')
+            for entry in ['filename', 'group_name', 'link_type']:
+                expInfo.set_meta_data([entry, key], info[entry])
+            current_and_next.append(info['current_and_next'])
+        expInfo.set_meta_data('current_and_next', current_and_next)
+
+    def record(self, index):
+        """ Record the datasets written by the plugin at index in the plugin
+        list that are read by a later plugin (once they have been moved to
+        exp.index['in_data']).
+        """
+        in_data = self.exp.index['in_data']
+        for key, name in self.wanted:
+            if key != index or name not in in_data or name in self.keep:
+                continue
+            data = in_data[name]
+            if data.backing_file is None:
+                continue
+            files = self.__get_files(data)
+            link = data._get_intermediate_link() if files else None
+            self.written[(key, name)] = (data, data.backing_file, files, link)
+
+    def release(self, index):
+        """ Release the datasets last read by the plugin at index in the
+        plugin list.
+        """
+        for key in self.releases.get(index, []):
+            if key not in self.written:
+                continue
+            data, backing_file, files, link = self.written.pop(key)
+            name = key[1]
+            current = self.exp.index['in_data'].get(name)
+            # a dataset replaced by a later plugin is already closed
+            if current is not None and current.backing_file is backing_file:
+                current._close_file()
+                current.data = None
+                del self.exp.index['in_data'][name]
+            data.data = None
+            logging.info("Released dataset %s, written by plugin %i, after "
+                         "plugin %i", name, key[0], index)
+            if self.delete and files:
+                self.__delete(name, files, link)
+
+    def __get_files(self, data):
+        """ The files holding a dataset: its backing file and, for a virtual
+        dataset, the source files of each process.
+        """
+        if not isinstance(data.backing_file, h5py.File):
+            return []
+        filename = data.backing_file.filename
+        files = [filename]
+        dset = data.data
+        if isinstance(dset, h5py.Dataset) and dset.is_virtual:
+            path = os.path.dirname(filename)
+            files += [os.path.join(path, v.file_name) for v in
+                      dset.virtual_sources()]
+        return sorted(set(files))
+
+    def __delete(self, name, files, link):
+        entry = self.exp.nxs_file['entry']
+        if link in entry:
+            del entry[link]
+        self.exp._barrier()
+        if self.process == 0:
+            nbytes = 0
+            for filename in files:
+                try:
+                    nbytes += os.path.getsize(filename)
+                    os.remove(filename)
+                except OSError as e:
+                    logging.warning("Unable to delete %s: %s", filename, e)
+            cu.user_message("Deleted the intermediate dataset %s (%.1f MB)"
+                            % (name, nbytes/1e6))
+        self.exp._barrier()
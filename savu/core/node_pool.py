@@ -0,0 +1,186 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: node_pool
+   :platform: Unix
+   :synopsis: Shares blocks of frames between the processes on a node, \
+       passing the arrays through an MPI shared memory window.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import sys
+import logging
+import numpy as np
+from mpi4py import MPI
+
+# byte alignment of each array in the shared window
+ALIGN = 64
+
+
+class NodePool(object):
+    """ A pool of the processes in a node-local communicator.  The first
+    process (the master) calls :meth:`map` for each block of frames, while
+    all others wait in :meth:`serve` until the master calls :meth:`close`.
+
+    Each process owns one segment of a shared memory window: the master
+    writes the input arrays to its segment and each of the other processes
+    writes its results to its own, so that the arrays are never pickled.
+    """
+
+    def __init__(self, comm):
+        self.comm = comm
+        self.__win = None
+        self.__old_wins = []
+        self.__sizes = [0]*comm.size
+
+    def map(self, function, sub_data):
+        """ Called by the master to apply function to each entry of sub_data
+        (a list of input arrays) on a different process.
+
+        :param list sub_data: At most one entry per process in the pool.
+        :returns: The result of each call, in order.
+        """
+        if len(sub_data) > self.comm.size:
+            raise ValueError("A node pool of %i processes cannot process %i "
+                             "blocks." % (self.comm.size, len(sub_data)))
+        self.comm.bcast(len(sub_data), root=0)
+        arrays = [a for data in sub_data[1:] for a in data]
+        self.__reserve(self.__nbytes(arrays))
+        meta = self.__pack(arrays, self.__segment(0))
+        nArrays = len(sub_data[0])
+        self.comm.bcast([meta[i:i+nArrays] for i in
+                         range(0, len(meta), nArrays)], root=0)
+        self.__win.Fence()
+
+        # the other processes wait for the master in the collective calls
+        # below, so a failure is only raised once they have returned
+        error = None
+        try:
+            results = [function(sub_data[0])]
+        except Exception:
+            error = sys.exc_info()
+        self.__reserve(0)
+        metas = self.comm.gather(None, root=0)
+        self.__win.Fence()
+        if error:
+            self.__free_old_windows()
+            raise error[0], error[1], error[2]
+        failed = [r for r in range(1, self.comm.size) if metas[r][2]]
+        if failed:
+            self.__free_old_windows()
+            raise Exception("Node pool processes %s failed, see the log for "
+                            "details." % failed)
+        for rank in range(1, len(sub_data)):
+            is_list, meta, _ = metas[rank]
+            result = [a.copy() for a in
+                      self.__unpack(meta, self.__segment(rank))]
+            results.append(result if is_list else result[0])
+        self.__free_old_windows()
+        return results
+
+    def serve(self, function):
+        """ Called by all processes except the master, to apply function to
+        their share of each block passed to :meth:`map`.
+        """
+        rank = self.comm.rank
+        while True:
+            nBlocks = self.comm.bcast(None, root=0)
+            if not nBlocks:
+                break
+            self.__reserve(0)
+            metas = self.comm.bcast(None, root=0)
+            self.__win.Fence()
+
+            result, failed = [], False
+            try:
+                if rank < nBlocks:
+                    result = function(
+                        self.__unpack(metas[rank-1], self.__segment(0)))
+            except Exception:
+                logging.exception("Node pool process %i failed", rank)
+                result, failed = [], True
+            is_list = type(result) is list
+            result = result if is_list else [result]
+            self.__reserve(self.__nbytes(result))
+            meta = self.__pack(result, self.__segment(rank))
+            self.comm.gather((is_list, meta, failed), root=0)
+            self.__win.Fence()
+            self.__free_old_windows()
+
+    def close(self):
+        """ Release the processes waiting in :meth:`serve` (when called by
+        the master) and free the shared window.  Must be called by all
+        processes in the pool.
+        """
+        if self.comm.rank == 0:
+            self.comm.bcast(0, root=0)
+        self.__free_old_windows()
+        if self.__win is not None:
+            self.__win.Free()
+            self.__win = None
+
+    def __reserve(self, nbytes):
+        """ Ensure this process's segment of the shared window can hold nbytes.
+        As any process may need a larger window, this is collective.  The old
+        window is kept until the end of the block, as the arrays passed to and
+        returned from function may still refer to it.
+        """
+        sizes = self.comm.allgather(nbytes)
+        if self.__win is not None and \
+                all(s <= c for s, c in zip(sizes, self.__sizes)):
+            return
+        self.__sizes = [max(s, c) for s, c in zip(sizes, self.__sizes)]
+        if self.__win is not None:
+            self.__old_wins.append(self.__win)
+        self.__win = MPI.Win.Allocate_shared(self.__sizes[self.comm.rank], 1,
+                                             comm=self.comm)
+
+    def __free_old_windows(self):
+        for win in self.__old_wins:
+            win.Free()
+        self.__old_wins = []
+
+    def __segment(self, rank):
+        if not self.__sizes[rank]:
+            return np.empty(0, dtype=np.uint8)
+        buf, _ = self.__win.Shared_query(rank)
+        return np.frombuffer(buf, dtype=np.uint8, count=self.__sizes[rank])
+
+    def __nbytes(self, arrays):
+        return sum(self.__aligned(a.nbytes) for a in arrays)
+
+    def __aligned(self, nbytes):
+        return -(-nbytes // ALIGN)*ALIGN
+
+    def __pack(self, arrays, segment):
+        meta = []
+        offset = 0
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            segment[offset:offset+a.nbytes] = a.reshape(-1).view(np.uint8)
+            meta.append((a.shape, a.dtype.str, offset))
+            offset += self.__aligned(a.nbytes)
+        return meta
+
+    def __unpack(self, meta, segment):
+        arrays = []
+        for shape, dtype, offset in meta:
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape))*dtype.itemsize
+            arrays.append(segment[offset:offset+nbytes].view(dtype)
+                          .reshape(shape))
+        return arrays
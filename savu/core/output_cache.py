@@ -0,0 +1,348 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: output_cache
+   :platform: Unix
+   :synopsis: Caches the output files of plugins between runs, keyed by \
+       the plugin, its parameters and the keys of its input datasets.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import sys
+import time
+import errno
+import shutil
+import logging
+import hashlib
+import tempfile
+import inspect
+import cPickle
+import h5py
+from mpi4py import MPI
+
+import savu.plugins.utils as pu
+from savu.core.checkpoint import get_fingerprint
+from savu.data.dark_flat_cache import get_cache_dir
+
+ENTRY = 'entry.pkl'
+# the default limit on the size of the cache, in GB
+DEFAULT_SIZE = 50
+# the modules, besides those of a plugin's class and its base classes, whose
+# code decides how the output of a plugin is read, split and written
+FRAMEWORK_MODULES = ['savu.core.transports.hdf5_transport',
+                     'savu.data.transport_data.hdf5_transport_data',
+                     'savu.data.chunking', 'savu.data.compression',
+                     'savu.core.relayout',
+                     'savu.plugins.savers.hdf5_tomo_saver']
+
+# the version of each plugin, found once per process
+_versions = {}
+
+
+def get_keys(data_file, plugin_list, datasets_list, n_loaders):
+    """ The cache key of each plugin in the plugin list.
+
+    The datasets of the loaders are keyed by the path, size and modification
+    time of the data file and the id, version and parameters (including the
+    preview) of the loaders.  Each plugin is keyed by its id, its version
+    (see _get_version), its parameters and the keys of the datasets it
+    reads, and each dataset it writes by the key of the plugin and the
+    dataset name.
+
+    :param str data_file: The input data file.
+    :param list plugin_list: The plugin list entries (with the saver).
+    :param list datasets_list: The in and out datasets of each plugin, see
+        PluginList._get_datasets_list.
+    :param int n_loaders: The number of loaders in the plugin list.
+    :returns: {plugin index: key}
+    """
+    data_file = os.path.abspath(data_file)
+    stat = os.stat(data_file)
+    raw = repr((data_file, stat.st_size, int(stat.st_mtime),
+                [(p['id'], _get_version(p['id']), sorted(p['data'].items()))
+                 for p in plugin_list[:n_loaders]]))
+    current = {}
+    keys = {}
+    for i, dsets in enumerate(datasets_list):
+        index = i + n_loaders
+        plugin = plugin_list[index]
+        inputs = []
+        for d in dsets['in_datasets']:
+            if d['name'] not in current:
+                current[d['name']] = _digest((raw, d['name']))
+            inputs.append(current[d['name']])
+        key = _digest((plugin['id'], _get_version(plugin['id']),
+                       sorted(plugin['data'].items()), inputs))
+        keys[index] = key
+        for d in dsets['out_datasets']:
+            current[d['name']] = _digest((key, d['name']))
+    return keys
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value)).hexdigest()
+
+
+def _get_version(plugin_id):
+    """ A digest of the source files of the modules of a plugin's class and
+    its base classes (including its driver), and of FRAMEWORK_MODULES.
+    """
+    if plugin_id not in _versions:
+        version = None
+        try:
+            modules = set(c.__module__ for c in
+                          inspect.getmro(pu.load_class(plugin_id)))
+            modules = sorted(m for m in modules.union(FRAMEWORK_MODULES)
+                             if m.split('.')[0] == 'savu')
+            version = _digest([(m, _get_source_digest(m)) for m in modules])
+        except (ImportError, IOError, AttributeError) as e:
+            logging.warning("Unable to find the version of %s: %s",
+                            plugin_id, e)
+        _versions[plugin_id] = version
+    return _versions[plugin_id]
+
+
+def _get_source_digest(module):
+    """ A digest of the source file of a module. """
+    __import__(module)
+    filename = sys.modules[module].__file__
+    source = os.path.splitext(filename)[0] + '.py'
+    with open(source if os.path.exists(source) else filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class OutputCache(object):
+    """ Caches the output files of plugins in the outputs sub-directory of
+    the cache directory (the cache option), so that a plugin whose key (see
+    get_keys) is in the cache is not run again: its output files are
+    hard-linked (or copied, on another file system) from the cache into the
+    output folder, and read from there.  The output files of each plugin run
+    are hard-linked into the cache, in a directory named by its key, with
+    the shape, fingerprint and meta data of each dataset.  Once the cache is
+    bigger than the cache_size option (in GB) the least recently used
+    entries are removed.
+
+    The source files of datasets joined by a virtual dataset are cached with
+    the output file.  Plugins in a fused chain, and plugins writing datasets
+    held in memory, are not cached.
+    """
+
+    def __init__(self, exp):
+        self.exp = exp
+        options = exp.meta_data.get_dictionary()
+        self.process = options.get('process', 0)
+        self.mpi = options.get('mpi', False) is True
+        self.path = get_cache_dir(exp, 'outputs')
+        self.limit = (options.get('cache_size', None) or DEFAULT_SIZE) * \
+            1024**3
+        plugin_list = exp.meta_data.plugin_list
+        self.n_loaders = plugin_list._get_n_loaders()
+        self.datasets_list = plugin_list._get_datasets_list()
+        self.fused = set()
+        if options.get('fusion', False):
+            for first, last in plugin_list._get_fused_chains().items():
+                self.fused.update(range(first, last + 1))
+        self.keys = {}
+        if self.path:
+            self.keys = get_keys(options['data_file'], plugin_list.plugin_list,
+                                 self.datasets_list, self.n_loaders)
+        self.entries = {}
+
+    def __bcast(self, value):
+        return MPI.COMM_WORLD.bcast(value, root=0) if self.mpi else value
+
+    def __get_entry_path(self, index):
+        return os.path.join(self.path, self.keys[index])
+
+    def fetch(self, index):
+        """ Place the output files of the plugin at index in the plugin
+        list, once it has been set up, from the cache.
+
+        :returns: True if the output files were found in the cache, in
+            which case the plugin must not be run.
+        """
+        if not self.path or index in self.fused or \
+                not self.exp.index['out_data']:
+            return False
+        entry = None
+        if self.process == 0:
+            entry = self.__fetch(index)
+        entry = self.__bcast(entry)
+        if entry is None:
+            return False
+        self.entries[index] = entry
+        logging.info("Found the output of plugin %i in the cache %s", index,
+                     self.__get_entry_path(index))
+        return True
+
+    def __fetch(self, index):
+        path = self.__get_entry_path(index)
+        try:
+            with open(os.path.join(path, ENTRY), 'rb') as f:
+                entry = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return None
+        targets = {}
+        for name, data in self.exp.index['out_data'].items():
+            info = data.data_info.get_meta_data('file_info')
+            if name not in entry['files'] or data._is_fused() or \
+                    data._keep_in_memory() or \
+                    os.path.exists(info['filename']):
+                return None
+            basename, group_name, shape, fingerprint = entry['files'][name]
+            source = os.path.join(path, basename)
+            if group_name != info['group_name'] or \
+                    shape != tuple(data.get_shape()) or \
+                    not self.__is_intact(source, group_name, fingerprint):
+                return None
+            targets[source] = info['filename']
+            out_path = os.path.dirname(info['filename'])
+            for basename in entry.get('sources', {}).get(name, []):
+                if os.path.exists(os.path.join(out_path, basename)):
+                    return None
+                targets[os.path.join(path, basename)] = \
+                    os.path.join(out_path, basename)
+        for source, target in targets.items():
+            _link(source, target)
+        # the entry is now the most recently used
+        os.utime(os.path.join(path, ENTRY), None)
+        return entry
+
+    def __is_intact(self, filename, group_name, fingerprint):
+        try:
+            with h5py.File(filename, 'r') as f:
+                return get_fingerprint(f[group_name]['data']) == fingerprint
+        except (IOError, KeyError, ValueError) as e:
+            logging.warning("Unable to read the cache %s: %s", filename, e)
+            return False
+
+    def restore(self, index):
+        """ Set the meta data of the datasets written by the plugin at index
+        in the plugin list to that recorded in the cache.
+        """
+        in_data = self.exp.index['in_data']
+        for name, meta_data in self.entries.pop(index)['meta_data'].items():
+            if name in in_data:
+                in_data[name].meta_data._set_dictionary(meta_data)
+
+    def store(self, index):
+        """ Add the output files of the plugin at index in the plugin list,
+        once its output datasets are in exp.index['in_data'] (and have been
+        flushed), to the cache.
+        """
+        if not self.path or index in self.fused:
+            return
+        in_data = self.exp.index['in_data']
+        names = [d['name'] for d in
+                 self.datasets_list[index - self.n_loaders]['out_datasets']]
+        if not names or any(not self.__can_store(in_data.get(n)) for n in
+                            names):
+            return
+        if self.process == 0:
+            try:
+                self.__store(index, dict((n, in_data[n]) for n in names))
+                self.__evict(index)
+            except (IOError, OSError) as e:
+                logging.warning("Unable to add the output of plugin %i to "
+                                "the cache %s: %s", index, self.path, e)
+        self.exp._barrier()
+
+    def __can_store(self, data):
+        return data is not None and \
+            isinstance(data.backing_file, h5py.File) and \
+            isinstance(data.data, h5py.Dataset)
+
+    def __store(self, index, datasets):
+        path = self.__get_entry_path(index)
+        if os.path.exists(path):
+            return
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        # fill a temporary directory then rename it, so that other runs
+        # never find a partial entry
+        tmp = tempfile.mkdtemp(dir=self.path, suffix='.tmp')
+        try:
+            entry = {'files': {}, 'sources': {}, 'meta_data': {}}
+            for name, data in datasets.items():
+                filename = data.backing_file.filename
+                basename = os.path.basename(filename)
+                _link(filename, os.path.join(tmp, basename))
+                entry['sources'][name] = _get_sources(data.data)
+                for source in entry['sources'][name]:
+                    _link(os.path.join(os.path.dirname(filename), source),
+                          os.path.join(tmp, source))
+                entry['files'][name] = (
+                    basename, data.group_name, tuple(data.data.shape),
+                    get_fingerprint(data.data))
+                entry['meta_data'][name] = cPickle.loads(cPickle.dumps(
+                    data.meta_data.get_dictionary(), protocol=2))
+            with open(os.path.join(tmp, ENTRY), 'wb') as f:
+                cPickle.dump(entry, f, protocol=cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        logging.info("Added the output of plugin %i to the cache %s", index,
+                     path)
+
+    def __evict(self, index):
+        """ Remove the least recently used entries, other than that of the
+        plugin at index, until the cache is within its size limit.
+        """
+        entries = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key, ENTRY)
+            if not os.path.exists(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(self.path, key, f))
+                       for f in os.listdir(os.path.join(self.path, key)))
+            entries.append((os.path.getmtime(entry), size, key))
+        total = sum(e[1] for e in entries)
+        for mtime, size, key in sorted(entries):
+            if total <= self.limit:
+                break
+            if key == self.keys[index]:
+                continue
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
+            logging.info("Removed %s (%.1f MB) from the cache, last used %s",
+                         key, size/1e6, time.ctime(mtime))
+
+
+def _get_sources(dataset):
+    """ The names of the source files of a virtual dataset (in the directory
+    of the file holding it). """
+    if not dataset.is_virtual:
+        return []
+    return sorted(set(os.path.basename(v.file_name) for v in
+                      dataset.virtual_sources()))
+
+
+def _link(source, target):
+    """ Hard-link source to target, or copy it if they are on different
+    file systems. """
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copyfile(source, target)
@@ -0,0 +1,149 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: partition
+   :platform: Unix
+   :synopsis: Splits the frames of a plugin between processes at hdf5 chunk \
+       boundaries of the datasets it reads and writes.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import itertools
+import h5py
+import numpy as np
+
+import savu.core.utils as cu
+
+# the largest change in the frames of a process, as a fraction of an even
+# share, made to align its frames with the chunks
+TOLERANCE = 0.25
+
+
+class Partition(object):
+    """ Splits the blocks of frames of a plugin between processes.  Each
+    boundary of the even split is moved to the nearest boundary (within the
+    tolerance) at which the fewest chunked hdf5 datasets have a chunk
+    accessed by processes on both sides, so that processes do not read,
+    or read, modify and write, the same chunks.
+
+    :param data_list: The input and output datasets of the plugin.
+    :param int nProcs: The number of processes.
+    """
+
+    def __init__(self, data_list, nProcs, tolerance=TOLERANCE):
+        self.nProcs = nProcs
+        self.nBlocks = len(data_list[0]._get_full_slice_list())
+        self.names = []
+        self.spans = []
+        for data in data_list:
+            spans = self.__get_chunk_spans(data)
+            if spans is not None:
+                self.names.append(data.get_name())
+                self.spans.append(spans)
+        self.even = [len(a) for a in np.array_split(np.arange(self.nBlocks),
+                                                    nProcs)]
+        self.even = np.cumsum([0] + self.even)
+        self.bounds = self.__snap(tolerance) if self.spans else self.even
+
+    def get_frames(self, process):
+        """ The indices of the blocks of frames of a process. """
+        return np.arange(self.bounds[process], self.bounds[process+1])
+
+    def __get_chunk_spans(self, data):
+        """ The first and last block to access each chunk of a dataset, or
+        None if the dataset is not chunked.
+        """
+        dset = data.data
+        if not isinstance(dset, h5py.Dataset) or not dset.chunks or \
+                'var' in data.get_shape():
+            return None
+        slice_list = data._get_full_slice_list()
+        if len(slice_list) != self.nBlocks:
+            return None
+
+        chunks = [dset.chunks[d] for d in slice_list.dims]
+        first = slice_list.starts//chunks
+        last = (np.maximum(slice_list.stops, slice_list.starts + 1) - 1) //\
+            chunks
+        spans = {}
+        for block in range(self.nBlocks):
+            for key in itertools.product(*[range(a, b + 1) for a, b in
+                                           zip(first[block], last[block])]):
+                if key in spans:
+                    spans[key][1] = block
+                else:
+                    spans[key] = [block, block]
+        return np.array(spans.values(), dtype=np.int64).reshape(-1, 2)
+
+    def __get_shared(self):
+        """ The number of datasets with a chunk accessed either side of each
+        boundary (before each block).
+        """
+        shared = np.zeros(self.nBlocks + 1, dtype=np.int64)
+        for spans in self.spans:
+            dirty = np.zeros(self.nBlocks + 2, dtype=np.int64)
+            np.add.at(dirty, spans[:, 0] + 1, 1)
+            np.add.at(dirty, spans[:, 1] + 1, -1)
+            shared += np.cumsum(dirty)[:-1] > 0
+        return shared
+
+    def __snap(self, tolerance):
+        shared = self.__get_shared()
+        share = self.nBlocks/float(self.nProcs)
+        limit = int(tolerance*share)
+        bounds = [0]
+        for even in self.even[1:-1]:
+            lo = max(even - limit, bounds[-1] + 1, 1)
+            hi = min(even + limit, self.nBlocks - 1)
+            candidates = np.arange(lo, hi + 1)
+            if not candidates.size:
+                bounds.append(max(even, bounds[-1]))
+                continue
+            best = np.lexsort((np.abs(candidates - even),
+                               shared[candidates]))[0]
+            bounds.append(candidates[best] if shared[candidates[best]] <
+                          shared[even] else even)
+        bounds.append(self.nBlocks)
+        return np.array(bounds, dtype=np.int64)
+
+    def __count_shared(self, spans, bounds):
+        """ The number of chunks of a dataset that each process shares with
+        other processes.
+        """
+        first, last = spans[:, 0], spans[:, 1]
+        count = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            inside = (first < stop) & (last >= start)
+            outside = (first < start) | (last >= stop)
+            count.append(int(np.sum(inside & outside)))
+        return count
+
+    def report(self, name, process):
+        """ Log the number of chunks each process shares with others. """
+        if not self.spans:
+            return
+        for dname, spans in zip(self.names, self.spans):
+            counts = self.__count_shared(spans, self.bounds)
+            even = self.__count_shared(spans, self.even)
+            logging.info("%s - frames %s share %i chunks of %s with other "
+                         "processes", name, self.bounds[process:process+2],
+                         counts[process], dname)
+            if process == 0 and self.nProcs > 1:
+                cu.user_message(
+                    "%s - chunks of %s shared by each process: %s (%i with "
+                    "an even split)" % (name, dname, counts, sum(even)))
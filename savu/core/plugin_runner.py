@@ -22,6 +22,7 @@
 import logging
 
 import savu.core.utils as cu
+import savu.core.trace as trace
 import savu.plugins.utils as pu
 from savu.data.experiment_collection import Experiment
 
@@ -44,9 +45,11 @@ class PluginRunner(object):
         """ Create an experiment and run the plugin list.
         """
         plugin_list = self.exp.meta_data.plugin_list
+        trace.start(self.exp.meta_data.get_dictionary())
 
         self.exp._barrier()
-        self._run_plugin_list_check(plugin_list)
+        with trace.span('check plugin list', 'setup'):
+            self._run_plugin_list_check(plugin_list)
 
         self.exp._barrier()
         expInfo = self.exp.meta_data
@@ -64,6 +67,7 @@ class PluginRunner(object):
         cu.user_message("***********************")
 
         self.exp.nxs_file.close()
+        trace.save(self.exp)
         return self.exp
 
     def _run_plugin_list_check(self, plugin_list):
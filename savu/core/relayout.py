@@ -0,0 +1,240 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: relayout
+   :platform: Unix
+   :synopsis: Re-chunks a dataset between plugins that slice it in different \
+       directions (e.g. PROJECTION to SINOGRAM), as a parallel out-of-core \
+       transpose.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import time
+import logging
+import h5py
+import numpy as np
+from mpi4py import MPI
+
+import savu.core.utils as cu
+from savu.data.chunking import Chunking
+from savu.core.chunk_cache import get_cache_kwargs
+
+# approximate number of bytes sent and received by each process per round
+BLOCK_BYTES = 64*1024**2
+
+
+def needs_relayout(current, next_pattern):
+    """ Determine whether a dataset written with the current pattern should
+    be re-chunked before it is read with the next pattern, i.e. the main
+    slice directions of the two patterns differ.
+
+    :param dict current: {pattern_name: pattern} used to write the dataset.
+    :param dict next_pattern: {pattern_name: pattern} used to read it next.
+    """
+    if not current or not next_pattern:
+        return False
+    current = current.values()[0]['slice_dir']
+    next_pattern = next_pattern.values()[0]['slice_dir']
+    return bool(current and next_pattern and current[0] != next_pattern[0])
+
+
+class Relayout(object):
+    """ Copies a dataset into a new file, chunked for the pattern it will be
+    read with next, which then replaces the file of the dataset (rather than
+    adding a dataset to the same file, as hdf5 never reclaims the space of a
+    deleted dataset).
+
+    Each process reads whole frames in the current slice direction (cheap
+    with the current chunking) and sends each other process the rows it
+    owns in the next slice direction, with an all-to-all exchange, so that
+    every process writes complete, chunk aligned, rows of the new dataset.
+    """
+
+    def __init__(self, exp, comm=MPI.COMM_WORLD):
+        self.exp = exp
+        self.comm = comm
+
+    def run(self, data, current, next_pattern):
+        """ Re-chunk data, which has been written with the current pattern,
+        for reading with the next pattern.
+        """
+        start = time.time()
+        name = data.get_name()
+        src = data.data
+        chunks = Chunking(self.exp, {'current': next_pattern,
+                                     'next': next_pattern})\
+            ._calculate_chunking(src.shape, src.dtype, name=name)
+
+        backing_file = data.backing_file
+        filename = backing_file.filename
+        driver = backing_file.driver
+        group_name = src.parent.name
+        new_file = self.__open(filename + '.relayout', 'w', driver)
+        group = _copy_all_but(backing_file, new_file, src.name)
+        dst = group.create_dataset('data', src.shape, src.dtype,
+                                   chunks=chunks)
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+
+        s_dim = current.values()[0]['slice_dir'][0]
+        n_dim = next_pattern.values()[0]['slice_dir'][0]
+        unit = chunks[n_dim] if type(chunks) is tuple else 1
+        nbytes = transpose(src, dst, s_dim, n_dim, unit, self.comm)
+        cache = get_cache_kwargs(self.exp, src.shape, src.dtype, chunks,
+                                 next_pattern.values())
+
+        new_file.close()
+        backing_file.close()
+        self.comm.barrier()
+        if self.comm.rank == 0:
+            os.rename(filename + '.relayout', filename)
+        self.comm.barrier()
+        data.backing_file = self.__open(filename, 'r+', driver, **cache)
+        data.group = data.backing_file[group_name]
+        data.data = data.group['data']
+
+        nbytes = self.comm.allreduce(nbytes, op=MPI.SUM)
+        duration = self.comm.allreduce(time.time() - start, op=MPI.MAX)
+        message = ("Relayout of %s from %s to %s: %.1f MB moved in %.2fs "
+                   "(chunks %s)" % (name, current.keys()[0],
+                                    next_pattern.keys()[0], nbytes/1e6,
+                                    duration, chunks))
+        logging.info(message)
+        if self.comm.rank == 0:
+            cu.user_message(message)
+
+    def __open(self, filename, mode, driver, **cache):
+        if driver == 'mpio':
+            info = MPI.Info.Create()
+            info.Set("romio_ds_write", "disable")
+            return h5py.File(filename, mode, driver='mpio', comm=self.comm,
+                             info=info, **cache)
+        return h5py.File(filename, mode, **cache)
+
+
+def _copy_all_but(src_file, dst_file, path):
+    """ Copy the contents of src_file to dst_file, except the dataset at
+    path, creating the groups containing it.
+
+    :returns: The group in dst_file that holds path.
+    """
+    names = path.strip('/').split('/')
+    src, dst = src_file, dst_file
+    for depth, name in enumerate(names):
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+        for key in src.keys():
+            if key == name:
+                continue
+            link = src.get(key, getlink=True)
+            if isinstance(link, (h5py.SoftLink, h5py.ExternalLink)):
+                dst[key] = link
+            else:
+                src.copy(key, dst)
+        if depth < len(names) - 1:
+            src, dst = src[name], dst.create_group(name)
+    return dst
+
+
+def transpose(src, dst, s_dim, n_dim, unit, comm=MPI.COMM_WORLD):
+    """ Copy src to dst, reading blocks of whole s_dim frames and writing
+    blocks of whole n_dim frames.
+
+    :param src: The source array (or dataset).
+    :param dst: The destination array (or dataset), of the same shape.
+    :param int s_dim: The dimension src is read in.
+    :param int n_dim: The dimension dst is written in.
+    :param int unit: Each process writes a multiple of unit n_dim frames.
+    :returns: The number of bytes read by this process.
+    """
+    shape = src.shape
+    nProcs, rank = comm.size, comm.rank
+    reads = _split(shape[s_dim], nProcs, 1)
+    writes = _split(shape[n_dim], nProcs, unit)
+
+    itemsize = np.dtype(src.dtype).itemsize
+    frame_bytes = itemsize*np.prod(shape)/float(shape[s_dim]*shape[n_dim])
+    rows = int(BLOCK_BYTES/(frame_bytes*max(len(r) for r in reads)*nProcs))
+    rows = max(unit, rows/unit*unit)
+    nRounds = -(-max(len(w) for w in writes)//rows)
+
+    nbytes = 0
+    for rnd in range(nRounds):
+        blocks = [w[rnd*rows:(rnd+1)*rows] for w in writes]
+        send = [_read(src, s_dim, reads[rank], n_dim, b) for b in blocks]
+        nbytes += sum(s.nbytes for s in send)
+        recv = _exchange(send, [(reads[p], blocks[rank]) for p in
+                                range(nProcs)], s_dim, n_dim, shape,
+                         src.dtype, comm)
+        if len(blocks[rank]):
+            block = np.concatenate(recv, axis=s_dim)
+            dst[_slicer(shape, n_dim, blocks[rank])] = block
+    return nbytes
+
+
+def _split(length, nProcs, unit):
+    """ Split range(length) between processes, in multiples of unit. """
+    units = np.array_split(np.arange(-(-length//unit)), nProcs)
+    return [np.arange(u[0]*unit, min((u[-1]+1)*unit, length)) if len(u)
+            else np.arange(0) for u in units]
+
+
+def _slicer(shape, dim, index, dim2=None, index2=None):
+    sl = [slice(None)]*len(shape)
+    for d, idx in [(dim, index), (dim2, index2)]:
+        if d is not None:
+            sl[d] = slice(idx[0], idx[-1]+1) if len(idx) else slice(0, 0)
+    return tuple(sl)
+
+
+def _read(src, s_dim, s_index, n_dim, n_index):
+    if not len(s_index) or not len(n_index):
+        shape = list(src.shape)
+        shape[s_dim], shape[n_dim] = len(s_index), len(n_index)
+        return np.empty(shape, dtype=src.dtype)
+    return np.ascontiguousarray(
+        src[_slicer(src.shape, s_dim, s_index, n_dim, n_index)])
+
+
+def _exchange(send, recv_index, s_dim, n_dim, shape, dtype, comm):
+    """ Send send[p] to each process p, receiving one block from each. """
+    if comm.size == 1:
+        return send
+
+    recv_shapes = []
+    for s_index, n_index in recv_index:
+        rshape = list(shape)
+        rshape[s_dim], rshape[n_dim] = len(s_index), len(n_index)
+        recv_shapes.append(rshape)
+
+    send_counts = [s.nbytes for s in send]
+    recv_counts = [int(np.prod(s))*np.dtype(dtype).itemsize
+                   for s in recv_shapes]
+    send_buf = np.concatenate([s.reshape(-1).view(np.uint8) for s in send])
+    recv_buf = np.empty(sum(recv_counts), dtype=np.uint8)
+    comm.Alltoallv([send_buf, (send_counts, _offsets(send_counts)), MPI.BYTE],
+                   [recv_buf, (recv_counts, _offsets(recv_counts)),
+                    MPI.BYTE])
+
+    offsets = _offsets(recv_counts)
+    return [recv_buf[o:o+c].view(dtype).reshape(s) for o, c, s in
+            zip(offsets, recv_counts, recv_shapes)]
+
+
+def _offsets(counts):
+    return [0] + list(np.cumsum(counts)[:-1])
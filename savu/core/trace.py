@@ -0,0 +1,207 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: trace
+   :platform: Unix
+   :synopsis: Records the time spent in each step of a run, by each process \
+       and thread, and writes it as a Chrome trace (JSON) file to be viewed \
+       in Perfetto or chrome://tracing.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from mpi4py import MPI
+
+import savu.core.utils as cu
+
+TRACE_FILE = 'trace.json'
+
+# the tracer of this process, or None if the run is not traced
+_tracer = None
+
+
+class _Tracer(object):
+    """ Holds the spans recorded by a process, in memory, until the end of
+    the run. """
+
+    def __init__(self, pid, label):
+        self.pid = pid
+        self.label = label
+        self.start = time.time()
+        # (name, category, start, duration, thread, args)
+        self.events = []
+        # {(thread ident, thread name): tid}, as idents are reused once a
+        # thread has exited
+        self.threads = {}
+        # the records of the workers forked from this process
+        self.workers = []
+
+    def add(self, name, cat, start, duration, args):
+        thread = threading.current_thread()
+        key = (thread.ident, thread.name)
+        if key not in self.threads:
+            self.threads[key] = len(self.threads)
+        self.events.append((name, cat, start, duration, self.threads[key],
+                            args))
+
+    def get_record(self):
+        return {'pid': self.pid, 'label': self.label, 'start': self.start,
+                'threads': [(tid, key[1]) for key, tid in
+                            self.threads.items()],
+                'events': self.events}
+
+
+class _Span(object):
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        tracer = _tracer
+        if tracer is not None:
+            tracer.add(self.name, self.cat, self.start,
+                       time.time() - self.start, self.args)
+        return False
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+def start(options):
+    """ Start tracing this process if the trace option is set, discarding
+    the spans of any earlier run.
+    """
+    global _tracer
+    _tracer = None
+    if options.get('trace', False):
+        process = options.get('process', 0)
+        names = options.get('processes', ['CPU0'])
+        _tracer = _Tracer(process, "rank %i (%s)" % (process, names[process]))
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, cat, **args):
+    """ A context manager recording the time spent inside it, as a span of
+    the thread it is entered on (it does nothing if the run is not traced).
+
+    :param str name: The name of the span, e.g. the step of a plugin.
+    :param str cat: The category of the span (io, compute, mpi...).
+    :param args: Values to show with the span, e.g. the frame index.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def start_worker(worker):
+    """ Trace a process forked from this one (see LocalTransport) on its
+    own, as worker ``worker``.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer = _Tracer(1000*(_tracer.pid + 1) + worker, "%s worker %i" % (
+            _tracer.label.split(' (')[0], worker))
+
+
+def dump_worker(filename):
+    """ Write the spans of a forked worker to filename, to be merged into
+    the trace of its parent by load_worker. """
+    if _tracer is not None:
+        with open(filename, 'w') as f:
+            json.dump(_tracer.get_record(), f, default=_to_json)
+
+
+def load_worker(filename):
+    """ Merge the spans of a forked worker, written by dump_worker, into
+    the trace of this process. """
+    if _tracer is None or not os.path.exists(filename):
+        return
+    try:
+        with open(filename, 'r') as f:
+            record = json.load(f)
+        _tracer.workers.append(record)
+    except ValueError as e:
+        logging.warning("Unable to read the trace of a worker %s: %s",
+                        filename, e)
+    os.remove(filename)
+
+
+def save(exp):
+    """ Gather the spans of every process and write them to the output
+    folder as a Chrome trace, with a track for each process and thread.
+    Called by all processes at the end of the run.
+    """
+    global _tracer
+    if _tracer is None:
+        return
+    records = [_tracer.get_record()] + _tracer.workers
+    _tracer = None
+    options = exp.meta_data.get_dictionary()
+    if options.get('mpi', False) is True:
+        records = MPI.COMM_WORLD.gather(records, root=0)
+        if MPI.COMM_WORLD.rank != 0:
+            return
+        records = [r for rank in records for r in rank]
+    filename = os.path.join(options['out_path'], TRACE_FILE)
+    with open(filename, 'w') as f:
+        json.dump(get_trace_events(records), f, default=_to_json)
+    cu.user_message("Wrote a trace of the run to %s (open it in "
+                    "https://ui.perfetto.dev)" % filename)
+
+
+def get_trace_events(records):
+    """ Convert the records of each process to the Chrome trace format. """
+    origin = min(r['start'] for r in records)
+    events = []
+    for record in records:
+        pid = record['pid']
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                       'args': {'name': record['label']}})
+        events.append({'name': 'process_sort_index', 'ph': 'M', 'pid': pid,
+                       'args': {'sort_index': pid}})
+        for tid, name in record['threads']:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                           'tid': tid, 'args': {'name': name}})
+        for name, cat, start, duration, tid, args in record['events']:
+            events.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid,
+                           'tid': tid, 'ts': (start - origin)*1e6,
+                           'dur': duration*1e6, 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _to_json(value):
+    """ Convert the numpy values in the args of a span. """
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
@@ -45,7 +45,7 @@ class TransportControl(object):
         raise NotImplementedError("transport_run_plugin_list needs to be "
                                   "implemented in %s", self.__class__)
 
-    def _process(self, plugin):
+    def _process(self, plugin, communicator=None):
         """
         A function to process the plugin, including the passing of data frames.
         """
@@ -25,16 +25,37 @@ import logging
 import socket
 import os
 import copy
+import time
+import itertools
+import h5py
 import numpy as np
 
 from mpi4py import MPI
 from savu.core.transport_control import TransportControl
+from savu.core.frame_pipeline import FramePipeline
+from savu.core.frame_scheduler import FrameScheduler
+from savu.core.relayout import Relayout, needs_relayout
+from savu.core.chunk_cache import ChunkCache
+from savu.core.partition import Partition
+from savu.core.lifetime import DatasetLifetimes
+from savu.core.checkpoint import Checkpoint
+from savu.core.output_cache import OutputCache
+from savu.data.compression import CompressedWriter
+from savu.data.data_structures.data_types.decompressed_h5 import \
+    report_decompression
 import savu.plugins.utils as pu
 import savu.core.utils as cu
+import savu.core.trace as trace
 
 
 class Hdf5Transport(TransportControl):
 
+    # the lifetime manager, checkpoint and output cache of the plugin list
+    # being run
+    __lifetimes = None
+    __checkpoint = None
+    __output_cache = None
+
     def _transport_control_setup(self, options):
         """ Fill the options dictionary with MPI related values.
         """
@@ -165,6 +186,8 @@ class Hdf5Transport(TransportControl):
         start = n_loaders
         stop = 0
         n_plugins = len(plugin_list) - 1  # minus 1 for saver
+        # the datasets written in one pass are released in a later one
+        self.__lifetimes = None
 
         while n_plugins != stop:
             start_in_data = copy.deepcopy(self.exp.index['in_data'])
@@ -174,6 +197,10 @@ class Hdf5Transport(TransportControl):
             exp._clear_data_objects()
 
             self.exp.index['in_data'] = copy.deepcopy(start_in_data)
+            if self.__lifetimes is None:
+                self.__lifetimes = DatasetLifetimes(exp)
+            self.__checkpoint = Checkpoint(exp)
+            self.__output_cache = OutputCache(exp)
             self.__real_plugin_run(plugin_list, out_data_objs, start, stop)
             start = stop
 
@@ -186,70 +213,430 @@ class Hdf5Transport(TransportControl):
         """ Execute the plugin.
         """
         exp = self.exp
-        for i in range(start, stop):
+        chains = self.__get_fused_chains(start, stop)
+        i = start
+        while i < stop:
+            if i < self.__checkpoint.start:
+                self.__skip_plugin(plugin_list, out_data_objs, start, i)
+                i += 1
+                continue
+            if i in chains:
+                self.__fused_plugin_run(plugin_list, out_data_objs, start, i,
+                                        chains[i])
+                i = chains[i] + 1
+                continue
+
             link_type = "final_result" if i is len(plugin_list)-2 else \
                 "intermediate"
 
             exp._barrier()
-            for key in out_data_objs[i - start]:
-                exp.index["out_data"][key] = out_data_objs[i - start][key]
+            exp.index["out_data"].update(out_data_objs[i - start])
+            out_data_objs[i - start] = None
 
             exp._barrier()
             plugin = pu.plugin_loader(exp, plugin_list[i])
+            if self.__output_cache.fetch(i):
+                self.__reuse_output(plugin_list, i, plugin,
+                                    self.__output_cache,
+                                    "its output was found in the cache")
+                self.__checkpoint.complete(i)
+                self.__lifetimes.record(i)
+                self.__lifetimes.release(i)
+                i += 1
+                continue
+            if self.__checkpoint.begin(i, plugin):
+                self.__lifetimes.reopen('r+')
+            else:
+                self.__lifetimes.create()
 
             exp._barrier()
             cu.user_message("*Running the %s plugin*" % (plugin_list[i]['id']))
             plugin._run_plugin(exp, self)
 
             exp._barrier()
-            if self.mpi:
-                cu.user_messages_from_all(plugin.name,
-                                          plugin.executive_summary())
-            else:
-                for message in plugin.executive_summary():
-                    cu.user_message("%s - %s" % (plugin.name, message))
+            self.__output_summary(plugin)
 
             out_datasets = plugin.parameters["out_datasets"]
             plugin._clean_up()
             exp._reorganise_datasets(out_datasets, link_type)
+            self.__relayout(i)
+            self.__checkpoint.complete(i)
+            self.__output_cache.store(i)
+            self.__lifetimes.record(i)
+            self.__lifetimes.release(i)
+            i += 1
+
+    def __skip_plugin(self, plugin_list, out_data_objs, start, i):
+        """ Set up a plugin completed by a previous run, reading its output
+        from the files it wrote, instead of running it.
+        """
+        exp = self.exp
+        exp.index["out_data"].update(out_data_objs[i - start])
+        out_data_objs[i - start] = None
+        plugin = pu.plugin_loader(exp, plugin_list[i])
+        self.__reuse_output(plugin_list, i, plugin, self.__checkpoint,
+                            "completed by a previous run")
+        self.__lifetimes.record(i)
+        self.__lifetimes.release(i)
+
+    def __reuse_output(self, plugin_list, i, plugin, source, reason):
+        """ Read the output of a plugin, set up but not run, from the files
+        written by a previous run, restoring its meta data from source (the
+        checkpoint or the output cache).
+        """
+        exp = self.exp
+        link_type = "final_result" if i is len(plugin_list)-2 else \
+            "intermediate"
+        self.__lifetimes.reopen()
+        cu.user_message("*Skipping the %s plugin, %s*" %
+                        (plugin_list[i]['id'], reason))
+
+        out_datasets = plugin.parameters["out_datasets"]
+        plugin._clean_up()
+        exp._reorganise_datasets(out_datasets, link_type)
+        source.restore(i)
+
+    def __get_fused_chains(self, start, stop):
+        """ Get the chains of fusible plugins between start and stop, if
+        plugin fusion has been requested.
+        """
+        if not self.exp.meta_data.get_dictionary().get('fusion', False):
+            return {}
+        chains = self.exp.meta_data.plugin_list._get_fused_chains()
+        return dict((first, last) for first, last in chains.items()
+                    if first >= start and last < stop)
+
+    def __fused_plugin_run(self, plugin_list, out_data_objs, start, first,
+                           last):
+        """ Execute a chain of plugins, passing each frame through the whole
+        chain in memory.  Only the output of the final plugin is written.
+        """
+        exp = self.exp
+        link_type = "final_result" if last is len(plugin_list)-2 else \
+            "intermediate"
+        chain_in_data = exp.index["in_data"].copy()
+
+        plugins = []
+        for i in range(first, last+1):
+            exp._barrier()
+            exp.index["out_data"] = out_data_objs[i - start].copy()
+            out_data_objs[i - start] = None
+            plugin = pu.plugin_loader(exp, plugin_list[i])
+            self.__lifetimes.create()
+            plugins.append(plugin)
+            if i < last:
+                for key, data in exp.index["out_data"].items():
+                    exp.index["in_data"][key] = copy.deepcopy(data)
+
+        exp._barrier()
+        cu.user_message("*Running the fused plugins %s*" %
+                        ', '.join([p['id'] for p in
+                                   plugin_list[first:last+1]]))
+        plugins[0]._run_plugin_chain(plugins, self)
+
+        exp._barrier()
+        for plugin in plugins:
+            self.__output_summary(plugin)
+            plugin._clean_up()
+
+        exp.index["in_data"] = chain_in_data
+        exp._reorganise_datasets(plugins[-1].parameters["out_datasets"],
+                                 link_type)
+        self.__relayout(last)
+        for i in range(first, last+1):
+            self.__checkpoint.complete(i)
+        self.__lifetimes.record(last)
+        for i in range(first, last+1):
+            self.__lifetimes.release(i)
+
+    def __relayout(self, index):
+        """ Re-chunk the datasets created by the plugin at index in the
+        plugin list, if requested and the next plugin to read them slices them
+        in a different direction.
+        """
+        if not self.exp.meta_data.get_dictionary().get('relayout', False):
+            return
+        plugin_list = self.exp.meta_data.plugin_list
+        datasets_list = plugin_list._get_datasets_list()[
+            index - plugin_list._get_n_loaders():]
+        for out_data in datasets_list[0]['out_datasets']:
+            name = out_data['name']
+            next_pattern = [d['pattern'] for dsets in datasets_list[1:]
+                            for d in dsets['in_datasets'] if d['name'] == name]
+            data = self.exp.index['in_data'].get(name)
+            # virtual datasets are read from the files of each process
+            if not next_pattern or data is None or \
+                    not isinstance(data.data, h5py.Dataset) or \
+                    data.data.is_virtual or \
+                    not needs_relayout(out_data['pattern'], next_pattern[0]):
+                continue
+            with trace.span('relayout', 'io', dataset=name):
+                Relayout(self.exp).run(data, out_data['pattern'],
+                                       next_pattern[0])
+
+    def __output_summary(self, plugin):
+        if self.mpi:
+            with trace.span('gather messages', 'mpi'):
+                cu.user_messages_from_all(plugin.name,
+                                          plugin.executive_summary())
+        else:
+            for message in plugin.executive_summary():
+                cu.user_message("%s - %s" % (plugin.name, message))
 
-    def _process(self, plugin):
+    def _process(self, plugin, communicator=MPI.COMM_WORLD):
         """ Organise required data and execute the main plugin processing.
 
         :param plugin plugin: The current plugin instance.
+        :param communicator: The processes running the plugin.
         """
         in_data, out_data = plugin.get_datasets()
 
-        expInfo = plugin.exp.meta_data
-        in_slice_list, in_global_frame_idx = \
-            self.__get_all_slice_lists(in_data, expInfo)
-        out_slice_list, _ = self.__get_all_slice_lists(out_data, expInfo)
+        scheduler = self.__get_scheduler(communicator)
+        partition = None if scheduler else \
+            self.__get_partition(plugin.name, in_data + out_data)
+        in_slice_list, out_slice_list, in_global_frame_idx = \
+            self.__get_slice_lists(in_data, out_data, scheduler, partition)
+        nTuning = plugin._get_n_tuning_instances()
+        out_slice_lists = self.__get_tuning_slice_lists(
+            plugin, out_data, scheduler, partition) if nTuning else \
+            [out_slice_list]
+        cache = ChunkCache()
+        cache.watch(in_data + out_data)
+        writer = CompressedWriter(self.exp, out_data, communicator)
+        # a plugin run once for each combination of tuned parameters writes
+        # each block more than once
+        journal = None if plugin.extra_dims and not nTuning else \
+            self.__get_journal(out_data, writer, scheduler, partition,
+                               communicator)
+        if journal and not scheduler:
+            in_global_frame_idx = self.__get_processed_frames(
+                in_global_frame_idx, journal.skip)
         plugin.set_global_frame_index(in_global_frame_idx)
 
         squeeze_dict = self.__set_functions(in_data, 'squeeze')
         expand_dict = self.__set_functions(out_data, 'expand')
 
         number_of_slices_to_process = len(in_slice_list[0])
-        output_counter=-1
-        for count in range(number_of_slices_to_process):
-            percent_complete = count/(number_of_slices_to_process * 0.01)
-            rounded_amount_through = percent_complete // 5 
-            if (rounded_amount_through) != output_counter:
-                cu.user_message("%s - %3i%% complete" %
-                                (plugin.name, percent_complete))
-                output_counter = rounded_amount_through
-
-            section, slice_list = \
-                self.__get_all_padded_data(in_data, in_slice_list, count,
-                                           squeeze_dict)
-            plugin.set_current_slice_list(slice_list)
-            result = plugin.process_frames(section)
-            self.__set_out_data(out_data, out_slice_list, result, count,
-                                expand_dict)
 
-        cu.user_message("%s - 100%% complete" % (plugin.name))
+        def read(count):
+            cache.record(in_data, in_slice_list, count)
+            return self.__get_all_padded_data(in_data, in_slice_list, count,
+                                              squeeze_dict)
+
+        def process(count, data):
+            self.__report_progress(plugin.name, count,
+                                   number_of_slices_to_process)
+            section, slice_list = data
+            plugin.set_current_slice_list(slice_list)
+            if nTuning:
+                return self.__process_tuning(plugin, section, nTuning)
+            return [plugin._process_frames(section)]
+
+        def write(count, results):
+            for result, slice_list in zip(results, out_slice_lists):
+                cache.record(out_data, slice_list, count)
+                self.__set_out_data(out_data, slice_list, result, count,
+                                    expand_dict, writer)
+            if journal:
+                journal.add(count)
+
+        self.__run_frames(plugin.name, number_of_slices_to_process, read,
+                          process, write, scheduler,
+                          journal.skip if journal else None)
+        if journal:
+            journal.flush()
+        cache.report(plugin.name)
+        report_decompression(plugin.name, in_data)
+        with trace.span('close writer', 'io', plugin=plugin.name):
+            writer.close(plugin.name, communicator)
         plugin._revert_preview(in_data)
 
+    def __get_tuning_slice_lists(self, plugin, out_data, scheduler,
+                                 partition):
+        """ Get the output slice lists of each combination of tuned
+        parameters, applied to each block of frames in a single pass.
+        """
+        slice_lists = []
+        for i in range(plugin._get_n_tuning_instances()):
+            plugin._set_tuning_instance(i, fix_directions=True)
+            slice_lists.append(self.__get_slice_lists(
+                [], out_data, scheduler, partition)[1])
+        return slice_lists
+
+    def __process_tuning(self, plugin, section, nTuning):
+        """ Process a block of frames with each combination of tuned
+        parameters.  As a plugin may modify its input, or re-use its result
+        array, each combination but the last is given a copy of the input
+        and its result is copied.
+        """
+        results = []
+        for i in range(nTuning):
+            plugin._set_tuning_instance(i)
+            if i == nTuning - 1:
+                results.append(plugin._process_frames(section))
+                continue
+            result = plugin._process_frames([np.array(d) for d in section])
+            results.append([np.array(r) for r in result] if
+                           type(result) is list else np.array(result))
+        return results
+
+    def _process_chain(self, plugins):
+        """ Execute the main processing of a chain of fused plugins.  Each
+        frame is read by the first plugin in the chain and its result is
+        handed to the next plugin, exactly as it would have been written to
+        and read back from file, with only the final result written.
+
+        :param list(plugin) plugins: The fused plugin instances, in order.
+        """
+        scheduler = self.__get_scheduler(MPI.COMM_WORLD)
+        name = '+'.join([plugin.name for plugin in plugins])
+        # the frames of every plugin in the chain are split in the same way
+        partition = None if scheduler else self.__get_partition(
+            name, plugins[0].get_in_datasets() +
+            plugins[-1].get_out_datasets())
+        datasets = []
+        for plugin in plugins:
+            in_data, out_data = plugin.get_datasets()
+            in_slice_list, out_slice_list, in_global_frame_idx = \
+                self.__get_slice_lists(in_data, out_data, scheduler,
+                                       partition)
+            plugin.set_global_frame_index(in_global_frame_idx)
+            datasets.append({'in_data': in_data, 'out_data': out_data,
+                             'in_sl': in_slice_list, 'out_sl': out_slice_list,
+                             'squeeze': self.__set_functions(in_data,
+                                                             'squeeze'),
+                             'expand': self.__set_functions(out_data,
+                                                            'expand')})
+
+        first, final = datasets[0], datasets[-1]
+        number_of_slices_to_process = len(first['in_sl'][0])
+        cache = ChunkCache()
+        cache.watch(first['in_data'] + final['out_data'])
+        writer = CompressedWriter(self.exp, final['out_data'])
+
+        def read(count):
+            cache.record(first['in_data'], first['in_sl'], count)
+            return self.__get_all_padded_data(
+                first['in_data'], first['in_sl'], count, first['squeeze'])
+
+        def process(count, data):
+            self.__report_progress(name, count, number_of_slices_to_process)
+            section, slice_list = data
+            for plugin, dsets, next_dsets in \
+                    zip(plugins, datasets, datasets[1:] + [None]):
+                plugin.set_current_slice_list(slice_list)
+                result = plugin._process_frames(section)
+                if next_dsets is None:
+                    return result
+                result = result[0] if type(result) is list else result
+                out_data = dsets['out_data'][0]
+                unpadded = out_data._get_unpadded_slice_data(
+                    dsets['out_sl'][0][count], dsets['expand'][0](result))
+                unpadded = np.asarray(unpadded, dtype=out_data.dtype)
+                section = [next_dsets['squeeze'][0](unpadded)]
+                slice_list = [next_dsets['in_sl'][0][count]]
+
+        def write(count, result):
+            cache.record(final['out_data'], final['out_sl'], count)
+            self.__set_out_data(final['out_data'], final['out_sl'], result,
+                                count, final['expand'], writer)
+
+        self.__run_frames(name, number_of_slices_to_process, read, process,
+                          write, scheduler)
+        cache.report(name)
+        report_decompression(name, first['in_data'])
+        with trace.span('close writer', 'io', plugin=name):
+            writer.close(name)
+        for plugin, dsets in zip(plugins, datasets):
+            plugin._revert_preview(dsets['in_data'])
+
+    def __run_frames(self, name, nFrames, read, process, write,
+                     scheduler=None, skip=None):
+        """ Read, process and write each frame, either in series or through
+        a read-ahead/write-behind pipeline.  If a scheduler is given, the
+        frames are claimed from it on demand, otherwise nFrames is the number
+        of frames allocated to this process.  Frames for which skip(count)
+        is True (written by a previous run) are not processed.
+        """
+        self.__output_counter = -1
+        if trace.is_enabled():
+            read, process, write = self.__traced(name, read, process, write)
+        counts = range(nFrames)
+        if scheduler:
+            counts = scheduler.claim(nFrames, skip)
+            process = self.__timed(process, scheduler)
+        elif skip:
+            counts = itertools.ifilterfalse(skip, counts)
+
+        depth = self.__get_pipeline_depth()
+        if depth:
+            pipeline = FramePipeline(depth)
+            pipeline.run(counts, read, process, write)
+            pipeline.report(name)
+        else:
+            for count in counts:
+                write(count, process(count, read(count)))
+
+        if scheduler:
+            with trace.span('scheduler close', 'mpi'):
+                scheduler.close(name)
+        cu.user_message("%s - 100%% complete" % (name))
+
+    def __traced(self, name, read, process, write):
+        """ Wrap the read, process and write functions to record a span
+        for each block of frames. """
+        def traced(step, cat, function):
+            def traced_function(count, *args):
+                with trace.span(step, cat, plugin=name, block=count):
+                    return function(count, *args)
+            return traced_function
+        return traced('read', 'io', read), \
+            traced('process_frames', 'compute', process), \
+            traced('write', 'io', write)
+
+    def __timed(self, process, scheduler):
+        """ Wrap the process function to record the cost of each frame. """
+        def timed_process(count, data):
+            start = time.time()
+            result = process(count, data)
+            scheduler.record(count, time.time() - start)
+            return result
+        return timed_process
+
+    def __get_journal(self, out_data, writer, scheduler, partition, comm):
+        """ Get the journal of the blocks of frames written by this process,
+        or None if they are not recorded.
+        """
+        if self.__checkpoint is None:
+            return None
+        blocks = None if scheduler else partition.get_frames(
+            self.exp.meta_data.get_meta_data('process'))
+        return self.__checkpoint.get_journal(out_data, writer, blocks, comm)
+
+    def __get_scheduler(self, communicator):
+        """ Get a dynamic frame scheduler if frames should be distributed on
+        demand (a non-zero ``dynamic_chunk``), else None.
+        """
+        chunk = self.exp.meta_data.get_dictionary().get('dynamic_chunk', 0)
+        return FrameScheduler(chunk, comm=communicator) if chunk else None
+
+    def __report_progress(self, name, count, nFrames):
+        """ Output a user message each time a further 5% of the frames have
+        been processed.
+        """
+        percent_complete = count/(nFrames * 0.01)
+        rounded_amount_through = percent_complete // 5
+        if rounded_amount_through != self.__output_counter:
+            cu.user_message("%s - %3i%% complete" %
+                            (name, percent_complete))
+            self.__output_counter = rounded_amount_through
+
+    def __get_pipeline_depth(self):
+        """ Get the depth of the read-ahead/write-behind queues, where a depth
+        of zero processes the frames in series.
+        """
+        return self.exp.meta_data.get_dictionary().get('pipeline_depth', 0)
+
     def __set_functions(self, data_list, name):
         """ Create a dictionary of functions to remove (squeeze) or re-add
         (expand) dimensions, of length 1, from each dataset in a list.
@@ -302,18 +689,60 @@ class Hdf5Transport(TransportControl):
             squeeze_dims = squeeze_dims[1:]
         return lambda x: np.squeeze(x, axis=squeeze_dims)
 
-    def __get_all_slice_lists(self, data_list, expInfo):
+    def __get_partition(self, name, data_list):
+        """ Split the frames of a plugin between the processes at chunk
+        boundaries of its datasets.
+        """
+        expInfo = self.exp.meta_data
+        partition = Partition(data_list,
+                              len(expInfo.get_meta_data('processes')))
+        partition.report(name, expInfo.get_meta_data('process'))
+        return partition
+
+    def __get_slice_lists(self, in_data, out_data, scheduler, partition):
+        """ Get the input and output slice lists and the global frame index.
+        With a scheduler the slice lists cover all frames and the global
+        frame index grows as frames are claimed, else the frames of this
+        process are given by the partition.
+        """
+        if scheduler:
+            in_slice_list = [d._get_full_slice_list() for d in in_data]
+            out_slice_list = [d._get_full_slice_list() for d in out_data]
+            return in_slice_list, out_slice_list, \
+                [scheduler.frames]*len(in_data)
+
+        expInfo = self.exp.meta_data
+        frames = partition.get_frames(expInfo.get_meta_data('process'))
+        in_slice_list, in_global_frame_idx = \
+            self.__get_all_slice_lists(in_data, expInfo, frames)
+        out_slice_list, _ = self.__get_all_slice_lists(out_data, expInfo,
+                                                       frames)
+        return in_slice_list, out_slice_list, in_global_frame_idx
+
+    def __get_processed_frames(self, global_frame_idx, skip):
+        """ Remove the blocks of frames for which skip(count) is True
+        (written by a previous run) from the global frame index of each
+        dataset, so that it lists the blocks in the order they are processed.
+        """
+        processed = []
+        for frames in global_frame_idx:
+            keep = [count for count in range(len(frames)) if not skip(count)]
+            processed.append(np.asarray(frames)[keep])
+        return processed
+
+    def __get_all_slice_lists(self, data_list, expInfo, frames):
         """ Get all slice lists for the current process.
 
         :param list(Data) data_list: Datasets
         :param: meta_data expInfo: The experiment metadata.
+        :param np.ndarray frames: The indices of the frames of this process.
         :returns: slice lists.
         :rtype: list(tuple(slice))
         """
         slice_list = []
         global_frame_index = []
         for data in data_list:
-            sl, f = data._get_slice_list_per_process(expInfo)
+            sl, f = data._get_slice_list_per_process(expInfo, frames)
             slice_list.append(sl)
             global_frame_index.append(f)
         return slice_list, global_frame_index
@@ -338,7 +767,7 @@ class Hdf5Transport(TransportControl):
         return section, slist
 
     def __set_out_data(self, data_list, slice_list, result, count,
-                       expand_dict):
+                       expand_dict, writer):
         """ Transfer plugin results for current frame to backing files.
 
         :param list(Data) data_list: datasets
@@ -346,9 +775,11 @@ class Hdf5Transport(TransportControl):
         :param list(np.ndarray) result: plugin results
         :param int count: frame number
         :param dict expand_dict: expand functions for datasets
+        :param CompressedWriter writer: writes to the datasets
         """
         result = [result] if type(result) is not list else result
         for idx in range(len(data_list)):
-            data_list[idx].data[slice_list[idx][count]] = \
-                data_list[idx]._get_unpadded_slice_data(
-                    slice_list[idx][count], expand_dict[idx](result[idx]))
+            writer.write(idx, slice_list[idx][count],
+                         data_list[idx]._get_unpadded_slice_data(
+                             slice_list[idx][count],
+                             expand_dict[idx](result[idx])))
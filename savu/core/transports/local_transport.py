@@ -0,0 +1,297 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+.. module:: local_transport
+   :platform: Unix
+   :synopsis: Transport specific plugin list runner that spreads the frames \
+       of each plugin across a pool of local worker processes, without MPI.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import mmap
+import json
+import fcntl
+import logging
+import multiprocessing
+import h5py
+import numpy as np
+
+from mpi4py import MPI
+
+from savu.core.transports.hdf5_transport import Hdf5Transport
+from savu.data.virtual_dataset import VirtualDataset, join
+import savu.plugins.utils as pu
+import savu.core.utils as cu
+import savu.core.trace as trace
+
+
+class _WorkerLogFilter(logging.Filter):
+    """ Stop all but the first worker repeating the user messages. """
+
+    def filter(self, record):
+        return record.levelno != cu.USER_LOG_LEVEL
+
+
+class _WorkerSource(VirtualDataset):
+    """ The file a local worker writes its frames of an output dataset to,
+    with the layout and filters of the output dataset.  Once closed, the
+    regions written are recorded in regions_file, for the parent to join.
+    """
+
+    def __init__(self, exp, data, layout, regions_file):
+        chunks, dcpl = layout
+        super(_WorkerSource, self).__init__(
+            exp, data.group, data.get_shape(), data.dtype, chunks=chunks,
+            dcpl=dcpl)
+        self.regions_file = regions_file
+
+    def close(self, comm=MPI.COMM_WORLD):
+        self.source_file.close()
+        with open(self.regions_file, 'w') as f:
+            json.dump([self.filename, self.regions], f)
+        return None
+
+
+class LocalTransport(Hdf5Transport):
+    """ Runs the plugin list in a single process as the Hdf5Transport, but
+    the frames of each CPU plugin are split between worker processes forked
+    for the duration of the plugin.  Workers read their input directly and
+    write their frames of each output dataset to a file of their own (as
+    with the vds option), which are joined by a virtual dataset once all
+    workers have finished.  Output datasets held in memory are written to a
+    buffer in anonymous shared memory and copied back by the parent.
+    """
+
+    def _transport_control_setup(self, options):
+        """ Fill the options dictionary with the number of local workers.
+        """
+        if len(options["process_names"].split(',')) > 1:
+            raise Exception("The local transport runs in a single process, "
+                            "use the hdf5 transport with mpirun instead.")
+        super(LocalTransport, self)._transport_control_setup(options)
+        if not options.get('local_workers'):
+            options['local_workers'] = multiprocessing.cpu_count()
+        cu.user_message("Running plugins on %i local worker processes." %
+                        options['local_workers'])
+
+    def _process(self, plugin, communicator=MPI.COMM_WORLD):
+        if not self.__parallel([plugin]):
+            super(LocalTransport, self)._process(plugin,
+                                                 communicator=communicator)
+            return
+
+        in_data, out_data = plugin.get_datasets()
+        self.__run_workers(
+            lambda: super(LocalTransport, self)._process(plugin),
+            in_data, out_data)
+        plugin._revert_preview(in_data)
+
+    def _process_chain(self, plugins):
+        if not self.__parallel(plugins):
+            super(LocalTransport, self)._process_chain(plugins)
+            return
+
+        in_data = plugins[0].get_in_datasets()
+        self.__run_workers(
+            lambda: super(LocalTransport, self)._process_chain(plugins),
+            in_data, plugins[-1].get_out_datasets())
+        for plugin in plugins:
+            plugin._revert_preview(plugin.get_in_datasets())
+
+    def __parallel(self, plugins):
+        """ Determine whether the plugins can be run by the worker pool.
+        Only CPU plugins are distributed and, as the workers' state is lost
+        when they exit, none may have post processing that depends on it.
+        """
+        from savu.plugins.driver.cpu_plugin import CpuPlugin
+        if self.exp.meta_data.get_meta_data('local_workers') < 2:
+            return False
+        for plugin in plugins:
+            if not isinstance(plugin, CpuPlugin):
+                return False
+            if pu.has_post_process(plugin):
+                logging.info("%s has post processing so is not run by the "
+                             "local workers", plugin.name)
+                return False
+        return True
+
+    def __run_workers(self, process, in_data, out_data):
+        """ Fork the workers, each running ``process`` on its share of the
+        frames, then gather their results into the output datasets.
+        """
+        nWorkers = self.exp.meta_data.get_meta_data('local_workers')
+        self.__flush_files(in_data + out_data)
+        layouts = [self.__get_layout(data) for data in out_data]
+        buffers = [None if layout else self.__create_buffer(data) for
+                   data, layout in zip(out_data, layouts)]
+        path = self.exp.meta_data.get_meta_data('inter_path')
+        traces = [os.path.join(path, 'trace_%i_%i.json' % (
+            os.getpid(), worker)) for worker in range(nWorkers)]
+        regions = [[os.path.join(path, 'regions_%i_%i_%i.json' % (
+            os.getpid(), worker, idx)) for idx in range(len(out_data))]
+            for worker in range(nWorkers)]
+
+        pids = []
+        for worker in range(nWorkers):
+            pid = os.fork()
+            if pid == 0:
+                self.__worker(process, worker, nWorkers, in_data, out_data,
+                              layouts, buffers, regions[worker],
+                              traces[worker])
+            pids.append(pid)
+
+        failed = [pid for pid in pids if os.waitpid(pid, 0)[1] != 0]
+        for filename in traces:
+            trace.load_worker(filename)
+        if failed:
+            raise Exception("%i of %i local workers failed, see the log "
+                            "for details." % (len(failed), nWorkers))
+
+        with trace.span('join worker results', 'io'):
+            for idx, data in enumerate(out_data):
+                if layouts[idx]:
+                    self.__join(data, [r[idx] for r in regions])
+                else:
+                    data.data[...] = buffers[idx]
+
+    def __worker(self, process, worker, nWorkers, in_data, out_data,
+                 layouts, buffers, regions, trace_file):
+        """ Process this worker's share of the frames and exit without
+        returning to the caller (or closing the parent's files).
+        """
+        status = 0
+        trace.start_worker(worker)
+        try:
+            if worker:
+                logging.getLogger().addFilter(_WorkerLogFilter())
+            self.__reopen_files(in_data + out_data)
+            expInfo = self.exp.meta_data
+            expInfo.set_meta_data('processes', ['CPU%i' % i for i in
+                                                range(nWorkers)])
+            expInfo.set_meta_data('process', worker)
+            expInfo.set_meta_data('dynamic_chunk', 0)
+            for data, layout, buf, regions_file in \
+                    zip(out_data, layouts, buffers, regions):
+                if layout:
+                    data.virtual = _WorkerSource(self.exp, data, layout,
+                                                 regions_file)
+                    data.data = data.virtual.source
+                else:
+                    data.data = buf
+            process()
+        except:
+            logging.exception("Local worker %i failed", worker)
+            status = 1
+        finally:
+            try:
+                trace.dump_worker(trace_file)
+            except:
+                logging.exception("Unable to write the trace of local "
+                                  "worker %i", worker)
+            os._exit(status)
+
+    def __reopen_files(self, data_list):
+        """ Give this worker its own descriptor (and hence file offset) for
+        the hdf5 files inherited from the parent, so that the workers' reads
+        do not interfere, as hdf5 may seek and then read.  These are the
+        files of the datasets used by the plugin and any other hdf5 file the
+        parent has open, such as the source files of virtual datasets, which
+        hdf5 opens internally.
+        """
+        files = self.__get_open_files()
+        for data in data_list:
+            backing_file = data.backing_file
+            if isinstance(backing_file, h5py.File):
+                files[backing_file.id.get_vfd_handle()] = \
+                    backing_file.filename
+        for fd, filename in files.items():
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL) & \
+                (os.O_RDONLY | os.O_WRONLY | os.O_RDWR)
+            # hdf5 assumes the descriptor is still at its last offset
+            new_fd = os.open(filename, flags)
+            os.lseek(new_fd, os.lseek(fd, 0, os.SEEK_CUR), os.SEEK_SET)
+            os.dup2(new_fd, fd)
+            os.close(new_fd)
+
+    def __get_open_files(self):
+        """ The descriptors of the hdf5 files open in this process (on
+        systems with /proc), with their names.
+        """
+        files = {}
+        try:
+            fds = os.listdir('/proc/self/fd')
+        except OSError:
+            return files
+        for fd in fds:
+            try:
+                filename = os.readlink(os.path.join('/proc/self/fd', fd))
+            except OSError:
+                continue
+            if os.path.isfile(filename) and h5py.h5f.is_hdf5(filename):
+                files[int(fd)] = filename
+        return files
+
+    def __flush_files(self, data_list):
+        """ Ensure the workers see all data written so far. """
+        for data in data_list:
+            if hasattr(data.backing_file, 'flush'):
+                data.backing_file.flush()
+
+    def __get_layout(self, data):
+        """ The chunks and dataset creation property list of an output
+        dataset saved to a file, from which the workers create their own
+        source datasets, or None for datasets held in memory.  The (empty)
+        source file the parent created for a virtual dataset is removed.
+        """
+        if data.virtual:
+            dataset = data.virtual.source
+            layout = dataset.chunks, dataset.id.get_create_plist()
+            data.virtual.source_file.close()
+            os.remove(data.virtual.filename)
+            data.virtual = None
+            return layout
+        if isinstance(data.data, h5py.Dataset):
+            return data.data.chunks, data.data.id.get_create_plist()
+        return None
+
+    def __create_buffer(self, data):
+        """ Create a buffer the size of an output dataset held in memory, in
+        anonymous shared memory, which the forked workers write to.
+        """
+        dtype = np.dtype(data.dtype)
+        shape = data.get_shape()
+        size = int(np.prod(shape))
+        buf = mmap.mmap(-1, max(size*dtype.itemsize, 1))
+        return np.frombuffer(buf, dtype=dtype, count=size).reshape(shape)
+
+    def __join(self, data, regions_files):
+        """ Replace the output dataset by a virtual dataset joining the files
+        written by the workers.  The files of workers that wrote no frames
+        are removed.
+        """
+        regions = []
+        for filename in regions_files:
+            with open(filename, 'r') as f:
+                source, source_regions = json.load(f)
+            os.remove(filename)
+            if source_regions:
+                regions.append((source, source_regions))
+            else:
+                os.remove(source)
+        if 'data' in data.group:
+            del data.group['data']
+        data.data = join(data.group, data.get_shape(), data.dtype, regions)
@@ -0,0 +1,52 @@
+# Copyright 2015 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+.. module:: memory_transport
+   :platform: Unix
+   :synopsis: Transport specific plugin list runner that holds intermediate \
+       datasets in memory.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+from mpi4py import MPI
+
+from savu.core.transports.hdf5_transport import Hdf5Transport
+import savu.core.utils as cu
+
+
+class MemoryTransport(Hdf5Transport):
+    """ Runs the plugin list as the Hdf5Transport, but intermediate datasets
+    are held in memory (see
+    :class:`savu.data.transport_data.memory_transport_data.MemoryTransportData`
+    ) rather than being written to and read back from disk.
+    """
+
+    def _transport_control_setup(self, options):
+        """ Fill the options dictionary with MPI related values and determine
+        whether all processes can share memory.
+        """
+        super(MemoryTransport, self)._transport_control_setup(options)
+        options['shared_memory'] = True
+        if options['mpi']:
+            node_comm = MPI.COMM_WORLD.Split_type(MPI.COMM_TYPE_SHARED)
+            options['node_comm'] = node_comm
+            if node_comm.size != MPI.COMM_WORLD.size:
+                options['shared_memory'] = False
+                logging.warn("The processes span more than one node, so all "
+                             "datasets will be written to disk.")
+        if options['shared_memory']:
+            cu.user_message("Intermediate datasets will be held in memory.")
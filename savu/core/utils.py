@@ -20,11 +20,17 @@
 
 """
 
+import os
 import logging
 import logging.handlers as handlers
 import itertools
+from multiprocessing.pool import ThreadPool
 from mpi4py import MPI
 
+# thread pools shared by the whole process, keyed by process id (threads are
+# not inherited by forked processes) and number of threads
+_thread_pools = {}
+
 
 def logfunction(func):
     """ Decorator to add logging information around calls for use with . """
@@ -115,6 +121,15 @@ def get_available_gpus():
     return pv, count
 
 
+def get_thread_pool(nThreads):
+    """ A pool of nThreads threads, shared by all callers in this process.
+    """
+    key = (os.getpid(), nThreads)
+    if key not in _thread_pools:
+        _thread_pools[key] = ThreadPool(nThreads)
+    return _thread_pools[key]
+
+
 USER_LOG_LEVEL = 100
 USER_LOG_HANDLER = None
 
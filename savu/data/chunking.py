@@ -15,262 +15,227 @@
 """
 .. module:: chunking
    :platform: Unix
-   :synopsis: A class to optimise hdf5 chunking
+   :synopsis: A class to optimise hdf5 chunking, by predicting the bytes \
+       read and written for each candidate chunk shape.
 .. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
 """
 
-import copy
 import logging
-from fractions import gcd
 import numpy as np
 
+import savu.core.utils as cu
+from savu.core.chunk_cache import get_cache_limit
+
+# default file system block (or stripe) size: accessing a chunk is assumed to
+# cost at least one block
+BLOCK_SIZE = 1024**2
+# the hdf5 limit on the size of a chunk
+MAX_CHUNK_BYTES = 2**32 - 1
+
 
 class Chunking(object):
     """
-    A class to save tomography data to a hdf5 file
+    Chooses the chunk shape of a dataset that is written with the current
+    pattern and read with the next pattern.
+
+    Each pattern accesses the dataset in slabs: all of each core dimension,
+    max_frames of the first slice dimension and one of any other slice
+    dimension.  For each candidate chunk shape, the number of chunks touched
+    by each slab is counted, with chunks that are shared by consecutive slabs
+    (in the first slice dimension) only counted once if the chunks touched by
+    a slab fit in the chunk cache.  Each chunk access costs at least one file
+    system block (the block_size option) and, of the chunk shapes that fit in
+    the chunk cache, the one with the lowest ratio of bytes accessed to bytes
+    required (the amplification) is chosen.
     """
 
     def __init__(self, exp, patternDict):
         self.pattern_dict = patternDict
-        self.current = patternDict['current'][patternDict['current'].keys()[0]]
+        self.current_pattern = patternDict['current'].keys()[0]
+        self.current = patternDict['current'][self.current_pattern]
         if patternDict['next']:
-            self.next = patternDict['next'][patternDict['next'].keys()[0]]
+            self.next_pattern = patternDict['next'].keys()[0]
+            self.next = patternDict['next'][self.next_pattern]
         else:
+            self.next_pattern = self.current_pattern
             self.next = self.current
 
-        try:
-            self.next_pattern = patternDict['next'].keys()[0]
-        except AttributeError:
-            self.next_pattern = patternDict['current'].keys()[0]
-
         self.exp = exp
-        self.core = None
-        self.slice1 = None
-        self.other = None
+        options = exp.meta_data.get_dictionary()
+        self.nProcs = len(options.get('processes', [None]))
+        self.block_size = int(options.get('block_size', None) or BLOCK_SIZE)
+        # the chunk cache each dataset is given (see get_cache_kwargs)
+        self.cache_size = get_cache_limit(exp)
+        self.explain = options.get('explain_chunking', False) and \
+            not options.get('process', 0)
 
-    def _calculate_chunking(self, shape, ttype):
+    def _calculate_chunking(self, shape, ttype, name=None, aligned=False):
         """
         Calculate appropriate chunk sizes for this dataset
+
+        :param tuple shape: The shape of the dataset.
+        :param ttype: The dtype of the dataset.
+        :param str name: The name of the dataset (for the report only).
+        :param bool aligned: Only choose chunks that are whole within each
+            block of frames written with the current pattern (so that
+            compressed chunks are never shared by two processes).
         """
         logging.debug("shape = %s", shape)
-        if len(shape) < 3:
+        if len(shape) < 3 or 0 in shape:
             return True
 
-        chunks = [1]*len(shape)
-        adjust = self.__set_adjust_params(shape)
-        self.__set_chunks(chunks, shape, adjust)
-
-        if 0 in chunks:
-            return True
-        else:
-            chunks = self.__adjust_chunk_size(chunks, ttype, shape, adjust)
-            logging.debug("chunks before %s", chunks)
-            # Subtracting one from each chunking dimension as hdf5/h5py? bug fix
-            chunks = list(chunks)
-            logging.debug("chunks before %s", chunks)
-#            for i in range(len(chunks)):
-#                if (chunks[i] - 1) > 0:
-#                    chunks[i] -= 1
-            logging.debug("chunks after %s", chunks)
-            return tuple(chunks)
-
-    def __set_adjust_params(self, shape):
-        """
-        Set adjustable dimension parameters (the dimension number, increment
-        and max value)
-        """
-        adjust_dim = self.__get_adjustable_dims()
-        array_len = len(adjust_dim)
-        adjust_max = [1]*array_len
-        for i in range(array_len):
-            adjust_max[i] = shape[adjust_dim[i]]
-        inc_dict = {'up': [1]*array_len, 'down': [1]*array_len}
-        bounds = {'min': [1]*array_len, 'max': adjust_max}
-        return {'dim': adjust_dim, 'inc': inc_dict, 'bounds': bounds}
-
-    def __get_adjustable_dims(self):
-        """
-        Get all core dimensions and fastest changing slice dimension (all
-        potentially adjustable)
-        """
-        self.core = \
-            list(self.current['core_dir']) + list(self.next['core_dir'])
-        c_sl = list(self.current['slice_dir'])
-        n_sl = list(self.next['slice_dir'])
-        self.slice1 = [c_sl[0]] + [n_sl[0]]
-        self.other = c_sl[1:] + n_sl[1:]
-        return list(set(self.core + self.slice1))
-
-    def __set_chunks(self, chunks, shape, adjust):
-        """
-        Calculate initial chunk values
-        """
-        chunk_functions = {0: self.__slice_slice, 1: self.__slice_other,
-                           2: self.__core_core, 3: self.__core_other,
-                           4: self.__core_slice}
-        adj_idx = 0
-        for dim in adjust['dim']:
-            count = (dim in self.core)*4 + (dim in self.slice1)*2 + \
-                (dim in self.other) - 2
-            chunks[dim] = chunk_functions[count](dim, adj_idx, adjust, shape)
-            if 'VOLUME' in self.next_pattern:
-                self.__set_volume_bounds(adjust, dim, chunks)
-            adj_idx += 1
+        shape = tuple(int(s) for s in shape)
+        itemsize = np.dtype(ttype).itemsize
+        candidates = self.__get_candidates(shape)
+        if aligned:
+            self.__align(shape, candidates)
+        costs = [self.__get_cost(shape, candidates, p, itemsize)
+                 for p in [self.current, self.next]]
+        score = costs[0] + costs[1]
+        chunk_bytes = self.__chunk_bytes(candidates, itemsize)
+        # chunks that do not fit in the cache are read a piece at a time
+        score[chunk_bytes > min(self.cache_size, MAX_CHUNK_BYTES)] = np.inf
+
+        order = self.__rank(score, chunk_bytes, candidates)
+        best = np.unravel_index(order[0], score.shape)
+        chunks = tuple(int(c[i]) for c, i in zip(candidates, best))
+        logging.debug("chunks %s (amplification %s)", chunks, score[best])
+        if self.explain:
+            self.__explain(name, shape, ttype, candidates, costs, order)
         return chunks
 
-    def __set_volume_bounds(self, adjust, dim, chunks):
-        adjust['bounds']['min'][dim] = \
-            eval(str(62) + adjust['inc']['down'][dim])
-        chunks[dim] = int(min(adjust['bounds']['max'][dim], 62))
-
-    def __core_core(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '/2'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return shape[dim]
-
-    def __core_slice(self, dim, adj_idx, adjust, shape):
-        max_frames = self.__get_max_frames_dict()[dim]
-        adjust['inc']['up'][adj_idx] = '+' + str(max_frames)
-        adjust['inc']['down'][adj_idx] = '-' + str(max_frames)
-        adjust['bounds']['max'][adj_idx] = \
-            self.__max_frames_per_process(shape[dim], max_frames)
-        return min(max_frames, shape[dim])
-
-    def __core_other(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '-1'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return 1
-
-    def __slice_slice(self, dim, adj_idx, adjust, shape):
-        max_frames = self.__get_max_frames_dict()[dim]
-        adjust['inc']['up'][adj_idx] = '+' + str(max_frames)
-        adjust['inc']['down'][adj_idx] = '-' + str(max_frames)
-        adjust['bounds']['max'][adj_idx] = \
-            self.__max_frames_per_process(shape[dim], max_frames)
-        return min(max_frames, shape[dim])
-
-    def __slice_other(self, dim, adj_idx, adjust, shape):
-        adjust['inc']['up'][adj_idx] = '+1'
-        adjust['inc']['down'][adj_idx] = '-1'
-        adjust['bounds']['max'][adj_idx] = shape[dim]
-        return 1
-
-    def __get_max_frames_dict(self):
-        current_sdir = self.current['slice_dir'][0]
-        next_sdir = self.next['slice_dir'][0]
-        if current_sdir == next_sdir:
-            c_max = self.current['max_frames']
-            n_max = self.next['max_frames']
-            least_common_multiple = (c_max*n_max)/gcd(c_max, n_max)
-            ddict = {current_sdir: least_common_multiple}
-        else:
-            ddict = {self.current['slice_dir'][0]: self.current['max_frames'],
-                     self.next['slice_dir'][0]: self.next['max_frames']}
-        return ddict
-
-    def __max_frames_per_process(self, shape, nFrames):
+    def __get_candidates(self, shape):
+        """
+        The candidate chunk sizes in each dimension: the whole dimension
+        divided by powers of two and, in the first slice dimension of each
+        pattern, multiples of max_frames.  Chunks in the first slice dimension
+        of the current pattern are limited to the frames written by a single
+        process.
+        """
+        candidates = []
+        for dim, length in enumerate(shape):
+            values = set([1, length])
+            values.update(-(-length // 2**k) for k in
+                          range(int(np.log2(length)) + 1))
+            bound = length
+            for pattern in [self.current, self.next]:
+                if pattern['slice_dir'] and pattern['slice_dir'][0] == dim:
+                    max_frames = self.__get_max_frames(pattern, length)
+                    values.update(max_frames*2**k for k in range(
+                        int(np.log2(float(length)/max_frames)) + 1))
+            if self.current['slice_dir'] and \
+                    self.current['slice_dir'][0] == dim:
+                bound = self.__max_frames_per_process(
+                    length, self.__get_max_frames(self.current, length))
+            candidates.append(np.array(sorted(
+                v for v in values if 1 <= v <= bound), dtype=np.int64))
+        return candidates
+
+    def __align(self, shape, candidates):
+        """ Restrict the candidates to chunks that divide the blocks of frames
+        written with the current pattern.
+        """
+        slice_dirs = self.current['slice_dir']
+        for dim in slice_dirs[1:]:
+            candidates[dim] = np.array([1], dtype=np.int64)
+        if slice_dirs:
+            dim = slice_dirs[0]
+            max_frames = self.__get_max_frames(self.current, shape[dim])
+            candidates[dim] = np.array([c for c in range(1, max_frames + 1)
+                                        if max_frames % c == 0],
+                                       dtype=np.int64)
+
+    def __get_max_frames(self, pattern, length):
+        return int(min(max(pattern['max_frames'], 1), length))
+
+    def __max_frames_per_process(self, length, nFrames):
         """
         Calculate the max possible frames per process
         """
-        total_plugin_runs = np.ceil(float(shape)/nFrames)
-        frame_list = np.arange(total_plugin_runs)
-        nProcs = len(self.exp.meta_data.get_meta_data('processes'))
-        frame_list_per_proc = np.array_split(frame_list, nProcs)
-        flist_len = []
-        for flist in frame_list_per_proc:
-            flist_len.append(len(flist))
-        runs_per_proc = int(np.median(np.array(flist_len)))
-        return int(min(runs_per_proc*nFrames, shape))
-
-    def __adjust_chunk_size(self, chunks, ttype, shape, adjust):
-        """
-        Adjust the chunk size to as close to 1MB as possible
-        """
-        chunks = np.array(chunks)
-        chunk_size = np.prod(chunks)*np.dtype(ttype).itemsize
-        cache_size = 1000000
-        if (chunk_size > cache_size):
-            self.__decrease_chunks(chunks, ttype, adjust)
-        else:
-            chunks = self.__increase_chunks(chunks, ttype, shape, adjust)
-        return tuple(chunks)
-
-    def __decrease_chunks(self, chunks, ttype, adjust):
-        """
-        Decrease the chunk size to below but as close to 1MB as possible
-        """
-        while ((np.prod(chunks)*np.dtype(ttype).itemsize) > 1000000):
-            idx = self.__get_idx_decrease(chunks, adjust)
-            dim = adjust['dim'].index(idx)
-#            if idx == -1:
-#                break
-            chunks[idx] = int(np.ceil(eval(str(float(chunks[idx])) +
-                              adjust['inc']['down'][dim])))
-
-    def __increase_chunks(self, chunks, ttype, shape, adjust):
-        """
-        Increase the chunk size as close to 1MB as possible
-        """
-        next_chunks = copy.copy(chunks)
-        while ((np.prod(next_chunks)*np.dtype(ttype).itemsize) <= 1000000):
-            chunks = copy.copy(next_chunks)
-            idx = self.__get_idx_increase(next_chunks, adjust)
-            if idx == -1:
-                break
-            dim = adjust['dim'].index(idx)
-            next_chunks[idx] = \
-                eval(str(next_chunks[idx]) + adjust['inc']['up'][dim])
-        return chunks
-
-    def __get_idx_decrease(self, chunks, adjust):
-        """
-        Determine the chunk dimension to decrease
-        """
-        self.check = lambda a, b, c, i: \
-            True if (eval(str(a) + b[i])) < c['min'][i] else False
-        self.__check_adjust_dims(adjust, chunks, 'down')
-        return self.__get_idx_order(adjust, chunks, 'down')
-
-    def __get_idx_increase(self, chunks, adjust):
-        """
-        Determine the chunk dimension to increase
-        """
-        self.check = lambda a, b, c, i: \
-            True if (eval(str(a) + b[i])) > c['max'][i] else False
-        self.__check_adjust_dims(adjust, chunks, 'up')
-        return self.__get_idx_order(adjust, chunks, 'up')
-
-    def __get_idx_order(self, adjust, chunks, direction):
-        process_order = [self.slice1, self.core]
-        sl = slice(None, None, -1)
-        if direction is 'up':
-            sl = slice(None, None, 1)
-            process_order = process_order[::-1]
-
-        avail1 = list(set(adjust['dim']).intersection(process_order[0]))
-        idx_order = np.argsort(chunks[avail1])[sl]
-
-        if not idx_order.size:
-            avail2 = list(set(adjust['dim']).intersection(process_order[1]))
-            idx_order = np.argsort(chunks[avail2])[sl]
-
-        return adjust['dim'][idx_order[0]] if idx_order.size else -1
-
-    def __check_adjust_dims(self, adjust, chunks, up_down):
-        nDel = 0
-        for i in range(len(adjust['dim'])):
-            i -= nDel
-            dim = adjust['dim'][i]
-#            if self.check(chunks[dim], adjust['inc'][up_down],
-#                          adjust['bounds'], i):
-#                adjust['inc']['down'][i] = '-1'
-            if self.check(chunks[dim], adjust['inc'][up_down],
-                          adjust['bounds'], i):
-                del adjust['dim'][i]
-                del adjust['inc']['up'][i]
-                del adjust['inc']['down'][i]
-                del adjust['bounds']['max'][i]
-                del adjust['bounds']['min'][i]
-                nDel += 1
+        total_plugin_runs = int(np.ceil(float(length)/nFrames))
+        runs = np.array_split(np.arange(total_plugin_runs), self.nProcs)
+        runs_per_proc = int(np.median([len(r) for r in runs]))
+        return int(max(min(runs_per_proc*nFrames, length), 1))
+
+    def __get_slab(self, shape, pattern):
+        """ The shape of the block of data accessed by the pattern. """
+        slab = list(shape)
+        for dim in pattern['slice_dir']:
+            slab[dim] = 1
+        if pattern['slice_dir']:
+            dim = pattern['slice_dir'][0]
+            slab[dim] = self.__get_max_frames(pattern, shape[dim])
+        return slab
+
+    def __get_cost(self, shape, candidates, pattern, itemsize):
+        """
+        The predicted amplification of accessing the dataset with the pattern,
+        for each combination of candidate chunk sizes.
+        """
+        slab = self.__get_slab(shape, pattern)
+        touched, nSlabs, distinct = [], [], []
+        for length, size, chunks in zip(shape, slab, candidates):
+            start = np.arange(0, length, size)
+            stop = np.minimum(start + size, length)
+            touched.append(((stop[:, None] - 1)//chunks -
+                            start[:, None]//chunks + 1).mean(axis=0))
+            nSlabs.append(len(start))
+            distinct.append(-(-length//chunks))
+
+        per_slab = self.__outer(touched)
+        chunk_bytes = self.__chunk_bytes(candidates, itemsize)
+        # without reuse, each slab reads every chunk it touches
+        accesses = per_slab*np.prod(nSlabs)
+        if pattern['slice_dir']:
+            # chunks shared by consecutive slabs in the first slice direction
+            # are read once by each process, if they stay in the cache
+            sdir = pattern['slice_dir'][0]
+            per_dim = [t*n for t, n in zip(touched, nSlabs)]
+            per_dim[sdir] = distinct[sdir]
+            reused = self.__outer(per_dim) + \
+                (min(self.nProcs, np.prod(nSlabs)) - 1)*per_slab
+            fits = per_slab*chunk_bytes <= self.cache_size
+            accesses = np.where(fits, np.minimum(reused, accesses), accesses)
+
+        return accesses*np.maximum(chunk_bytes, self.block_size) / \
+            (float(np.prod(shape))*itemsize)
+
+    def __outer(self, arrays):
+        """ The outer product of a list of 1D arrays. """
+        return reduce(np.multiply, np.ix_(*arrays))
+
+    def __chunk_bytes(self, candidates, itemsize):
+        return self.__outer([c.astype(np.float64) for c in candidates]) * \
+            itemsize
+
+    def __rank(self, score, chunk_bytes, candidates):
+        """
+        Order the candidates by score.  Equal scores are ordered by the
+        distance of the chunk size from the block size (in powers of two) and
+        then by the chunk size in the last dimension, the second to last and
+        so on, preferring chunks that are contiguous on disk.
+        """
+        distance = np.round(np.abs(np.log2(chunk_bytes/self.block_size)))
+        keys = [-np.broadcast_to(c, score.shape).ravel() for c in
+                np.ix_(*candidates)]
+        return np.lexsort(keys + [distance.ravel(),
+                                  np.round(score, 6).ravel()])
+
+    def __explain(self, name, shape, ttype, candidates, costs, order):
+        """ Report the chosen chunks and the best alternatives. """
+        lines = ["Chunking %s %s %s, written as %s %s and read as %s %s "
+                 "(%i processes, %.0f KB blocks, %.0f KB chunk cache):" % (
+                     name if name else 'dataset', shape, np.dtype(ttype).name,
+                     self.current_pattern,
+                     tuple(self.__get_slab(shape, self.current)),
+                     self.next_pattern,
+                     tuple(self.__get_slab(shape, self.next)), self.nProcs,
+                     self.block_size/1024., self.cache_size/1024.)]
+        score = costs[0] + costs[1]
+        for rank, idx in enumerate(order[:5]):
+            idx = np.unravel_index(idx, score.shape)
+            chunks = tuple(int(c[i]) for c, i in zip(candidates, idx))
+            lines.append("  %s %-22s write x%.2f + read x%.2f = %.2f" % (
+                '*' if rank == 0 else ' ', chunks, costs[0][idx],
+                costs[1][idx], score[idx]))
+        cu.user_message('\n'.join(lines))
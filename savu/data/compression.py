@@ -0,0 +1,471 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: compression
+   :platform: Unix
+   :synopsis: Compression filters for output datasets, with the chunks of \
+       each block of frames compressed on worker threads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import time
+import zlib
+import struct
+import logging
+import itertools
+import multiprocessing
+
+import h5py
+import numpy as np
+from mpi4py import MPI
+
+import savu.core.utils as cu
+from savu.data.write_buffer import WriteBuffer
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+# decoders for reading compressed chunks directly (optional)
+try:
+    import lzf
+except ImportError:
+    lzf = None
+try:
+    import blosc
+except ImportError:
+    blosc = None
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+try:
+    import bitshuffle
+except ImportError:
+    bitshuffle = None
+
+# default compression level of each filter that has one
+LEVELS = {'gzip': 4, 'blosc': 5}
+FILTERS = ['gzip', 'lzf', 'lz4', 'blosc', 'bitshuffle']
+# the filter pipelines whose chunks are compressed on threads and written
+# directly
+DIRECT_PIPELINES = [[h5py.h5z.FILTER_DEFLATE],
+                    [h5py.h5z.FILTER_SHUFFLE, h5py.h5z.FILTER_DEFLATE]]
+
+
+def parse_compression(spec):
+    """ Parse a compression specification: a comma separated list of
+    ``filter[:level]`` entries, optionally prefixed by ``dataset=`` to apply
+    to a single dataset, e.g. ``gzip:6`` or ``tomo=lz4,gzip``.
+
+    :returns: {dataset name (or None for all): (filter, level)}
+    :rtype: dict
+    """
+    ddict = {}
+    for entry in [e.strip() for e in (spec or '').split(',') if e.strip()]:
+        name, _, value = entry.rpartition('=')
+        ffilter, _, level = value.partition(':')
+        ffilter = ffilter.lower()
+        if ffilter not in FILTERS + ['none']:
+            raise ValueError("Unknown compression filter '%s', choose from "
+                             "%s." % (ffilter, ', '.join(FILTERS)))
+        level = int(level) if level else LEVELS.get(ffilter)
+        ddict[name or None] = (None, None) if ffilter == 'none' else \
+            (ffilter, level)
+    return ddict
+
+
+def get_compression(exp, name, spec=None):
+    """ Get the compression filter and level for a dataset, from the saver's
+    specification overridden by the compression option.
+
+    :param str name: The dataset name.
+    :param str spec: The specification of the saver, if any.
+    :returns: (filter, level), or (None, None) if uncompressed.
+    """
+    ddict = parse_compression(spec)
+    ddict.update(parse_compression(
+        exp.meta_data.get_dictionary().get('compression', None)))
+    return ddict.get(name, ddict.get(None, (None, None)))
+
+
+def get_filter_kwargs(ffilter, level):
+    """ The keyword arguments of h5py's create_dataset for a filter. """
+    if ffilter == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': level,
+                'shuffle': True}
+    if ffilter == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    if hdf5plugin is None:
+        raise ImportError("The %s compression filter requires the hdf5plugin "
+                          "package." % ffilter)
+    if ffilter == 'lz4':
+        return dict(hdf5plugin.LZ4())
+    if ffilter == 'blosc':
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=level,
+                                     shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+    return dict(hdf5plugin.Bitshuffle(lz4=True))
+
+
+def _is_shared(dataset):
+    """ Whether dataset is in a file shared by all processes (mpio). """
+    return isinstance(dataset, h5py.Dataset) and \
+        dataset.file.driver == 'mpio'
+
+
+def _is_filtered(dataset):
+    return dataset.id.get_create_plist().get_nfilters() > 0
+
+
+def _get_pipeline(dataset):
+    """ The code of each filter of a dataset, in the order applied. """
+    dcpl = dataset.id.get_create_plist()
+    return [dcpl.get_filter(i)[0] for i in range(dcpl.get_nfilters())]
+
+
+class CompressedWriter(object):
+    """ Writes the results of a plugin to its output datasets.  For gzip
+    compressed datasets (with no filters but shuffle), blocks of frames that
+    cover whole chunks (as chosen by :class:`savu.data.chunking.Chunking`
+    for compressed datasets) are compressed on a pool of threads and
+    written directly as raw chunks, so that each process compresses its own
+    chunks in parallel.  All other writes, and the lzf, lz4, blosc and
+    bitshuffle filters, go through the hdf5 filter pipeline.  The regions
+    written to datasets saved to a file per process are recorded, and joined
+    into a virtual dataset when the writer is closed.
+
+    Consecutive blocks written to a chunked dataset are collected by a
+    :class:`savu.data.write_buffer.WriteBuffer` until they cover whole
+    chunks and are then written as one hyperslab, with the collective mpio
+    transfer mode if the collective_io option is set.
+
+    Parallel hdf5 can neither write raw chunks nor write filtered datasets
+    independently, so compressed datasets in a file shared by all processes
+    (the mpio driver) are always written collectively, and compressed by
+    hdf5.  The vds option, a file per process, keeps the compression of
+    each process's chunks on its pool of threads.
+    """
+
+    def __init__(self, exp, data_list, comm=MPI.COMM_WORLD):
+        self.data_list = data_list
+        self.datasets = [d.data for d in data_list]
+        self.virtual = [getattr(d, 'virtual', None) for d in data_list]
+        self.names = [d.get_name() for d in data_list]
+        options = exp.meta_data.get_dictionary()
+        names_per_node = len(options.get('process_names', 'CPU0').split(','))
+        self.nThreads = max(multiprocessing.cpu_count()//names_per_node, 1)
+        self.direct = [self.__is_direct(d) for d in self.datasets]
+        self.stats = [[0, 0, 0.0] for d in self.datasets]
+        self.buffers = [WriteBuffer(d.shape, d.chunks, d.dtype) if
+                        isinstance(d, h5py.Dataset) and d.chunks else None
+                        for d in self.datasets]
+        # collective writes must be matched by every process, so are not
+        # used with dynamic scheduling or for directly written chunks, but
+        # are the only way parallel hdf5 writes filtered datasets
+        dynamic = options.get('dynamic_chunk', 0)
+        collective = options.get('collective_io', False) and not dynamic
+        filtered = [_is_shared(d) and _is_filtered(d) for d in self.datasets]
+        if any(filtered) and (dynamic or comm.size != MPI.COMM_WORLD.size):
+            name = self.names[filtered.index(True)]
+            raise Exception(
+                "The compressed dataset %s is in a file shared by all "
+                "processes, which parallel hdf5 can only write with "
+                "collective transfers by every process.  Use the vds option "
+                "to compress it with dynamic scheduling or a plugin run by a "
+                "subset of the processes." % name)
+        for name, filt in zip(self.names, filtered):
+            if filt:
+                logging.info("%s is compressed by the hdf5 filter pipeline "
+                             "in collective writes", name)
+        self.collective = [(collective and not direct and _is_shared(d)) or
+                           filt for d, direct, filt in
+                           zip(self.datasets, self.direct, filtered)]
+        self.nWrites = [0]*len(self.datasets)
+
+    def __is_direct(self, dataset):
+        # an open dataset of a single chunk keeps the chunk's address, so
+        # would read back the chunk as it was before a raw write
+        return isinstance(dataset, h5py.Dataset) and \
+            _get_pipeline(dataset) in DIRECT_PIPELINES and \
+            not _is_shared(dataset) and dataset.chunks != dataset.shape and \
+            hasattr(dataset.id, 'write_direct_chunk')
+
+    def _is_compressed(self, idx):
+        return isinstance(self.datasets[idx], h5py.Dataset) and \
+            bool(self.datasets[idx].compression)
+
+    def write(self, idx, slice_tup, value):
+        """ Write value to slice_tup of dataset idx. """
+        if self.virtual[idx]:
+            self.virtual[idx].add(slice_tup)
+        if self.buffers[idx] is None:
+            self.__write(idx, slice_tup, value)
+            return
+        for sl, block in self.buffers[idx].add(slice_tup, value):
+            self.__write(idx, sl, block)
+
+    def __write(self, idx, slice_tup, value):
+        dataset = self.datasets[idx]
+        if not self._is_compressed(idx):
+            self.__write_slice(idx, slice_tup, value)
+            return
+
+        start = time.time()
+        value = np.asarray(value, dtype=dataset.dtype)
+        chunks = self.__get_chunks(dataset, slice_tup, value) if \
+            self.direct[idx] else None
+        if chunks is None or not self.__write_chunks(idx, chunks):
+            self.__write_slice(idx, slice_tup, value)
+        self.stats[idx][0] += value.nbytes
+        self.stats[idx][2] += time.time() - start
+
+    def __write_slice(self, idx, slice_tup, value):
+        dataset = self.datasets[idx]
+        if self.collective[idx]:
+            with dataset.collective:
+                dataset[slice_tup] = value
+            self.nWrites[idx] += 1
+        else:
+            dataset[slice_tup] = value
+
+    def __match_collective_writes(self, idx, comm):
+        """ Make empty collective writes until this process has made as
+        many as the process with the most.
+        """
+        dataset = self.datasets[idx]
+        nWrites = comm.allreduce(self.nWrites[idx], op=MPI.MAX)
+        fspace = dataset.id.get_space()
+        fspace.select_none()
+        mspace = h5py.h5s.create_simple((1,))
+        mspace.select_none()
+        for i in range(nWrites - self.nWrites[idx]):
+            with dataset.collective:
+                dataset.id.write(mspace, fspace,
+                                 np.zeros(1, dtype=dataset.dtype),
+                                 dxpl=dataset._dxpl)
+        self.nWrites[idx] = nWrites
+
+    def __write_chunks(self, idx, chunks):
+        """ Compress chunks on the thread pool and write them directly.
+        Returns False if this hdf5 build can not write raw chunks. """
+        dataset = self.datasets[idx]
+        level = dataset.compression_opts
+        encode = _shuffle if dataset.shuffle else \
+            lambda chunk: np.ascontiguousarray(chunk).tobytes()
+        compressed = cu.get_thread_pool(self.nThreads).map(
+            lambda c: zlib.compress(encode(c[1]), level), chunks)
+        try:
+            for (offset, _), data in zip(chunks, compressed):
+                dataset.id.write_direct_chunk(offset, data)
+                self.stats[idx][1] += len(data)
+        except Exception as e:
+            logging.warning("Unable to write compressed chunks of %s "
+                            "directly (%s), using the hdf5 filter pipeline",
+                            self.names[idx], e)
+            self.direct[idx] = False
+            return False
+        return True
+
+    def __get_chunks(self, dataset, slice_tup, value):
+        """ Split value into whole chunks, padding chunks at the edges of
+        the dataset, or return None if slice_tup is not chunk aligned.
+        """
+        chunks, shape = dataset.chunks, dataset.shape
+        slice_tup = tuple(slice_tup) + \
+            (slice(None),)*(len(shape) - len(slice_tup))
+        starts, stops = [], []
+        for sl, c, length in zip(slice_tup, chunks, shape):
+            start, stop, step = sl.indices(length) if isinstance(sl, slice) \
+                else (sl, sl + 1, 1)
+            if step != 1 or start % c or (stop % c and stop != length):
+                return None
+            starts.append(start)
+            stops.append(stop)
+        value = value.reshape([b - a for a, b in zip(starts, stops)])
+
+        blocks = []
+        ranges = [range(a, b, c) for a, b, c in zip(starts, stops, chunks)]
+        for offset in itertools.product(*ranges):
+            sl = tuple(slice(o - a, min(o + c, b) - a) for o, a, b, c in
+                       zip(offset, starts, stops, chunks))
+            block = value[sl]
+            if block.shape != chunks:
+                block = np.pad(block, [(0, c - s) for c, s in
+                                       zip(chunks, block.shape)], 'constant')
+            blocks.append((offset, block))
+        return blocks
+
+    def flush(self):
+        """ Write any buffered blocks. """
+        for idx in range(len(self.datasets)):
+            if self.buffers[idx]:
+                for sl, block in self.buffers[idx].flush():
+                    self.__write(idx, sl, block)
+
+    def close(self, name, comm=MPI.COMM_WORLD):
+        """ Write any buffered blocks and report the compression ratio and
+        throughput of each compressed dataset (collective over comm).
+        Datasets written to a file per process are joined.
+        """
+        self.flush()
+        for idx, dataset in enumerate(self.datasets):
+            if self.collective[idx]:
+                self.__match_collective_writes(idx, comm)
+            if self._is_compressed(idx):
+                self.__report(idx, name, comm)
+            if self.virtual[idx]:
+                self.data_list[idx].data = self.virtual[idx].close(comm)
+                self.data_list[idx].virtual = None
+
+    def __report(self, idx, name, comm):
+        dataset = self.datasets[idx]
+        raw, stored, duration = self.stats[idx]
+        if not self.direct[idx]:
+            stored = dataset.id.get_storage_size()
+        # each process has written its own chunks (or file), unless the
+        # dataset is shared and written through the filter pipeline
+        shared = not (self.direct[idx] or self.virtual[idx])
+        raw, duration = comm.allreduce(raw), \
+            comm.allreduce(duration, op=MPI.MAX)
+        stored = stored if shared else comm.allreduce(stored)
+        message = ("%s - %s compressed (%s) from %.1f MB to %.1f MB, "
+                   "ratio %.2f, %.1f MB/s" % (
+                       name, self.names[idx], dataset.compression,
+                       raw/1e6, stored/1e6, raw/float(stored or 1),
+                       raw/1e6/duration if duration else 0))
+        logging.info(message)
+        if comm.rank == 0:
+            cu.user_message(message)
+
+
+def _shuffle(chunk):
+    """ Apply the hdf5 shuffle filter: the first byte of every element,
+    then the second and so on.
+    """
+    itemsize = chunk.dtype.itemsize
+    chunk = np.ascontiguousarray(chunk)
+    if itemsize == 1:
+        return chunk.tobytes()
+    return np.ascontiguousarray(
+        chunk.view(np.uint8).reshape(-1, itemsize).T).tobytes()
+
+
+def _unshuffle(data, itemsize):
+    """ Reverse the hdf5 shuffle filter. """
+    if itemsize == 1:
+        return data
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(
+        itemsize, -1).T).tobytes()
+
+
+def _decode_deflate(data, cd_values, nbytes, dtype):
+    return zlib.decompress(data)
+
+
+def _decode_shuffle(data, cd_values, nbytes, dtype):
+    return _unshuffle(data, dtype.itemsize)
+
+
+def _decode_fletcher32(data, cd_values, nbytes, dtype):
+    # the checksum is not verified
+    return data[:-4]
+
+
+def _decode_lzf(data, cd_values, nbytes, dtype):
+    return lzf.decompress(data, nbytes)
+
+
+def _decode_blosc(data, cd_values, nbytes, dtype):
+    return blosc.decompress(data)
+
+
+def _decode_lz4(data, cd_values, nbytes, dtype):
+    """ The chunk format of the hdf5 LZ4 filter: the (big endian) total
+    size and block size, then the compressed size and data of each block,
+    stored uncompressed if it did not compress.
+    """
+    total, block_size = struct.unpack('>QI', data[:12])
+    blocks, pos = [], 12
+    while total > 0:
+        size = min(block_size, total)
+        csize = struct.unpack('>I', data[pos:pos + 4])[0]
+        block = data[pos + 4:pos + 4 + csize]
+        blocks.append(block if csize == size else
+                      lz4_block.decompress(block, uncompressed_size=size))
+        pos += 4 + csize
+        total -= size
+    return b''.join(blocks)
+
+
+def _decode_bitshuffle(data, cd_values, nbytes, dtype):
+    """ The chunk format of the bitshuffle filter: with LZ4 compression
+    (cd_values[4] == 2), the (big endian) total size and block size of the
+    shuffle, then the compressed blocks.
+    """
+    if len(cd_values) > 4 and cd_values[4] == 2:
+        total, block_size = struct.unpack('>QI', data[:12])
+        values = bitshuffle.decompress_lz4(
+            np.frombuffer(data[12:], dtype=np.uint8),
+            (total//dtype.itemsize,), dtype, block_size//dtype.itemsize)
+    elif len(cd_values) > 4 and cd_values[4]:
+        raise ValueError("Unsupported bitshuffle compression %i" %
+                         cd_values[4])
+    else:
+        block_size = cd_values[3] if len(cd_values) > 3 else 0
+        values = bitshuffle.bitunshuffle(np.frombuffer(data, dtype=dtype),
+                                         block_size)
+    return values.tobytes()
+
+
+# hdf5 filter id: (decoder, the module it requires)
+DECODERS = {h5py.h5z.FILTER_DEFLATE: (_decode_deflate, zlib),
+            h5py.h5z.FILTER_SHUFFLE: (_decode_shuffle, np),
+            h5py.h5z.FILTER_FLETCHER32: (_decode_fletcher32, np),
+            h5py.h5z.FILTER_LZF: (_decode_lzf, lzf),
+            32001: (_decode_blosc, blosc),
+            32004: (_decode_lz4, lz4_block),
+            32008: (_decode_bitshuffle, bitshuffle)}
+
+
+def get_decoders(dataset):
+    """ The decoders of the filter pipeline of a dataset, in the order the
+    filters are applied.
+
+    :returns: [(filter index, decoder, cd_values)], or None if a filter has
+        no decoder (or the module it requires is not installed).
+    :rtype: list
+    """
+    dcpl = dataset.id.get_create_plist()
+    decoders = []
+    for idx in range(dcpl.get_nfilters()):
+        code, flags, cd_values, name = dcpl.get_filter(idx)
+        decoder, module = DECODERS.get(code, (None, None))
+        if module is None:
+            logging.debug("No decoder for the %s filter (%i) of %s", name,
+                          code, dataset.name)
+            return None
+        decoders.append((idx, decoder, tuple(cd_values)))
+    return decoders
+
+
+def decode_chunk(data, filter_mask, decoders, nbytes, dtype):
+    """ Reverse the filters applied to a raw chunk. """
+    for idx, decoder, cd_values in reversed(decoders):
+        if not filter_mask & (1 << idx):
+            data = decoder(data, cd_values, nbytes, dtype)
+    return data
@@ -0,0 +1,125 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: dark_flat_cache
+   :platform: Unix
+   :synopsis: Caches reductions of the dark and flat fields, in memory and \
+       in the cache directory, keyed by the file and frames they are read \
+       from.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import copy
+import time
+import logging
+import hashlib
+import tempfile
+import cPickle
+import numpy as np
+from mpi4py import MPI
+
+# reductions already calculated by this process {digest: value}
+_memory = {}
+
+
+def get_source(dataset):
+    """ The file path, modification time and path of an hdf5 dataset, or
+    None if it is not read from a file.
+    """
+    try:
+        filename = os.path.abspath(dataset.file.filename)
+        return filename, os.path.getmtime(filename), dataset.name
+    except (AttributeError, OSError, ValueError, TypeError):
+        return None
+
+
+def get_digest(array):
+    """ A digest of the contents of an array (or None). """
+    if array is None or array is False:
+        return None
+    array = np.ascontiguousarray(array)
+    return hashlib.sha1(array.view(np.uint8)).hexdigest() + str(array.dtype)
+
+
+def get_cache_dir(exp, name):
+    """ The sub-directory name of the cache directory (the cache option),
+    or None if there is no cache directory. """
+    cache = exp.meta_data.get_dictionary().get('cache', None)
+    return os.path.join(cache, name) if cache else None
+
+
+def get_cached(exp, key, compute, collective=False):
+    """ Get the result of compute(), a reduction of the dark or flat field,
+    from the results already calculated by this process, or from the cache
+    directory, or by calculating (and caching) it.
+
+    :param tuple key: Identifies the data read and the reduction.  It must
+        include the file path and modification time of the data.
+    :param compute: A function calculating the reduction.
+    :param bool collective: Called by all processes, in which case the
+        first process gets the result and broadcasts it to the others.
+    """
+    digest = hashlib.sha1(repr(key)).hexdigest()
+    if digest not in _memory:
+        comm = MPI.COMM_WORLD
+        mpi = collective and exp.meta_data.get_dictionary().get('mpi') and \
+            comm.size > 1
+        value = None
+        if not mpi or comm.rank == 0:
+            value = _load_or_compute(get_cache_dir(exp, 'dark_flat'), digest,
+                                     key, compute)
+        _memory[digest] = comm.bcast(value, root=0) if mpi else value
+    # the caller may modify the result in place
+    return copy.deepcopy(_memory[digest])
+
+
+def _load_or_compute(cache_dir, digest, key, compute):
+    path = os.path.join(cache_dir, digest + '.pkl') if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                value = cPickle.load(f)
+            logging.info("Read %s from the cache %s", key, path)
+            return value
+        except (IOError, EOFError, cPickle.UnpicklingError) as e:
+            logging.warning("Unable to read the cache %s: %s", path, e)
+
+    start = time.time()
+    value = compute()
+    logging.info("Calculated %s in %.2f s", key, time.time() - start)
+    if path:
+        _save(cache_dir, path, value)
+    return value
+
+
+def _save(cache_dir, path, value):
+    """ Write to a temporary file then rename it, so that other processes
+    (or runs) never read a partial file. """
+    try:
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                if not os.path.isdir(cache_dir):
+                    raise
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(value, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        logging.warning("Unable to write the cache %s: %s", path, e)
@@ -27,6 +27,7 @@ import savu.core.utils as cu
 from savu.data.meta_data import MetaData
 from savu.data.data_structures.data_create import DataCreate
 from savu.data.data_structures.preview import Preview
+from savu.core.relayout import needs_relayout
 
 
 class Data(DataCreate):
@@ -49,6 +50,7 @@ class Data(DataCreate):
         self.raw = None
         self.backing_file = None
         self.data = None
+        self.virtual = None
         self.next_shape = None
         self.orig_shape = None
 
@@ -358,6 +360,10 @@ class Data(DataCreate):
             current_pattern = current_data['pattern']
             next_pattern = self.__find_next_pattern(datasets_lists[1:],
                                                     current_name)
+            if self.exp.meta_data.get_dictionary().get('relayout', False) \
+                    and needs_relayout(current_pattern, next_pattern):
+                # the dataset is re-chunked for the next pattern later
+                next_pattern = []
             patterns_list.append({'current': current_pattern,
                                   'next': next_pattern})
         self.exp.meta_data.set_meta_data('current_and_next', patterns_list)
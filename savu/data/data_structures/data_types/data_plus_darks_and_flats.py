@@ -22,10 +22,12 @@
 
 """
 
+import h5py
 import numpy as np
 import copy
 
 from savu.data.data_structures.data_types.base_type import BaseType
+from savu.data.dark_flat_cache import get_cached, get_source, get_digest
 
 
 class DataWithDarksAndFlats(BaseType):
@@ -57,9 +59,39 @@ class DataWithDarksAndFlats(BaseType):
 
     def _getitem_imagekey(self, idx):
         index = list(idx)
-        index[self.proj_dim] = \
-            self.get_index(0, full=True)[idx[self.proj_dim]].tolist()
-        return self.data[tuple(index)]
+        proj = self.get_index(0, full=True)[idx[self.proj_dim]]
+        runs = _get_runs(proj) if np.ndim(proj) else None
+        if not runs or len(runs) > len(proj)//2 or \
+                any(not isinstance(i, (slice, int, long, np.integer))
+                    for i in index):
+            # a single projection, or scattered projections
+            index[self.proj_dim] = proj.tolist()
+            return self.data[tuple(index)]
+        if len(runs) == 1:
+            index[self.proj_dim] = runs[0][2]
+            return self.data[tuple(index)]
+        return self.__read_runs(index, proj, runs)
+
+    def __read_runs(self, index, proj, runs):
+        """ Read each run of projections as one hyperslab into a single
+        output array. """
+        shape = []
+        for dim, (sl, length) in enumerate(zip(index, self.data.shape)):
+            if dim == self.proj_dim:
+                axis = len(shape)
+                shape.append(len(proj))
+            elif isinstance(sl, slice):
+                shape.append(len(xrange(*sl.indices(length))))
+        out = np.empty(shape, dtype=self.data.dtype)
+        out_sl = [slice(None)]*len(shape)
+        for first, last, sl in runs:
+            index[self.proj_dim] = sl
+            out_sl[axis] = slice(first, last)
+            if isinstance(self.data, h5py.Dataset):
+                self.data.read_direct(out, tuple(index), tuple(out_sl))
+            else:
+                out[tuple(out_sl)] = self.data[tuple(index)]
+        return out
 
     def _getitem_noimagekey(self, idx):
         return self.data[idx]
@@ -97,11 +129,44 @@ class DataWithDarksAndFlats(BaseType):
 
     def dark_mean(self):
         """ Get the averaged dark projection data. """
-        return self._calc_mean(self.dark())
+        return self._get_mean('dark')
 
     def flat_mean(self):
         """ Get the averaged flat projection data. """
-        return self._calc_mean(self.flat())
+        return self._get_mean('flat')
+
+    def _get_mean(self, field, collective=False):
+        get = self.dark if field == 'dark' else self.flat
+        return self._cached(field, 'mean', lambda: self._calc_mean(get()),
+                            collective=collective)
+
+    def _cached(self, field, name, compute, collective=False):
+        """ Get the result of compute, a reduction of the dark or flat
+        field, calculated once for the file and frames the field is read from
+        (see :mod:`savu.data.dark_flat_cache`).
+
+        :param str field: 'dark' or 'flat'.
+        :param str name: The name of the reduction.
+        :param bool collective: Called by all processes.
+        """
+        updated = self.dark_updated if field == 'dark' else self.flat_updated
+        dataset, image_key = self._get_field_source(field)
+        source = get_source(dataset)
+        if updated is not False or source is None:
+            return compute()
+        try:
+            preview = self.data_obj.get_preview()._get_preview_slice_list()
+        except Exception:
+            preview = None
+        scale = self.dscale if field == 'dark' else self.fscale
+        key = source + (field, name, get_digest(image_key), repr(preview),
+                        repr(self.dark_flat_slice_list), scale)
+        return get_cached(self.data_obj.exp, key, compute, collective)
+
+    def _get_field_source(self, field):
+        """ The dataset the dark or flat field is read from, and the image
+        key selecting its frames. """
+        return self.data, self.image_key
 
     def _calc_mean(self, data):
         return data if len(data.shape) is 2 else\
@@ -219,9 +284,11 @@ class ImageKey(DataWithDarksAndFlats):
     def _set_dark_and_flat(self):
         self.dark_flat_slice_list = tuple(self.get_dark_flat_slice_list())
         if len(self.get_index(2)):
-            self.data_obj.meta_data.set_meta_data('dark', self.dark_mean())
+            self.data_obj.meta_data.set_meta_data(
+                'dark', self._get_mean('dark', collective=True))
         if len(self.get_index(1)):
-            self.data_obj.meta_data.set_meta_data('flat', self.flat_mean())
+            self.data_obj.meta_data.set_meta_data(
+                'flat', self._get_mean('flat', collective=True))
 
 
 class NoImageKey(DataWithDarksAndFlats):
@@ -254,6 +321,13 @@ class NoImageKey(DataWithDarksAndFlats):
         new_obj.dark_image_key = self.dark_image_key
         self._copy_base(new_obj)
 
+    def _get_field_source(self, field):
+        image_key = self.dark_image_key if field == 'dark' else \
+            self.flat_image_key
+        if image_key is not False:
+            return self.data, image_key
+        return (self.dark_path if field == 'dark' else self.flat_path), None
+
     def _set_flat_path(self, path, imagekey=False):
         self.flat_image_key = imagekey
         self.flat_path = path
@@ -300,5 +374,30 @@ class NoImageKey(DataWithDarksAndFlats):
             # change dimensions here
 
         self.dark_flat_slice_list = tuple(self.dark_flat_slice_list)
-        self.data_obj.meta_data.set_meta_data('dark', self.dark_mean())
-        self.data_obj.meta_data.set_meta_data('flat', self.flat_mean())
+        self.data_obj.meta_data.set_meta_data(
+            'dark', self._get_mean('dark', collective=True))
+        self.data_obj.meta_data.set_meta_data(
+            'flat', self._get_mean('flat', collective=True))
+
+
+def _get_runs(indices):
+    """ Split increasing indices into runs with a constant step.
+
+    :returns: [(first position, last position + 1, slice)] for each run.
+    :rtype: list
+    """
+    runs, first, nIndices = [], 0, len(indices)
+    while first < nIndices:
+        last = first + 1
+        if last < nIndices and indices[last] > indices[first]:
+            step = indices[last] - indices[first]
+            while last < nIndices and \
+                    indices[last] - indices[last - 1] == step:
+                last += 1
+        else:
+            step = 1
+        runs.append((first, last, slice(int(indices[first]),
+                                         int(indices[last - 1]) + 1,
+                                         int(step))))
+        first = last
+    return runs
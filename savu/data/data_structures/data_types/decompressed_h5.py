@@ -0,0 +1,268 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: decompressed_h5
+   :platform: Unix
+   :synopsis: A module for reading compressed hdf5 datasets, decompressing \
+       the raw chunks on a pool of threads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import time
+import logging
+import itertools
+import collections
+import multiprocessing
+
+import h5py
+import numpy as np
+
+import savu.core.utils as cu
+from savu.core.chunk_cache import get_cache_limit
+from savu.data.compression import get_decoders, decode_chunk
+from savu.data.data_structures.data_types.base_type import BaseType
+
+# whether raw chunks can be read with this h5py, found on first use
+_raw_chunks = None
+
+
+def decompressed_h5(exp, dataset):
+    """ Read a compressed hdf5 dataset through a DecompressedH5 object, if
+    every filter of the dataset can be decoded.
+
+    :returns: A DecompressedH5 object, or the dataset if it is not
+        compressed or cannot be decoded.
+    """
+    if not isinstance(dataset, h5py.Dataset) or not dataset.chunks or \
+            not _can_read_raw_chunks():
+        return dataset
+    decoders = get_decoders(dataset)
+    if not decoders:
+        return dataset
+    return DecompressedH5(exp, dataset, decoders)
+
+
+class DecompressedH5(BaseType):
+    """ Reads a compressed hdf5 dataset by fetching the raw chunks touched by
+    each selection with read_direct_chunk and decompressing them on a pool
+    of threads, straight into the array returned.  The most recently used
+    decompressed chunks are kept, up to the dataset's share of the
+    chunk_cache option (see get_cache_limit), as
+    consecutive blocks of frames often share chunks.  Selections other than
+    slices, integers and increasing lists of integers are read through h5py.
+    All other attributes are those of the h5py dataset.
+    """
+
+    def __init__(self, exp, dataset, decoders):
+        self.dataset = dataset
+        self.decoders = decoders
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.chunks = dataset.chunks
+        self.chunk_bytes = int(np.prod(self.chunks))*self.dtype.itemsize
+        options = exp.meta_data.get_dictionary()
+        names_per_node = len(options.get('process_names', 'CPU0').split(','))
+        self.nThreads = max(multiprocessing.cpu_count()//names_per_node, 1)
+        self.process = options.get('process', 0)
+        self.cache_size = get_cache_limit(exp)//self.chunk_bytes
+        self.cache = collections.OrderedDict()
+        # compressed bytes, decompressed bytes, chunks decompressed, chunks
+        # found in the cache, seconds
+        self.stats = [0, 0, 0, 0, 0.0]
+
+    def __getattr__(self, name):
+        if name == 'dataset':
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def get_shape(self):
+        return self.shape
+
+    def __getitem__(self, idx):
+        selection = self.__get_selection(idx)
+        if selection is None:
+            return self.dataset[idx]
+        indices, squeeze = selection
+        start = time.time()
+        out = np.empty([len(i) for i in indices], dtype=self.dtype)
+        if out.size:
+            tasks = [self.__get_task(t) for t in itertools.product(
+                *[self.__split(i, c) for i, c in zip(indices, self.chunks)])]
+            decoded = cu.get_thread_pool(self.nThreads).map(
+                lambda task: self.__place(out, *task), tasks)
+            for task, chunk in zip(tasks, decoded):
+                self.__add_to_cache(task[0], chunk)
+        self.stats[4] += time.time() - start
+        return out.reshape([len(i) for i, s in zip(indices, squeeze)
+                            if not s])
+
+    def __get_selection(self, idx):
+        """ The (increasing) indices selected in each dimension, and whether
+        each dimension is removed, or None if not supported.
+        """
+        idx = idx if isinstance(idx, tuple) else (idx,)
+        if len(idx) > len(self.shape):
+            return None
+        idx = idx + (slice(None),)*(len(self.shape) - len(idx))
+        indices, squeeze = [], []
+        for sl, length in zip(idx, self.shape):
+            if isinstance(sl, slice):
+                indices.append(np.arange(*sl.indices(length)))
+            elif isinstance(sl, (int, long, np.integer)):
+                indices.append(np.array([sl + length if sl < 0 else sl]))
+            elif isinstance(sl, (list, np.ndarray)) and \
+                    np.asarray(sl).dtype.kind in 'iu':
+                indices.append(np.asarray(sl, dtype=np.int64).ravel())
+                if np.any(np.diff(indices[-1]) <= 0):
+                    return None
+            else:
+                return None
+            squeeze.append(not isinstance(sl, (slice, list, np.ndarray)))
+            if len(indices[-1]) and (indices[-1][0] < 0 or
+                                     indices[-1][-1] >= length):
+                raise IndexError("Index out of range in %s" % self.name)
+        return indices, squeeze
+
+    def __split(self, indices, chunk):
+        """ The (chunk offset, output slice, chunk index) of each chunk
+        touched by the indices of a dimension. """
+        numbers = indices//chunk
+        bounds = np.append(np.flatnonzero(np.diff(numbers)) + 1,
+                           len(indices))
+        split, first = [], 0
+        for last in bounds:
+            offset = numbers[first]*chunk
+            split.append((offset, slice(first, last),
+                          _as_slice(indices[first:last] - offset)))
+            first = last
+        return split
+
+    def __get_task(self, split):
+        """ Read the raw chunk (or find the decompressed chunk in the
+        cache) for the part of the selection in one chunk. """
+        offset = tuple(int(s[0]) for s in split)
+        osl = tuple(s[1] for s in split)
+        isl = [s[2] for s in split]
+        chunk = self.cache.pop(offset, None)
+        raw = None
+        if chunk is not None:
+            self.stats[3] += 1
+        else:
+            try:
+                raw = self.dataset.id.read_direct_chunk(offset)
+                self.stats[0] += len(raw[1])
+                self.stats[1] += self.chunk_bytes
+                self.stats[2] += 1
+            except (IOError, RuntimeError) as e:
+                # the chunk, or the whole dataset, has not been written
+                if isinstance(e, IOError) and \
+                        self.dataset.id.get_storage_size():
+                    raise
+                chunk = np.empty(self.chunks, dtype=self.dtype)
+                chunk.fill(self.dataset.fillvalue)
+        return offset, raw, chunk, osl, isl
+
+    def __place(self, out, offset, raw, chunk, osl, isl):
+        """ Decompress a raw chunk and copy the selected part to out. """
+        if chunk is None:
+            filter_mask, data = raw
+            chunk = np.frombuffer(
+                decode_chunk(data, filter_mask, self.decoders,
+                             self.chunk_bytes, self.dtype),
+                dtype=self.dtype).reshape(self.chunks)
+        sub = chunk[tuple(s if isinstance(s, slice) else slice(None)
+                          for s in isl)]
+        for dim, s in enumerate(isl):
+            if not isinstance(s, slice):
+                sub = np.take(sub, s, axis=dim)
+        out[osl] = sub
+        return chunk
+
+    def __add_to_cache(self, offset, chunk):
+        if self.cache_size < 1:
+            return
+        self.cache[offset] = chunk
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def report(self, name):
+        """ Log the decompression throughput since the last report. """
+        compressed, nbytes, nChunks, hits, duration = self.stats
+        if not nChunks + hits:
+            return
+        message = ("%s - read %s: %i chunks decompressed from %.1f MB to "
+                   "%.1f MB (%i from the cache), %.1f MB/s on %i threads" % (
+                       name, self.name, nChunks, compressed/1e6,
+                       nbytes/1e6, hits, nbytes/1e6/duration if duration
+                       else 0, self.nThreads))
+        logging.info(message)
+        if self.process == 0:
+            cu.user_message(message)
+        self.stats[:] = [0, 0, 0, 0, 0.0]
+
+
+def report_decompression(name, data_list):
+    """ Report the decompression throughput of each dataset in data_list
+    read through a DecompressedH5 object (possibly wrapped by another data
+    type).
+    """
+    for data in data_list:
+        dset = data.data
+        while not isinstance(dset, DecompressedH5) and \
+                isinstance(getattr(dset, 'data', None), BaseType):
+            dset = dset.data
+        if isinstance(dset, DecompressedH5):
+            dset.report(name)
+
+
+def _can_read_raw_chunks():
+    """ Whether raw chunks can be read: read_direct_chunk requires hdf5
+    1.10.2, and returns the repr of an array with h5py 2.10 on python 2.
+    The result is found once per process.
+    """
+    global _raw_chunks
+    if _raw_chunks is None:
+        _raw_chunks = _probe_raw_chunks()
+        if not _raw_chunks:
+            logging.warning("Raw hdf5 chunks cannot be read with this h5py "
+                            "(%s), compressed data is read through h5py",
+                            h5py.version.version)
+    return _raw_chunks
+
+
+def _probe_raw_chunks():
+    expected = np.arange(4, dtype=np.uint8)
+    try:
+        with h5py.File('raw_chunk_probe_%i.h5' % os.getpid(), 'w',
+                       driver='core', backing_store=False) as f:
+            f.create_dataset('data', data=expected, chunks=(4,))
+            raw = f['data'].id.read_direct_chunk((0,))[1]
+        return raw == expected.tobytes()
+    except (AttributeError, RuntimeError, IOError) as e:
+        logging.debug("Unable to read raw chunks: %s", e)
+        return False
+
+
+def _as_slice(indices):
+    """ A slice equivalent to the (increasing) indices, if there is one. """
+    if len(indices) == 1:
+        return slice(indices[0], indices[0] + 1)
+    step = indices[1] - indices[0]
+    if np.all(np.diff(indices) == step):
+        return slice(indices[0], indices[-1] + 1, step)
+    return indices
@@ -0,0 +1,85 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memmap_h5
+   :platform: Unix
+   :synopsis: A module for reading contiguous, uncompressed, hdf5 datasets \
+       through a memory map of the file.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import logging
+import h5py
+import numpy as np
+
+from savu.data.data_structures.data_types.base_type import BaseType
+
+
+def memmap_h5(dataset):
+    """ Read an hdf5 dataset through a memory map if it is stored
+    contiguously and unfiltered.
+
+    :returns: A MemmapH5 object, or the dataset if it cannot be mapped.
+    """
+    if not isinstance(dataset, h5py.Dataset):
+        return dataset
+    memmap = _get_memmap(dataset)
+    return dataset if memmap is None else MemmapH5(dataset, memmap)
+
+
+class MemmapH5(BaseType):
+    """ Reads an hdf5 dataset that is stored contiguously, without filters,
+    from a read-only memory map of the file at the dataset's offset,
+    avoiding the overhead of an hdf5 selection for each frame.  The frames
+    are copied out of the map, as some plugins modify their input in place.
+    All other attributes are those of the h5py dataset.
+    """
+
+    def __init__(self, dataset, memmap):
+        self.dataset = dataset
+        self.memmap = memmap
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+
+    def __getitem__(self, idx):
+        return np.array(self.memmap[idx])
+
+    def __getattr__(self, name):
+        if name == 'dataset':
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def get_shape(self):
+        return self.shape
+
+
+def _get_memmap(dataset):
+    """ A memory map of the dataset, or None if it is not stored
+    contiguously and unfiltered in a file opened with the default driver.
+    """
+    dcpl = dataset.id.get_create_plist()
+    if dcpl.get_layout() != h5py.h5d.CONTIGUOUS or dcpl.get_nfilters() or \
+            dcpl.get_external_count() or dataset.file.driver != 'sec2' or \
+            not dataset.size or dataset.id.get_space_status() != \
+            h5py.h5d.SPACE_STATUS_ALLOCATED:
+        return None
+    # from the start of the file, including any userblock
+    offset = dataset.id.get_offset()
+    logging.debug("Memory mapping %s in %s at offset %i", dataset.name,
+                  dataset.file.filename, offset)
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r',
+                     offset=offset, shape=dataset.shape)
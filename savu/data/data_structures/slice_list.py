@@ -0,0 +1,112 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: slice_list
+   :platform: Unix
+   :synopsis: A compact, array backed, list of slice tuples.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import numpy as np
+
+# a start or stop of None in the arrays
+_NONE = np.iinfo(np.int64).min
+
+
+class SliceList(object):
+    """ A read-only list of tuples of slices, one per (group of) frames.
+
+    Every entry shares a template tuple, except in the varying dimensions
+    (usually the slice directions), whose start, stop and step values are
+    held in integer arrays with a row per entry.  The tuples are only created
+    when an entry is accessed and slicing the list returns a view of the
+    arrays, so splitting the frames between processes is cheap.  A step of 0
+    in the arrays represents a step of None, and a start or stop of _NONE a
+    start or stop of None.
+    """
+
+    def __init__(self, template, dims, starts, stops, steps):
+        self.template = tuple(template)
+        self.dims = list(dims)
+        self.starts = self.__as_array(starts)
+        self.stops = self.__as_array(stops)
+        self.steps = self.__as_array(steps)
+
+    def __as_array(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        return values.reshape(values.shape[0], len(self.dims))
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return SliceList(self.template, self.dims, self.starts[idx],
+                             self.stops[idx], self.steps[idx])
+        entry = list(self.template)
+        for i, dim in enumerate(self.dims):
+            entry[dim] = slice(_get_value(self.starts[idx, i]),
+                               _get_value(self.stops[idx, i]),
+                               int(self.steps[idx, i]) or None)
+        return tuple(entry)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __eq__(self, other):
+        return len(self) == len(other) and \
+            all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'SliceList(%i entries)' % len(self)
+
+    def _take(self, index):
+        """ A new list containing the entries at index (an integer array). """
+        return SliceList(self.template, self.dims, self.starts[index],
+                         self.stops[index], self.steps[index])
+
+    def _column(self, dim):
+        """ The position of dim in the arrays, adding it if necessary. """
+        if dim not in self.dims:
+            value = self.template[dim]
+            n = len(self)
+            self.dims.append(dim)
+            self.starts = np.hstack([self.starts, np.full(
+                (n, 1), _NONE if value.start is None else value.start,
+                dtype=np.int64)])
+            self.stops = np.hstack([self.stops, np.full(
+                (n, 1), _NONE if value.stop is None else value.stop,
+                dtype=np.int64)])
+            self.steps = np.hstack([self.steps, np.full(
+                (n, 1), value.step or 0, dtype=np.int64)])
+        return self.dims.index(dim)
+
+    def _remove_dim(self, dim):
+        """ A new list without dimension dim. """
+        keep = [i for i, d in enumerate(self.dims) if d != dim]
+        template = self.template[:dim] + self.template[dim+1:]
+        dims = [d - (d > dim) for d in self.dims if d != dim]
+        return SliceList(template, dims, self.starts[:, keep],
+                         self.stops[:, keep], self.steps[:, keep])
+
+
+def _get_value(value):
+    return None if value == _NONE else int(value)
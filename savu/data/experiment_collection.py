@@ -29,6 +29,7 @@ import h5py
 from mpi4py import MPI
 
 import savu.core.utils as cu
+import savu.core.trace as trace
 from savu.data.plugin_list import PluginList
 from savu.data.data_structures.data import Data
 from savu.data.meta_data import MetaData
@@ -136,8 +137,9 @@ class Experiment(object):
                 self.index["in_data"][out_objs]._close_file()
 
     def _clean_up_files(self):
-        for key in self.index["in_data"].keys():
-            self.index["in_data"][key]._close_file()
+        with trace.span('close files', 'io'):
+            for key in self.index["in_data"].keys():
+                self.index["in_data"][key]._close_file()
 
     def __copy_out_data_to_in_data(self, link_type):
         for key in self.index["out_data"]:
@@ -155,7 +157,8 @@ class Experiment(object):
         comm_dict = {'comm': communicator}
         if self.meta_data.get_meta_data('mpi') is True:
             logging.debug("About to hit a _barrier %s", comm_dict)
-            comm_dict['comm'].barrier()
+            with trace.span('barrier', 'mpi'):
+                comm_dict['comm'].barrier()
             logging.debug("Past the _barrier")
 
     def log(self, log_tag, log_level=logging.DEBUG):
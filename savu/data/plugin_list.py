@@ -303,7 +303,59 @@ class PluginList(object):
         in_data_list = self._populate_datasets_list(in_pData, max_frames)
         out_data_list = self._populate_datasets_list(out_pData, max_frames)
         self.datasets_list.append({'in_datasets': in_data_list,
-                                   'out_datasets': out_data_list})
+                                   'out_datasets': out_data_list,
+                                   'fusion': self.__get_fusion_info(plugin)})
+
+    def __get_fusion_info(self, plugin):
+        """ Determine whether a plugin can pass its output (produce) to, or
+        take its input (consume) from, a neighbouring plugin in memory.
+
+        Only single dataset, CPU plugins without parameter tuning are fused.
+        A producer cannot alter its output after the processing has completed
+        and a consumer cannot rely on padded or fixed sized input frames.
+        """
+        from savu.plugins.driver.cpu_plugin import CpuPlugin
+        in_pData, out_pData = plugin.get_plugin_datasets()
+        fusible = isinstance(plugin, CpuPlugin) and not plugin.extra_dims \
+            and len(in_pData) is 1 and len(out_pData) is 1
+        if not fusible:
+            return {'produce': False, 'consume': False}
+
+        produce = not pu.has_post_process(plugin)
+        consume = not in_pData[0].padding and not in_pData[0].fixed_dims
+        return {'produce': produce, 'consume': consume}
+
+    def _get_fused_chains(self):
+        """ Find the chains of neighbouring plugins that can be fused, i.e.
+        run together frame by frame with the intermediate datasets held in
+        memory.  Each consumer must read the dataset created by the previous
+        plugin, with the same pattern and number of frames, and replace it with
+        its own output.
+
+        :returns: The plugin list index of the last plugin in each chain,
+            keyed by the index of the first.
+        :rtype: dict
+        """
+        chains = {}
+        start = None
+        for i in range(1, len(self.datasets_list)):
+            producer = self.datasets_list[i-1]
+            consumer = self.datasets_list[i]
+            if self.__can_fuse(producer, consumer):
+                start = i-1 if start is None else start
+                chains[start + self.n_loaders] = i + self.n_loaders
+            else:
+                start = None
+        return chains
+
+    def __can_fuse(self, producer, consumer):
+        if not producer['fusion']['produce'] or \
+                not consumer['fusion']['consume']:
+            return False
+        out_data = producer['out_datasets'][0]
+        in_data = consumer['in_datasets'][0]
+        return out_data == in_data and \
+            consumer['out_datasets'][0]['name'] == in_data['name']
 
     def _populate_datasets_list(self, data, max_frames):
         data_list = []
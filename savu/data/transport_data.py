@@ -41,9 +41,9 @@ class TransportData(object):
         raise NotImplementedError("save_data needs to be implemented in %s",
                                   self.__class__)
 
-    def _get_slice_list_per_process(self, expInfo):
+    def _get_slice_list_per_process(self, expInfo, frames=None):
         """
-        A slice list required by the current process.
+        A slice list required by the current process, for the frames given.
         """
         raise NotImplementedError("get_slice_list_per_process needs to be"
                                   " implemented in  %s", self.__class__)
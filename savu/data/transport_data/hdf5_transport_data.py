@@ -28,7 +28,9 @@ import copy
 import numpy as np
 
 import savu.plugins.utils as pu
+import savu.core.trace as trace
 from savu.data.data_structures.data_add_ons import Padding
+from savu.data.data_structures.slice_list import SliceList
 
 NX_CLASS = 'NX_class'
 
@@ -42,14 +44,15 @@ class Hdf5TransportData(object):
 #    def __init__(self):
 #        self.end_pad = True
 
+    # trailing frames of the last padded block read, see __read_halo
+    __halo = None
+
     def _load_data(self, start):
         exp = self.exp
         n_loaders = exp.meta_data.plugin_list._get_n_loaders()
         plugin_list = exp.meta_data.plugin_list.plugin_list
-        final_plugin = plugin_list[-1]
-        saver_plugin = pu.plugin_loader(exp, final_plugin)
 
-        logging.debug("generating all output files")
+        logging.debug("setting up all output datasets")
         out_data_objects = []
         count = start
         datasets_list = exp.meta_data.plugin_list._get_datasets_list()
@@ -63,7 +66,8 @@ class Hdf5TransportData(object):
             plugin = pu.plugin_loader(exp, plugin_dict)
             plugin._revert_preview(plugin.get_in_datasets())
             self.__set_filenames(plugin, plugin_id, count)
-            saver_plugin.setup()
+            # the files are created when the plugin runs, see lifetime.py
+            self.__set_file_info()
 
             out_data_objects.append(exp.index["out_data"].copy())
             plugin._clean_up()
@@ -80,6 +84,7 @@ class Hdf5TransportData(object):
             expInfo.plugin_list.n_plugins - expInfo.plugin_list.n_loaders - 1
         expInfo.set_meta_data("filename", {})
         expInfo.set_meta_data("group_name", {})
+        expInfo.set_meta_data("link_type", {})
         for key in exp.index["out_data"].keys():
             name = key + '_p' + str(count) + '_' + \
                 plugin_id.split('.')[-1] + '.h5'
@@ -94,6 +99,50 @@ class Hdf5TransportData(object):
                           " _barrier %s", filename)
             expInfo.set_meta_data(["filename", key], filename)
             expInfo.set_meta_data(["group_name", key], group_name)
+            if self.__is_fused(count):
+                link_type = 'fused'
+            else:
+                link_type = 'final_result' if count is nPlugins else \
+                    'intermediate'
+            expInfo.set_meta_data(["link_type", key], link_type)
+
+    def __set_file_info(self):
+        """ Store the file name, group name, link type and patterns (used
+        for the chunking) of each output dataset of the plugin, from which
+        its backing file is created.
+        """
+        expInfo = self.exp.meta_data
+        current_and_next = expInfo.get_dictionary().get('current_and_next')
+        for i, key in enumerate(self.exp.index["out_data"].keys()):
+            info = {'current_and_next':
+                    current_and_next[i] if current_and_next else 0}
+            for entry in ['filename', 'group_name', 'link_type']:
+                info[entry] = expInfo.get_meta_data([entry, key])
+            self.exp.index["out_data"][key].data_info.set_meta_data(
+                'file_info', info)
+
+    def __is_fused(self, count):
+        """ Return True if the output of plugin ``count`` is passed directly
+        to the next plugin in a fused chain.
+        """
+        expInfo = self.exp.meta_data
+        if not expInfo.get_dictionary().get('fusion', False):
+            return False
+        chains = expInfo.plugin_list._get_fused_chains()
+        return any(start <= count < stop for start, stop in chains.items())
+
+    def _is_fused(self):
+        """ Return True if the dataset is only passed between fused plugins
+        and so requires no backing file.
+        """
+        return self.exp.meta_data.get_meta_data(
+            ['link_type', self.get_name()]) == 'fused'
+
+    def _keep_in_memory(self):
+        """ Return True if the dataset should be held in memory instead of a
+        backing file.
+        """
+        return False
 
     def __add_data_links(self, linkType):
         nxs_filename = self.exp.meta_data.get_meta_data('nxs_filename')
@@ -102,7 +151,9 @@ class Hdf5TransportData(object):
         nxs_file = self.exp.nxs_file
         entry = nxs_file['entry']
         group_name = self.data_info.get_meta_data('group_name')
-        self.__output_metadata(self.backing_file[group_name])
+        # a file written by a previous run already holds the meta data
+        if 'patterns' not in self.backing_file[group_name]:
+            self.__output_metadata(self.backing_file[group_name])
         filename = self.backing_file.filename.split('/')[-1]
 
         if linkType is 'final_result':
@@ -110,14 +161,21 @@ class Hdf5TransportData(object):
             entry[name] = \
                 h5py.ExternalLink(filename, self.group_name)
         elif linkType is 'intermediate':
-            name = self.group_name + '_' + self.data_info.get_meta_data('name')
-            entry = entry.require_group('intermediate')
+            group, name = self._get_intermediate_link().split('/')
+            entry = entry.require_group(group)
             entry.attrs['NX_class'] = 'NXcollection'
             entry[name] = \
                 h5py.ExternalLink(filename, self.group_name)
         else:
             raise Exception("The link type is not known")
 
+    def _get_intermediate_link(self):
+        """ The path, in the nxs file entry, of the link to an intermediate
+        dataset.
+        """
+        return 'intermediate/' + self.group_name + '_' + \
+            self.data_info.get_meta_data('name')
+
     def __output_metadata(self, entry):
         self.__output_axis_labels(entry)
         self.__output_data_patterns(entry)
@@ -167,7 +225,9 @@ class Hdf5TransportData(object):
             nx_data.create_dataset(mData, data=meta_data[mData])
 
     def _save_data(self, link_type):
-        self.__add_data_links(link_type)
+        # a dataset written by a previous run may no longer have a file
+        if self.backing_file is not None:
+            self.__add_data_links(link_type)
         logging.info('save_data _barrier')
         self.exp._barrier()
 
@@ -175,6 +235,8 @@ class Hdf5TransportData(object):
         """
         Closes the backing file and completes work
         """
+        if self.backing_file is None:
+            return
         self.exp._barrier()
         logging.debug("Completing file %s", self.backing_file.filename)
         self.backing_file.close()
@@ -228,8 +290,7 @@ class Hdf5TransportData(object):
             c = chunk[i]
             r = repeat[i]
             values = self.__get_slice_dir_index(slice_dirs[i])
-            idx = np.ravel(np.kron(values, np.ones((r, c))))
-            idx_list.append(idx.astype(int))
+            idx_list.append(np.tile(np.repeat(values, c), r).astype(int))
         return np.array(idx_list)
 
     def __get_slice_dir_index(self, dim, boolean=False):
@@ -276,16 +337,16 @@ class Hdf5TransportData(object):
         nDims = len(shape)
         core_slice = self.__get_core_slices(core_dirs)
 
-        slice_list = []
-        for i in range(nSlices):
-            getitem = np.array([slice(None)]*nDims)
-            getitem[core_dirs] = core_slice[np.arange(len(core_dirs))]
-            for f in range(len(fix_dirs)):
-                getitem[fix_dirs[f]] = slice(value[f], value[f] + 1, 1)
-            for sdir in range(len(slice_dirs)):
-                getitem[slice_dirs[sdir]] = slice(index[sdir, i],
-                                                  index[sdir, i] + 1, 1)
-            slice_list.append(tuple(getitem))
+        template = np.array([slice(None)]*nDims)
+        template[core_dirs] = core_slice[np.arange(len(core_dirs))]
+        for f in range(len(fix_dirs)):
+            template[fix_dirs[f]] = slice(value[f], value[f] + 1, 1)
+
+        dims = list(slice_dirs) if index.size else []
+        starts = np.transpose(index) if index.size else \
+            np.zeros((nSlices, 0), dtype=np.int64)
+        slice_list = SliceList(template, dims, starts, starts + 1,
+                               np.ones(starts.shape, dtype=np.int64))
 
         slice_list = self.__remove_var_length_dimension(slice_list)
         return slice_list
@@ -313,41 +374,30 @@ class Hdf5TransportData(object):
     def __remove_var_length_dimension(self, slice_list):
         shape = self.get_shape()
         if 'var' in shape:
-            var_dim = list(shape).index('var')
-            for i in range(len(slice_list)):
-                sl = list(slice_list[i])
-                del sl[var_dim]
-                slice_list[i] = sl
+            slice_list = slice_list._remove_dim(list(shape).index('var'))
         return slice_list
 
-    def __banked_list(self, slice_list):
+    def __grouped_slice_list(self, slice_list, max_frames):
+        """ Group the entries of the slice list into blocks of (at most)
+        max_frames consecutive frames in the first slice direction.
+        """
         shape = self.get_shape()
         slice_dirs = self._get_plugin_data().get_slice_directions()
         chunk, length, repeat = self.__chunk_length_repeat(slice_dirs, shape)
-        banked = self.__split_list(slice_list, length[0])
-        return banked, length, slice_dirs
-
-    def __grouped_slice_list(self, slice_list, max_frames):
-        banked, length, slice_dir = self.__banked_list(slice_list)
         starts, stops, steps, chunks = \
             self.get_preview().get_starts_stops_steps()
-        group_dim = self._get_plugin_data().get_slice_directions()[0]
-
-        grouped = []
-        for group in banked:
-            sub_groups = self.__split_list(group, max_frames)
-
-            for sub in sub_groups:
-                start = sub[0][group_dim].start
-                stop = sub[-1][group_dim].stop
-                step = steps[group_dim]
-                working_slice = list(sub[0])
-                working_slice[group_dim] = slice(start, stop, step)
-                grouped.append(tuple(working_slice))
-        return grouped
+        group_dim = slice_dirs[0]
 
-    def __split_list(self, the_list, size):
-            return [the_list[x:x+size] for x in xrange(0, len(the_list), size)]
+        bank = length[0]
+        first = np.arange(len(slice_list))
+        first = first[first % bank % max_frames == 0]
+        last = np.minimum(first + max_frames, (first/bank + 1)*bank) - 1
+
+        grouped = slice_list._take(first)
+        col = grouped._column(group_dim)
+        grouped.stops[:, col] = slice_list.stops[last, col]
+        grouped.steps[:, col] = steps[group_dim] or 0
+        return grouped
 
     def _get_grouped_slice_list(self):
         max_frames = self._get_plugin_data()._get_frame_chunk()
@@ -369,14 +419,16 @@ class Hdf5TransportData(object):
         length = [s[1] for s in split]
         replace = self.__get_split_frame_entries(slice_list, dims, length)
         # now replace each slice list entry with multiple entries
-        array_list = []
-        for sl in slice_list:
-            new_list = np.array([sl for i in range(len(replace[0]))])
-            for d, i in zip(dims, range(len(dims))):
-                new_list[:, d] = replace[i]
-            array_list += [tuple(a) for a in new_list]
-
-        return tuple(array_list)
+        nReplace = len(replace[0])
+        split_list = slice_list._take(
+            np.repeat(np.arange(len(slice_list)), nReplace))
+        for d, i in zip(dims, range(len(dims))):
+            col = split_list._column(d)
+            entries = replace[i]*len(slice_list)
+            split_list.starts[:, col] = [e.start for e in entries]
+            split_list.stops[:, col] = [e.stop for e in entries]
+            split_list.steps[:, col] = [e.step or 0 for e in entries]
+        return split_list
 
     def __get_split_frame_entries(self, slice_list, dims, length):
         shape = self.get_shape
@@ -407,19 +459,29 @@ class Hdf5TransportData(object):
             full_replace.append([t for sub in temp for t in sub])
         return full_replace
         
-    def _get_slice_list_per_process(self, expInfo):
-        processes = expInfo.get_meta_data("processes")
-        process = expInfo.get_meta_data("process")
+    def _get_full_slice_list(self):
+        """ Get the slice list covering the frames of all processes. """
+        self.__halo = None
         self.__set_padding_dict()
         slice_list = self._get_grouped_slice_list()
 
         split_list = self._get_plugin_data().split
         if split_list:
             slice_list = self.__split_frames(slice_list, split_list)
+        return slice_list
+
+    def _get_slice_list_per_process(self, expInfo, frames=None):
+        """ Get the slice list of the current process, for the frames given
+        (see :class:`savu.core.partition.Partition`), else an even share.
+        """
+        processes = expInfo.get_meta_data("processes")
+        process = expInfo.get_meta_data("process")
+        slice_list = self._get_full_slice_list()
 
         frame_index = np.arange(len(slice_list))
         try:
-            frames = np.array_split(frame_index, len(processes))[process]
+            if frames is None:
+                frames = np.array_split(frame_index, len(processes))[process]
             process_slice_list = slice_list[frames[0]:frames[-1]+1]
         except IndexError:
             process_slice_list = []
@@ -448,7 +510,7 @@ class Hdf5TransportData(object):
         out_slice = slice(minval, maxval, sl.step)
         return (out_slice, (minpad, maxpad))
 
-    def __get_pad_data(self, slice_tup, pad_tup):
+    def __get_pad_data(self, slice_tup, pad_tup, halo=None):
         slice_list = []
         pad_list = []
         for i in range(len(slice_tup)):
@@ -462,11 +524,52 @@ class Hdf5TransportData(object):
                     slice_list.append(slice(slice_tup[i], slice_tup[i]+1, 1))
                     pad_list.append(pad_tup[i])
 
-        data_slice = self.data[tuple(slice_list)]
-        data_slice = np.pad(data_slice, tuple(pad_list), mode='edge')
+        if halo:
+            data_slice = self.__read_halo(slice_list, *halo)
+        else:
+            data_slice = self.data[tuple(slice_list)]
+        if any(pad != (0, 0) for pad in pad_list):
+            with trace.span('pad', 'compute'):
+                data_slice = np.pad(data_slice, tuple(pad_list),
+                                    mode='edge')
+
+        return data_slice
+
+    def __read_halo(self, slice_list, ddir, size):
+        """ Read the data for slice_list, re-using the overlap with the last
+        block read in the padded dimension ddir, rather than reading it from
+        file again.  The last size frames of each block are kept for the next
+        one.
+        """
+        sl = slice_list[ddir]
+        start, stop = sl.start, sl.stop
+        if sl.step not in [None, 1] or start is None or stop is None:
+            self.__halo = None
+            return self.data[tuple(slice_list)]
 
+        key = [str(s) for s in slice_list]
+        key[ddir] = None
+        axis = ddir - len([s for s in slice_list[:ddir] if type(s) != slice])
+        halo = self.__halo
+        if halo and halo[0] == key and halo[1] <= start < halo[2] <= stop:
+            cached = self.__get_frames(halo[3], axis, start - halo[1], None)
+            slice_list[ddir] = slice(halo[2], stop, 1)
+            data_slice = np.concatenate(
+                [cached, self.data[tuple(slice_list)]], axis=axis) \
+                if stop > halo[2] else cached.copy()
+        else:
+            data_slice = self.data[tuple(slice_list)]
+
+        nFrames = min(size, stop - start)
+        self.__halo = [key, stop - nFrames, stop, self.__get_frames(
+            data_slice, axis, -nFrames, None).copy()] if nFrames > 0 else None
         return data_slice
 
+    def __get_frames(self, data, axis, start, stop):
+        sl = [slice(None)]*data.ndim
+        sl[axis] = slice(start, stop)
+        return data[tuple(sl)]
+
     def __set_padding_dict(self):
         pData = self._get_plugin_data()
         if pData.padding and not isinstance(pData.padding, Padding):
@@ -496,9 +599,14 @@ class Hdf5TransportData(object):
             slice_list[ddir], pad_list[ddir] = self.__calculate_slice_padding(
                 slice_list[ddir], pDict, shape[ddir])
 
+        halo = None
+        if len(padding_dict) is 1:
+            ddir, pDict = padding_dict.items()[0]
+            halo = (ddir, pDict['before'] + pDict['after'])
+
         if pData.end_pad is True:
             self.correct_pad(pData)
-        return self.__get_pad_data(tuple(slice_list), tuple(pad_list))
+        return self.__get_pad_data(tuple(slice_list), tuple(pad_list), halo)
 
     def __matching_dims(self, pData, slice_list):
         """ Ensure each chunk of frames passed to the plugin has the same \
@@ -0,0 +1,105 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_transport_data
+   :platform: Unix
+   :synopsis: A data transport class that is inherited by Data class at \
+   runtime.  Intermediate datasets are held in memory and only the final \
+   result (and any datasets requested by the user) are written to hdf5.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+import logging
+import numpy as np
+from mpi4py import MPI
+
+from savu.data.transport_data.hdf5_transport_data import Hdf5TransportData
+
+
+class MemoryBacking(object):
+    """ Stands in for the hdf5 backing file of a dataset that is held in
+    memory.  If all processes share a node the array is allocated in an MPI
+    shared memory window, so every process sees the whole dataset.
+    """
+
+    def __init__(self, name, shape, dtype, comm=None):
+        self.filename = 'memory:' + name
+        self.comm = comm
+        self.win = None
+        if comm is None:
+            self.array = np.zeros(shape, dtype=dtype)
+        else:
+            self.array = self.__allocate_shared(shape, np.dtype(dtype))
+
+    def __allocate_shared(self, shape, dtype):
+        nbytes = int(np.prod(shape))*dtype.itemsize
+        size = nbytes if self.comm.rank == 0 else 0
+        self.win = MPI.Win.Allocate_shared(size, dtype.itemsize,
+                                           comm=self.comm)
+        buf, itemsize = self.win.Shared_query(0)
+        array = np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+        if self.comm.rank == 0:
+            array[...] = 0
+        self.comm.barrier()
+        return array
+
+    def close(self):
+        """ Release the memory. """
+        self.array = None
+        if self.win is not None:
+            self.win.Free()
+            self.win = None
+
+
+class MemoryTransportData(Hdf5TransportData):
+    """
+    The MemoryTransportData class keeps intermediate datasets in memory,
+    falling back to the hdf5 transport for everything that is written to
+    disk.
+    """
+
+    def _keep_in_memory(self):
+        """ Determine whether the dataset should be held in memory rather than
+        written to a backing file.
+
+        The final result and any datasets named by the user (``keep_datasets``)
+        are always written to disk, as are all datasets if the processes do not
+        share a single node.
+        """
+        expInfo = self.exp.meta_data
+        if not expInfo.get_dictionary().get('shared_memory', True):
+            return False
+        name = self.get_name()
+        if self.remove:
+            return True
+        if name in expInfo.get_dictionary().get('keep_datasets', []):
+            return False
+        return expInfo.get_meta_data(['link_type', name]) == 'intermediate'
+
+    def _allocate_memory(self):
+        """ Create an in-memory array to hold the data. """
+        comm = self.exp.meta_data.get_meta_data('node_comm') if \
+            self.exp.meta_data.get_meta_data('mpi') is True else None
+        self.backing_file = MemoryBacking(self.get_name(), self.get_shape(),
+                                          self.dtype, comm=comm)
+        self.data = self.backing_file.array
+        logging.debug("Holding dataset %s in memory", self.get_name())
+
+    def _save_data(self, link_type):
+        if isinstance(self.backing_file, MemoryBacking):
+            self.exp._barrier()
+            return
+        super(MemoryTransportData, self)._save_data(link_type)
@@ -0,0 +1,149 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: virtual_dataset
+   :platform: Unix
+   :synopsis: Output datasets written by each process to a file of its own, \
+       with the serial hdf5 driver, and joined by a virtual dataset.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import logging
+
+import h5py
+from mpi4py import MPI
+
+
+class VirtualDataset(object):
+    """ An output dataset that each process writes to its own (source) file.
+    The source dataset has the full shape of the output, but only the chunks
+    written by this process are allocated.  Once the plugin has finished,
+    the regions written by all processes are mapped into a virtual dataset
+    'data' in the output group, so the output is seen as a single dataset.
+
+    :param exp: The experiment.
+    :param group: The output group (in the shared output file).
+    :param shape: The shape of the dataset.
+    :param dtype: The dtype of the dataset.
+    :param kwargs: Keyword arguments of create_dataset (chunks, filters).
+    """
+
+    def __init__(self, exp, group, shape, dtype, **kwargs):
+        process = exp.meta_data.get_meta_data('process')
+        stem, ext = os.path.splitext(group.file.filename)
+        self.filename = '%s_%03i%s' % (stem, process, ext)
+        self.path = group.name + '/data'
+        self.group = group
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.regions = []
+        logging.debug("Creating the source file %s", self.filename)
+        kwargs['chunks'] = kwargs.get('chunks') or True
+        self.source_file = h5py.File(self.filename, 'w')
+        self.source = self.source_file.create_dataset(
+            self.path, shape, dtype, **kwargs)
+
+    def add(self, slice_tup):
+        """ Record the region written to by slice_tup, merging it with the
+        previous region if they are adjacent.
+        """
+        self.regions.append(_get_region(slice_tup, self.shape))
+        while len(self.regions) > 1:
+            merged = _merge(self.regions[-2], self.regions[-1])
+            if merged is None:
+                break
+            self.regions[-2:] = [merged]
+
+    def close(self, comm=MPI.COMM_WORLD):
+        """ Close the source file of this process and create the virtual
+        dataset from the regions written by all processes (collective over
+        comm).
+
+        :returns: A virtual dataset, opened read-only, for reading the output.
+        """
+        self.source_file.close()
+        regions = comm.allgather((self.filename, self.regions))
+        return join(self.group, self.shape, self.dtype, regions, comm)
+
+
+def join(group, shape, dtype, regions, comm=MPI.COMM_WORLD):
+    """ Create the virtual dataset 'data' in group, mapping the regions
+    written to each source file (collective over comm).
+
+    :param group: The output group (in the shared output file).
+    :param regions: The (filename, regions) of each source file, the
+        source datasets being at the path of the virtual dataset.
+    :returns: A virtual dataset, opened read-only, for reading the output.
+    """
+    layout = _get_layout(group.name + '/data', shape, dtype, regions)
+    group.create_virtual_dataset('data', layout, fillvalue=0)
+
+    # The shared file may not be opened with the serial driver, and
+    # hdf5 opens the source files with the access mode of the file
+    # holding the virtual dataset, so each process reads the output
+    # through a read-only copy of it, which is removed once opened.
+    stem, ext = os.path.splitext(group.file.filename)
+    filename = '%s_vds%s' % (stem, ext)
+    if comm.rank == 0:
+        with h5py.File(filename, 'w') as reader:
+            reader.create_virtual_dataset('data', layout, fillvalue=0)
+    comm.barrier()
+    data = h5py.File(filename, 'r')['data']
+    comm.barrier()
+    if comm.rank == 0:
+        os.remove(filename)
+    logging.debug("Joined %i source files in %s", len(regions),
+                  group.file.filename)
+    return data
+
+
+def _get_layout(path, shape, dtype, regions):
+    """ The layout of the virtual dataset, with the source files named
+    relative to the output file (they are in the same directory).
+    """
+    layout = h5py.VirtualLayout(shape, dtype)
+    for filename, file_regions in regions:
+        if not file_regions:
+            continue
+        source = h5py.VirtualSource(os.path.basename(filename), path,
+                                    shape=shape, dtype=dtype)
+        for region in file_regions:
+            sl = tuple(slice(*r) for r in region)
+            layout[sl] = source[sl]
+    return layout
+
+
+def _get_region(slice_tup, shape):
+    """ The (start, stop, step) of slice_tup in each dimension. """
+    slice_tup = tuple(slice_tup) + (slice(None),)*(len(shape) - len(slice_tup))
+    return tuple(sl.indices(length) if isinstance(sl, slice) else
+                 (sl, sl + 1, 1) for sl, length in zip(slice_tup, shape))
+
+
+def _merge(first, second):
+    """ Merge two regions that differ only in one dimension, where they are
+    adjacent, else return None.
+    """
+    diff = [i for i, (a, b) in enumerate(zip(first, second)) if a != b]
+    if len(diff) != 1:
+        return None
+    dim = diff[0]
+    (start1, stop1, step1), (start2, stop2, step2) = first[dim], second[dim]
+    if step1 != 1 or step2 != 1 or stop1 != start2:
+        return None
+    return first[:dim] + ((start1, stop2, 1),) + first[dim+1:]
@@ -0,0 +1,107 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: write_buffer
+   :platform: Unix
+   :synopsis: Aggregates consecutive writes to a chunked dataset into chunk \
+       aligned blocks.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import numpy as np
+
+from savu.data.virtual_dataset import _get_region, _merge
+
+# limit on the memory held by each buffer (bytes)
+BUFFER_LIMIT = 256*1024**2
+
+
+class WriteBuffer(object):
+    """ Collects the consecutive blocks written to a chunked dataset until
+    they cover whole chunks, so that they can be written as one hyperslab
+    without hdf5 reading, modifying and writing back partial chunks.  Blocks
+    that are not adjacent to the previous block start a new region, and the
+    oldest region is written (whole chunks or not) if there are more than
+    two.
+
+    :param shape: The shape of the dataset.
+    :param chunks: The chunk shape of the dataset.
+    :param dtype: The dtype of the dataset.
+    """
+
+    def __init__(self, shape, chunks, dtype, limit=BUFFER_LIMIT):
+        self.shape = tuple(shape)
+        self.chunks = tuple(chunks)
+        self.dtype = dtype
+        self.limit = limit
+        self.nbytes = 0
+        self.__regions = []  # [region, [(region, block), ...]]
+
+    def add(self, slice_tup, value):
+        """ Add the block value, to be written to slice_tup.
+
+        :returns: The (slice_tup, block) pairs that are ready to be written.
+        :rtype: list
+        """
+        region = _get_region(slice_tup, self.shape)
+        value = np.asarray(value)
+        size = int(np.prod([r[1] - r[0] for r in region]))
+        if any(r[2] != 1 for r in region) or value.size != size:
+            return self.flush() + [(slice_tup, value)]
+
+        # copy the block, as a plugin may re-use its result array
+        value = np.array(value.reshape([r[1] - r[0] for r in region]),
+                         dtype=self.dtype)
+        self.nbytes += value.nbytes
+        self.__regions.append([region, [(region, value)]])
+        while len(self.__regions) > 1:
+            merged = _merge(self.__regions[-2][0], self.__regions[-1][0])
+            if merged is None:
+                break
+            blocks = self.__regions[-2][1] + self.__regions[-1][1]
+            self.__regions[-2:] = [[merged, blocks]]
+
+        if self.nbytes > self.limit:
+            return self.flush()
+        ready = []
+        if len(self.__regions) > 2:
+            ready.append(self.__pop(0))
+        ready += [self.__pop(idx) for idx in
+                  reversed(range(len(self.__regions)))
+                  if self.__is_aligned(self.__regions[idx][0])]
+        return ready
+
+    def flush(self):
+        """ Get all buffered regions, ready to be written. """
+        return [self.__pop(0) for r in range(len(self.__regions))]
+
+    def __pop(self, idx):
+        region, blocks = self.__regions.pop(idx)
+        self.nbytes -= sum(b.nbytes for r, b in blocks)
+        if len(blocks) == 1:
+            data = blocks[0][1]
+        else:
+            data = np.empty([r[1] - r[0] for r in region], dtype=self.dtype)
+            for block_region, block in blocks:
+                data[tuple(slice(b[0] - r[0], b[1] - r[0]) for b, r in
+                           zip(block_region, region))] = block
+        return tuple(slice(r[0], r[1]) for r in region), data
+
+    def __is_aligned(self, region):
+        return all(start % c == 0 and (stop % c == 0 or stop == length)
+                   for (start, stop, step), c, length in
+                   zip(region, self.chunks, self.shape))
@@ -35,6 +35,7 @@ class BaseSaver(Plugin):
         special case of plugin that doesn't required setup of in/out_datasets
         """
         self.exp = exp
+        self._set_parameters(params)
         logging.info("%s.%s", self.__class__.__name__, 'setup')
         self.setup()
 
@@ -52,10 +52,12 @@ class TimeBasedCorrection(BaseCorrection, CpuPlugin):
         self.data_idx = inData.data.get_index(0)
 
         # calculate dark and flat averages
-        self.dark, self.dark_idx = \
-            self.calc_average(inData.data.dark(), inData.data.get_index(2))
-        self.flat, self.flat_idx = \
-            self.calc_average(inData.data.flat(), inData.data.get_index(1))
+        self.dark, self.dark_idx = inData.data._cached(
+            'dark', 'batch_means', lambda: self.calc_average(
+                inData.data.dark(), inData.data.get_index(2)))
+        self.flat, self.flat_idx = inData.data._cached(
+            'flat', 'batch_means', lambda: self.calc_average(
+                inData.data.flat(), inData.data.get_index(1)))
 
         inData.meta_data.set_meta_data('multiple_dark', self.dark)
         inData.meta_data.set_meta_data('multiple_flat', self.flat)
@@ -21,6 +21,7 @@
 
 """
 
+import savu.core.utils as cu
 from savu.plugins.driver.plugin_driver import PluginDriver
 
 
@@ -29,6 +30,11 @@ class CpuPlugin(PluginDriver):
     The base class from which all plugins should inherit.
     """
 
+    # Set to True in plugins whose process_frames method keeps no state
+    # between calls (and mostly releases the GIL), so that each block of
+    # frames can be split between threads.
+    thread_safe = False
+
     def __init__(self):
         super(CpuPlugin, self).__init__()
 
@@ -36,3 +42,24 @@ class CpuPlugin(PluginDriver):
 
         self._run_plugin_instances(transport)
         return
+
+    def _process_frames(self, data):
+        """ Process a block of frames, splitting it between threads along the
+        frame dimension if the plugin is thread safe and more than one thread
+        has been requested.
+        """
+        nThreads = self.__get_n_threads()
+        axes = self._get_frame_axes() if nThreads > 1 else None
+        if not axes:
+            return self.process_frames(data)
+
+        in_axes, out_axes = axes
+        sub_data = self._split_frames(data, in_axes, nThreads)
+        results = cu.get_thread_pool(nThreads).map(self.process_frames,
+                                                   sub_data)
+        return self._join_frames(results, out_axes)
+
+    def __get_n_threads(self):
+        if not self.thread_safe:
+            return 1
+        return self.exp.meta_data.get_dictionary().get('threads', 1)
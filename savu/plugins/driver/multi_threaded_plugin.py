@@ -20,9 +20,11 @@
 .. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
 
 """
+import logging
 from mpi4py import MPI
 
 from savu.plugins.driver.plugin_driver import PluginDriver
+from savu.core.node_pool import NodePool
 
 
 class MultiThreadedPlugin(PluginDriver):
@@ -31,8 +33,15 @@ class MultiThreadedPlugin(PluginDriver):
 
     """
 
+    # Set to True in plugins whose frames can be processed independently, so
+    # that each block of frames is shared with the other processes on the
+    # node rather than leaving them idle.  The pre_process method is then
+    # called on every process, and post_process on the node masters only.
+    share_frames = False
+
     def __init__(self):
         super(MultiThreadedPlugin, self).__init__()
+        self.__pool = None
 
     def _run_plugin(self, exp, transport):
 
@@ -45,17 +54,71 @@ class MultiThreadedPlugin(PluginDriver):
 
         self.__create_new_communicator(masters, exp)
         self.exp._barrier()
+        if self.share_frames and not self.extra_dims:
+            self.__pool = self.__create_node_pool(processes)
 
         if process in masters:
-            self.parameters['available_CPUs'] = nCores
+            self.parameters['available_CPUs'] = \
+                nCores/self.__pool.comm.size if self.__pool else nCores
             self.parameters['available_GPUs'] = \
                 len([p for p in processes if 'GPU' in p])/nNodes
-            self._run_plugin_instances(transport, communicator=self.new_comm)
+            try:
+                self._run_plugin_instances(transport,
+                                           communicator=self.new_comm)
+            finally:
+                # release the processes serving the pool, even on failure
+                if self.__pool:
+                    self.__pool.close()
             self.__free_communicator()
-
+        elif self.__pool:
+            self.parameters['available_CPUs'] = 1
+            self.base_pre_process()
+            self.pre_process()
+            self.__pool.serve(self.process_frames)
+            self.__pool.close()
+
+        if self.__pool:
+            self.__pool.comm.Free()
+            self.__pool = None
         self.exp._barrier()
         return
 
+    def _process_frames(self, data):
+        """ Process a block of frames, sharing it between the processes on
+        the node if the plugin allows it.
+        """
+        axes = self._get_frame_axes() if self.__pool else None
+        if not axes:
+            return self.process_frames(data)
+
+        in_axes, out_axes = axes
+        sub_data = self._split_frames(data, in_axes, self.__pool.comm.size)
+        return self._join_frames(
+            self.__pool.map(self.process_frames, sub_data), out_axes)
+
+    def __create_node_pool(self, processes):
+        """ Group the processes on each node, with the master first, into a
+        pool.  Returns None if the node has a single process or its processes
+        cannot share memory.
+        """
+        rank = MPI.COMM_WORLD.rank
+        node = processes[:rank+1].count(processes[0]) - 1
+        key = 0 if rank in self._get_masters(processes) else rank + 1
+        comm = MPI.COMM_WORLD.Split(node, key)
+        shared = comm.Split_type(MPI.COMM_TYPE_SHARED)
+        shareable = comm.allreduce(shared.size == comm.size, op=MPI.LAND)
+        shared.Free()
+        if comm.size < 2 or not shareable:
+            if not shareable:
+                logging.warning("The processes in node %i cannot share "
+                                "memory, so %s will run on the node master "
+                                "only.", node, self.name)
+            comm.Free()
+            return None
+        logging.info("%s sharing frames between %i processes on node %i",
+                     self.name, comm.size, node)
+        return NodePool(comm)
+
     def _get_masters(self, processes):
         masters = [p for p in range(len(processes)) if processes[p] == 'GPU0']
         if not masters:
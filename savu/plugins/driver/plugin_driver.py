@@ -25,6 +25,8 @@ import numpy as np
 from mpi4py import MPI
 
 import savu.plugins.utils as pu
+import savu.core.trace as trace
+from savu.data.data_structures.data_add_ons import Padding
 
 
 class PluginDriver(object):
@@ -32,13 +34,23 @@ class PluginDriver(object):
     The base class from which all plugins should inherit.
     """
 
+    # Set to False in plugins that cannot apply every combination of tuned
+    # parameters to each block of frames in a single pass, e.g. because
+    # pre_process modifies the input datasets, so that the plugin is run
+    # once for each combination instead.
+    tune_in_one_pass = True
+    # the instances of the plugin for each combination of tuned parameters
+    __tuning = None
+
     def __init__(self):
         super(PluginDriver, self).__init__()
 
     def _run_plugin_instances(self, transport, communicator=MPI.COMM_WORLD):
         """ Runs the pre_process, process and post_process methods.
 
-        If parameter tuning is required, loop over the methods and set the
+        If parameter tuning is required, either set up an instance of the
+        plugin for each combination of parameters and apply them all to each
+        block of frames as it is read, or loop over the methods and set the
         correct parameters for each run. """
 
         out_data = self.get_out_datasets()
@@ -52,37 +64,184 @@ class PluginDriver(object):
         if extra_dims:
             init_vars = self.__get_local_dict()
 
-        for i in range(repeat):
-            if extra_dims:
-                self.__reset_local_vars(init_vars)
-                self._set_parameters_this_instance(param_idx[i])
-                for j in range(len(out_data)):
-                    out_data[j]._get_plugin_data()\
-                        .set_fixed_directions(param_dims[j], param_idx[i])
+        if extra_dims and self.tune_in_one_pass:
+            self.__run_tuning_pass(transport, communicator, init_vars,
+                                   param_idx, param_dims)
+        else:
+            for i in range(repeat):
+                if extra_dims:
+                    self.__reset_local_vars(init_vars)
+                    self._set_parameters_this_instance(param_idx[i])
+                    self.__fix_directions(param_dims, param_idx[i])
 
-            logging.info("%s.%s", self.__class__.__name__, 'pre_process')
-            self.base_pre_process()
-            self.pre_process()
+                self._run_pre_process()
+
+                logging.info("%s.%s", self.__class__.__name__, 'process')
+                with self.__span('process'):
+                    transport._process(self, communicator=communicator)
+
+                logging.info("%s.%s", self.__class__.__name__, '_barrier')
+                self.exp._barrier(communicator=communicator)
+
+                self._run_post_process()
+
+        for j in range(len(out_data)):
+            out_data[j].set_shape(out_data[j].data.shape)
+
+    def _run_plugin_chain(self, plugins, transport):
+        """ Runs a chain of fused plugins, starting with this one: the
+        pre_process methods of every plugin, then the processing of each
+        block of frames through the whole chain, then the post_process
+        methods.
 
-            logging.info("%s.%s", self.__class__.__name__, 'process')
-            transport._process(self)
+        :param list(plugin) plugins: The fused plugin instances, in order.
+        """
+        for plugin in plugins:
+            plugin._run_pre_process()
 
-            logging.info("%s.%s", self.__class__.__name__, '_barrier')
-            self.exp._barrier(communicator=communicator)
+        names = '+'.join(p.__class__.__name__ for p in plugins)
+        logging.info("%s.%s", names, 'process')
+        with trace.span('%s.%s' % (names, 'process'), 'plugin'):
+            transport._process_chain(plugins)
 
-            logging.info("%s.%s", self.__class__.__name__, 'post_process')
+        logging.info("%s.%s", names, '_barrier')
+        self.exp._barrier()
+
+        for plugin in plugins:
+            plugin._run_post_process()
+
+        out_data = plugins[-1].get_out_datasets()
+        for j in range(len(out_data)):
+            out_data[j].set_shape(out_data[j].data.shape)
+
+    def _run_pre_process(self):
+        logging.info("%s.%s", self.__class__.__name__, 'pre_process')
+        with self.__span('pre_process'):
+            self.base_pre_process()
+            self.pre_process()
+
+    def _run_post_process(self):
+        logging.info("%s.%s", self.__class__.__name__, 'post_process')
+        with self.__span('post_process'):
             self.post_process()
             self.base_post_process()
 
+    def __run_tuning_pass(self, transport, communicator, init_vars,
+                          param_idx, param_dims):
+        """ Set up an instance of the plugin (its local variables after
+        pre_process) for each combination of tuned parameters, then read
+        each block of frames once, applying every combination to it. """
+        self.__tuning = {'param_idx': param_idx, 'param_dims': param_dims,
+                         'states': [], 'current': None}
+        for i in range(len(param_idx)):
+            self.__reset_local_vars(init_vars)
+            self._set_parameters_this_instance(param_idx[i])
+            self.__fix_directions(param_dims, param_idx[i])
+            self._run_pre_process()
+            self.__tuning['states'].append(self.__get_local_dict())
+            self.__tuning['current'] = i
+
+        logging.info("%s.%s (%i parameter combinations)",
+                     self.__class__.__name__, 'process', len(param_idx))
+        with self.__span('process'):
+            transport._process(self, communicator=communicator)
+
+        logging.info("%s.%s", self.__class__.__name__, '_barrier')
+        self.exp._barrier(communicator=communicator)
+
+        for i in range(len(param_idx)):
+            self._set_tuning_instance(i)
+            self._run_post_process()
+        self.__tuning = None
+
+    def __span(self, method):
+        return trace.span('%s.%s' % (self.__class__.__name__, method),
+                          'plugin')
+
+    def _get_n_tuning_instances(self):
+        """ The number of combinations of tuned parameters applied to each
+        block of frames, or 0 if there is no parameter tuning in one pass.
+        """
+        return len(self.__tuning['states']) if self.__tuning else 0
+
+    def _set_tuning_instance(self, i, fix_directions=False):
+        """ Switch to the instance of the plugin for combination i of the
+        tuned parameters, keeping the local variables of the current one.
+
+        :param bool fix_directions: Fix the tuning dimensions of the output
+            datasets to the indices of combination i.
+        """
+        tuning = self.__tuning
+        if i != tuning['current']:
+            tuning['states'][tuning['current']] = self.__get_local_dict()
+            self.__reset_local_vars(tuning['states'][i])
+            self._set_parameters_this_instance(tuning['param_idx'][i])
+            tuning['current'] = i
+        if fix_directions:
+            self.__fix_directions(tuning['param_dims'],
+                                  tuning['param_idx'][i])
+
+    def __fix_directions(self, param_dims, indices):
+        out_data = self.get_out_datasets()
         for j in range(len(out_data)):
-            out_data[j].set_shape(out_data[j].data.shape)
+            out_data[j]._get_plugin_data()\
+                .set_fixed_directions(param_dims[j], indices)
+
+    def _process_frames(self, data):
+        """ Process a block of frames, called by the transport layer for
+        each block.
+        """
+        return self.process_frames(data)
+
+    def _get_frame_axes(self):
+        """ Find the axis of the frames in each (squeezed) array passed to and
+        returned from process_frames.  Returns None if blocks of frames should
+        not be split, i.e. there is a single frame or the frames are padded.
+        """
+        in_pData, out_pData = self.get_plugin_datasets()
+        in_axes = [self.__get_frame_axis(p) for p in in_pData]
+        out_axes = [self.__get_frame_axis(p) for p in out_pData]
+        if None in in_axes + out_axes:
+            return None
+        return in_axes, out_axes
+
+    def __get_frame_axis(self, pData):
+        if pData._get_frame_chunk() < 2:
+            return None
+        slice_dirs = pData.get_slice_directions()
+        padding = pData.padding
+        if padding and (not isinstance(padding, Padding) or slice_dirs[0] in
+                        padding._get_padding_directions()):
+            return None
+        return slice_dirs[0] - len([d for d in slice_dirs[1:]
+                                    if d < slice_dirs[0]])
+
+    def _split_frames(self, data, axes, nBlocks):
+        """ Split a block of frames into (at most) nBlocks smaller blocks. """
+        nFrames = data[0].shape[axes[0]]
+        blocks = np.array_split(np.arange(nFrames), min(nBlocks, nFrames))
+        return [[self.__get_block(d, ax, b) for d, ax in zip(data, axes)]
+                for b in blocks]
+
+    def __get_block(self, data, axis, frames):
+        sl = [slice(None)]*data.ndim
+        sl[axis] = slice(frames[0], frames[-1]+1)
+        return data[tuple(sl)]
+
+    def _join_frames(self, results, axes):
+        """ Join the results of processing each block from _split_frames. """
+        if type(results[0]) is list:
+            return [np.concatenate([r[i] for r in results], axis=axes[i])
+                    for i in range(len(results[0]))]
+        return np.concatenate(results, axis=axes[0])
 
     def __get_local_dict(self):
         """ Gets the local variables of the class minus those from the Plugin
         class. """
         from savu.plugins.plugin import Plugin
         plugin = Plugin()
-        copy_keys = vars(self).viewkeys() - vars(plugin).viewkeys()
+        copy_keys = vars(self).viewkeys() - vars(plugin).viewkeys() - \
+            set(['_PluginDriver__tuning'])
         copy_dict = {}
         for key in copy_keys:
             copy_dict[key] = getattr(self, key)
@@ -52,6 +52,8 @@ class PaganinFilter(BaseFilter, CpuPlugin):
         FALSE when the Paganin Filter is on.
     """
 
+    thread_safe = True
+
     def __init__(self):
         logging.debug("initialising Paganin Filter")
         logging.debug("Calling super to make sure that all superclases are " +
@@ -111,9 +113,10 @@ class PaganinFilter(BaseFilter, CpuPlugin):
         print "In filter frames"
         output = np.empty_like(data[0])
         nSlices = data[0].shape[self.slice_dir]
+        sslice = list(self.sslice)
         for i in range(nSlices):
-            self.sslice[self.slice_dir] = i
-            proj = data[0][tuple(self.sslice)]
+            sslice[self.slice_dir] = i
+            proj = data[0][tuple(sslice)]
             height, width = proj.shape
             proj = np.nan_to_num(proj)  # Noted performance
             proj[proj == 0] = 1.0
@@ -124,7 +127,7 @@ class PaganinFilter(BaseFilter, CpuPlugin):
                                      tuple([padleftright]*2)), padmethod)
             result = self._paganin(proj)
             #result = np.abs(np.apply_over_axes(self._paganin(proj), proj, 0))
-            output[self.sslice] = result[padtopbottom:-padtopbottom,
+            output[sslice] = result[padtopbottom:-padtopbottom,
                                          padleftright:-padleftright]
         return output
 
@@ -48,6 +48,8 @@ class SinogramAlignment(BaseFilter, CpuPlugin):
         plugin. Default: 'centre_of_mass'.
     """
 
+    thread_safe = True
+
     def __init__(self):
         logging.debug("initialising Sinogram Alignment")
         super(SinogramAlignment,
@@ -96,15 +98,16 @@ class SinogramAlignment(BaseFilter, CpuPlugin):
         """
         nFrames = data[0].shape[self.slice_dir]
         result = np.empty_like(data[0])
+        sl = list(self.sl)
         for i in range(nFrames):
-            self.sl[self.slice_dir] = i
-            sino = data[0][self.sl]
+            sl[self.slice_dir] = i
+            sino = data[0][sl]
             if self.parameters['threshold']:
                 a, b = self.parameters['threshold'].split('.')
                 sino[sino > a] = b
             com_y = self.com_y if self.com_y is not None else self._com_y(sino)
             shifted = self._shift(sino, self.com_x, com_y)
-            result[self.sl] = \
+            result[sl] = \
                 shifted.reshape(shifted.shape[0], shifted.shape[1])
         return result
 
@@ -25,6 +25,7 @@
 import h5py
 import logging
 from savu.data.data_structures.data_add_ons import DataMapping
+from savu.data.data_structures.data_types.memmap_h5 import memmap_h5
 
 from savu.plugins.base_loader import BaseLoader
 
@@ -51,7 +52,7 @@ class BaseMultiModalLoader(BaseLoader):
         logging.debug(str(entry))
 
         #lets get the data out
-        data_obj.data = data_obj.backing_file[entry.name + data_str]
+        data_obj.data = memmap_h5(data_obj.backing_file[entry.name + data_str])
         data_obj.set_shape(data_obj.data.shape)
         #Now the beam fluctuations
         # the ion chamber "normalisation"
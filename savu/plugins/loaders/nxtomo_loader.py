@@ -30,6 +30,10 @@ from savu.plugins.base_loader import BaseLoader
 from savu.plugins.utils import register_plugin
 from savu.data.data_structures.data_types.data_plus_darks_and_flats \
     import ImageKey, NoImageKey
+from savu.data.data_structures.data_types.memmap_h5 import memmap_h5
+from savu.core.chunk_cache import get_file_cache_kwargs, get_read_patterns
+from savu.data.data_structures.data_types.decompressed_h5 import \
+    decompressed_h5
 
 
 @register_plugin
@@ -59,10 +63,19 @@ class NxtomoLoader(BaseLoader):
 
         data_obj = exp.create_data_object('in_data', 'tomo')
 
-        data_obj.backing_file = \
-            h5py.File(exp.meta_data.get_meta_data("data_file"), 'r')
-
-        data_obj.data = data_obj.backing_file[self.parameters['data_path']]
+        # size the chunk cache for the plugins reading the data (the
+        # patterns are not known until the plugin list has been checked)
+        data_file = exp.meta_data.get_meta_data("data_file")
+        patterns = [] if self.parameters['3d_to_4d'] else \
+            get_read_patterns(exp, 'tomo')
+        cache = get_file_cache_kwargs(exp, data_file,
+                                      self.parameters['data_path'], patterns)
+        data_obj.backing_file = h5py.File(data_file, 'r', **cache)
+
+        # compressed data is decompressed on a pool of threads, uncompressed
+        # data is memory mapped where possible
+        dataset = data_obj.backing_file[self.parameters['data_path']]
+        data_obj.data = memmap_h5(decompressed_h5(exp, dataset))
 
         self.__set_dark_and_flat(data_obj)
 
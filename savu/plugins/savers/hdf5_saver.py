@@ -65,7 +65,8 @@ class Hdf5Saver(BaseSaver, CpuPlugin):
         shape = self.in_data.get_shape()
         chunking = Chunking(self.exp, pattern_idx)
         dtype = self.in_data.data.dtype
-        chunks = chunking._calculate_chunking(shape, dtype)
+        chunks = chunking._calculate_chunking(shape, dtype,
+                                              name=self.data_name)
         self.exp._barrier()
         self.out_data = \
             group.create_dataset("data", shape, dtype, chunks=chunks)
@@ -22,6 +22,7 @@
 """
 
 
+import os
 import h5py
 import logging
 from mpi4py import MPI
@@ -29,6 +30,9 @@ from mpi4py import MPI
 from savu.plugins.base_saver import BaseSaver
 from savu.plugins.utils import register_plugin
 from savu.data.chunking import Chunking
+from savu.core.chunk_cache import get_cache_kwargs, get_file_cache_kwargs
+from savu.data.compression import get_compression, get_filter_kwargs
+from savu.data.virtual_dataset import VirtualDataset
 
 NX_CLASS = 'NX_class'
 
@@ -37,6 +41,14 @@ NX_CLASS = 'NX_class'
 class Hdf5TomoSaver(BaseSaver):
     """
     A class to save tomography data to a hdf5 file
+
+    :param compression: Compression of the output datasets: a comma \
+        separated list of filter[:level] entries (filters gzip, lzf, lz4, \
+        blosc, bitshuffle or none), each optionally prefixed by dataset= to \
+        apply to a single dataset, e.g. 'tomo=gzip:6,lz4'. Default: None.
+    :param vds: Write the frames of each process to a file of its own, \
+        joined by a virtual dataset, instead of sharing one file between all \
+        processes. Default: False.
     """
 
     def __init__(self, name='Hdf5TomoSaver'):
@@ -58,25 +70,81 @@ class Hdf5TomoSaver(BaseSaver):
         for key in out_data_dict.keys():
             out_data = out_data_dict[key]
 
+            if out_data._is_fused():
+                count += 1
+                continue
+
+            if out_data._keep_in_memory():
+                out_data._allocate_memory()
+                count += 1
+                continue
+
             logging.info("saver setup: 2")
             self.exp._barrier()
-            out_data.backing_file = self.__create_backing_h5(key)
+            chunks, kwargs = self.__get_layout(out_data,
+                                               current_and_next[count])
+            out_data.backing_file = self.__create_backing_h5(
+                key, cache=get_cache_kwargs(
+                    self.exp, out_data.get_shape(), out_data.dtype, chunks,
+                    self.__get_patterns(current_and_next[count])))
 
             logging.info("saver setup: 3")
             self.exp._barrier()
 
             out_data.group_name, out_data.group = \
-                self.__create_entries(out_data, key, current_and_next[count])
+                self.__create_entries(out_data, key, chunks, kwargs)
 
             logging.info("saver setup: 4")
             self.exp._barrier()
 
             count += 1
 
-    def __create_backing_h5(self, key):
+    def reopen(self, mode='r'):
+        """ Open the backing files of the datasets in exp.index["out_data"],
+        written by a previous run, instead of creating them.
+
+        :param str mode: The mode to open the files in, 'r' or 'r+'.
+        :returns: The names of the datasets without a backing file.
+        """
+        expInfo = self.exp.meta_data
+        missing = []
+        for key, out_data in self.exp.index["out_data"].items():
+            filename = expInfo.get_meta_data(["filename", key])
+            if out_data._is_fused() or out_data._keep_in_memory() or \
+                    not os.path.exists(filename):
+                missing.append(key)
+                continue
+            group_name = expInfo.get_meta_data(["group_name", key])
+            info = out_data.data_info.get_meta_data('file_info')
+            cache = get_file_cache_kwargs(
+                self.exp, filename, group_name + '/data',
+                self.__get_patterns(info['current_and_next']))
+            backing_file = self.__create_backing_h5(key, mode=mode,
+                                                    cache=cache)
+            if group_name not in backing_file:
+                backing_file.close()
+                missing.append(key)
+                continue
+            out_data.backing_file = backing_file
+            out_data.data_info.set_meta_data('group_name', group_name)
+            out_data.group_name = group_name
+            out_data.group = backing_file[group_name]
+            out_data.data = out_data.group['data']
+            logging.debug("Opened the file %s", filename)
+        return missing
+
+    def __get_patterns(self, current_and_next):
+        """ The patterns a dataset is written and read with. """
+        if current_and_next is 0:
+            return []
+        return [p.values()[0] for p in current_and_next.values() if p]
+
+    def __create_backing_h5(self, key, mode='w', cache=None):
         """
-        Create a h5 backend for output data
+        Create a h5 backend for output data (or open it, in mode), with the
+        chunk cache settings (see get_cache_kwargs) in cache.
         """
+        cache = cache or {}
         expInfo = self.exp.meta_data
 
         filename = expInfo.get_meta_data(["filename", key])
@@ -87,12 +155,12 @@ class Hdf5TomoSaver(BaseSaver):
             #info.Set("romio_ds_read", "disable")
             #info.Set("romio_cb_read", "disable")
             #info.Set("romio_cb_write", "disable")
-            backing_file = h5py.File(filename, 'w', driver='mpio',
-                                     comm=MPI.COMM_WORLD, info=info)
+            backing_file = h5py.File(filename, mode, driver='mpio',
+                                     comm=MPI.COMM_WORLD, info=info, **cache)
             # fapl = backing_file.id.get_access_plist()
             # comm, info = fapl.get_fapl_mpio()
         else:
-            backing_file = h5py.File(filename, 'w')
+            backing_file = h5py.File(filename, mode, **cache)
 
         logging.debug("creating the backing file %s", filename)
         if backing_file is None:
@@ -104,7 +172,24 @@ class Hdf5TomoSaver(BaseSaver):
 
         return backing_file
 
-    def __create_entries(self, data, key, current_and_next):
+    def __get_layout(self, data, current_and_next):
+        """ The chunks (None if the dataset is not chunked by savu) and
+        filter keyword arguments of the output dataset.
+        """
+        ffilter, level = get_compression(self.exp, data.get_name(),
+                                         self.parameters['compression'])
+        kwargs = get_filter_kwargs(ffilter, level) if ffilter else {}
+        if current_and_next is 0:
+            return None, kwargs
+        chunking = Chunking(self.exp, current_and_next)
+        chunks = chunking._calculate_chunking(
+            data.get_shape(), data.dtype, name=data.get_name(),
+            aligned=bool(ffilter))
+        logging.info("saver layout: chunks %s", chunks)
+        self.exp._barrier()
+        return chunks, kwargs
+
+    def __create_entries(self, data, key, chunks, kwargs):
         expInfo = self.exp.meta_data
         group_name = expInfo.get_meta_data(["group_name", key])
         data.data_info.set_meta_data('group_name', group_name)
@@ -121,19 +206,28 @@ class Hdf5TomoSaver(BaseSaver):
         self.exp._barrier()
 
         shape = data.get_shape()
-        if current_and_next is 0:
-            data.data = group.create_dataset("data", shape, data.dtype)
+        if chunks is None:
+            data.data = self.__create_dataset(group, shape, data.dtype,
+                                              **kwargs)
         else:
+            data.data = self.__create_dataset(group, shape, data.dtype,
+                                              chunks=chunks, **kwargs)
             logging.info("create_entries: 2")
             self.exp._barrier()
 
-            chunking = Chunking(self.exp, current_and_next)
-            chunks = chunking._calculate_chunking(shape, data.dtype)
-            logging.info("create_entries: 3")
-            self.exp._barrier()
-            data.data = group.create_dataset("data", shape, data.dtype,
-                                             chunks=chunks)
-            logging.info("create_entries: 4")
-            self.exp._barrier()
-
+        if self.__is_virtual():
+            data.virtual = data.data
+            data.data = data.virtual.source
         return group_name, group
+
+    def __is_virtual(self):
+        return bool(self.parameters['vds'] or
+                    self.exp.meta_data.get_dictionary().get('vds', False))
+
+    def __create_dataset(self, group, shape, dtype, **kwargs):
+        """ Create the output dataset in the shared file or, for virtual
+        datasets, the source dataset in a file of this process.
+        """
+        if self.__is_virtual():
+            return VirtualDataset(self.exp, group, shape, dtype, **kwargs)
+        return group.create_dataset("data", shape, dtype, **kwargs)
@@ -31,6 +31,7 @@ import copy
 import pkgutil
 import inspect
 from savu.data.data_structures import utils as u
+import savu.core.trace as trace
 
 plugins = {}
 plugins_path = {}
@@ -130,7 +131,8 @@ def plugin_loader(exp, plugin_dict, **kwargs):
         set_datasets(exp, plugin, plugin_dict)
 
     logging.debug("Running plugin main setup")
-    plugin._main_setup(exp, plugin_dict['data'])
+    with trace.span(plugin_dict['name'] + '.setup', 'setup', check=check_flag):
+        plugin._main_setup(exp, plugin_dict['data'])
 
     if check_flag is True:
         exp.meta_data.plugin_list._set_datasets_list(plugin)
@@ -262,6 +264,18 @@ def __find_docstring_info(index, str_list):
     return "\n".join(info)
 
 
+def has_post_process(plugin):
+    """ Return True if the plugin overrides post_process or
+    base_post_process, i.e. it may depend on state gathered while processing
+    the frames.
+    """
+    from savu.plugins.plugin import Plugin
+    clazz = plugin.__class__
+    return clazz.post_process.im_func is not Plugin.post_process.im_func or \
+        clazz.base_post_process.im_func is not \
+        Plugin.base_post_process.im_func
+
+
 def calc_param_indices(dims):
     indices_list = []
     for i in range(len(dims)):
@@ -27,6 +27,7 @@ import os
 import copy
 
 from savu.core.plugin_runner import PluginRunner
+from savu.core.lifetime import DatasetLifetimes
 from savu.data.experiment_collection import Experiment
 import savu.plugins.utils as pu
 from savu.data.data_structures.plugin_data import PluginData
@@ -239,11 +240,13 @@ def plugin_runner_real_plugin_run(options):
     out_data_objs, stop = in_data._load_data(1)
     exp._clear_data_objects()
     exp.index['in_data'] = copy.deepcopy(start_in_data)
+    lifetimes = DatasetLifetimes(exp)
 
     for key in out_data_objs[0]:
         exp.index["out_data"][key] = out_data_objs[0][key]
 
     plugin = pu.plugin_loader(exp, plugin_list[1])
+    lifetimes.create()
     plugin._run_plugin(exp, plugin_runner)
 
 #    out_datasets = plugin.parameters["out_datasets"]
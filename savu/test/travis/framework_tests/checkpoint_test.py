@@ -0,0 +1,160 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: checkpoint_test
+   :platform: Unix
+   :synopsis: Tests for resuming a failed run from the plugins and frames it \
+       completed.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import cPickle
+import h5py
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.core.checkpoint import Journal, get_fingerprint, get_ranges, \
+    CHECKPOINT_DIR, MANIFEST
+from savu.plugins.filters.no_process_plugin import NoProcessPlugin
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class _Writer(object):
+    def __init__(self, dset):
+        self.datasets = [dset]
+        self.nFlushes = 0
+
+    def flush(self):
+        self.nFlushes += 1
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ranges(self):
+        self.assertEqual(get_ranges([7, 3, 4, 5, 9, 8, 0]),
+                         [(0, 1), (3, 6), (7, 10)])
+        self.assertEqual(get_ranges([]), [])
+
+    def test_fingerprint(self):
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as f:
+            dset = f.create_dataset('data', data=np.ones((5, 4, 3)))
+            fingerprint = get_fingerprint(dset)
+            dset[1] = 0
+            self.assertEqual(get_fingerprint(dset), fingerprint)
+            dset[2] = 0
+            self.assertNotEqual(get_fingerprint(dset), fingerprint)
+
+    def test_journal(self):
+        filename = os.path.join(self.tmpdir, 'p01_000.journal')
+        with h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w') as f:
+            writer = _Writer(f.create_dataset('data', (10,)))
+            journal = Journal(filename, 'digest', set([4]), writer,
+                              blocks=[2, 3, 4, 6])
+            self.assertEqual([journal.skip(c) for c in range(4)],
+                             [False, False, True, False])
+            for count in [0, 1, 3]:
+                journal.add(count)
+            journal.flush()
+        self.assertEqual(writer.nFlushes, 1)
+        with open(filename, 'r') as f:
+            self.assertEqual(f.read(), 'digest\n2 4\n6 7\n')
+
+    def __run(self, loader='nxmonitor_loader', **kwargs):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file, out_path=self.tmpdir)
+        options.update(kwargs)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.' + loader
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin]*3, data=[{}, data, data, data, {}])
+        return dict((f, os.path.getmtime(os.path.join(self.tmpdir, f)))
+                    for f in os.listdir(self.tmpdir) if f.endswith('.h5'))
+
+    def test_resume(self):
+        files = self.__run()
+        self.assertEqual(len(files), 3)
+
+        # the run failed during the final plugin
+        manifest = os.path.join(self.tmpdir, CHECKPOINT_DIR, MANIFEST)
+        with open(manifest, 'rb') as f:
+            entries = cPickle.load(f)
+        self.assertEqual(sorted(entries), [1, 2, 3])
+        del entries[3]
+        with open(manifest, 'wb') as f:
+            cPickle.dump(entries, f)
+
+        resumed = self.__run(resume=True)
+        final = sorted(files)[-1]
+        for name in files:
+            if name == final:
+                self.assertGreaterEqual(resumed[name], files[name])
+            else:
+                self.assertEqual(resumed[name], files[name])
+
+    def __run_recording_frames(self, **kwargs):
+        """ Run the plugins, returning the global frame index given to
+        each. """
+        indices = []
+        set_index = NoProcessPlugin.set_global_frame_index.im_func
+
+        def record(plugin, frame_idx):
+            indices.append(list(frame_idx[0]))
+            set_index(plugin, frame_idx)
+
+        NoProcessPlugin.set_global_frame_index = record
+        try:
+            # a block of frames for each point of the fluorescence map
+            self.__run('nxfluo_loader', **kwargs)
+        finally:
+            del NoProcessPlugin.set_global_frame_index
+        return indices
+
+    def test_resume_frame_index(self):
+        frames = self.__run_recording_frames()[-1]
+        self.assertGreater(len(frames), 2)
+
+        # the run failed during the final plugin, after writing its first
+        # two blocks of frames
+        path = os.path.join(self.tmpdir, CHECKPOINT_DIR)
+        with open(os.path.join(path, MANIFEST), 'rb') as f:
+            entries = cPickle.load(f)
+        digest = entries.pop(3)['digest']
+        with open(os.path.join(path, MANIFEST), 'wb') as f:
+            cPickle.dump(entries, f)
+        with open(os.path.join(path, 'p03_000.journal'), 'w') as f:
+            f.write('%s\n0 2\n' % digest)
+
+        # only the blocks processed are in the index
+        self.assertEqual(self.__run_recording_frames(resume=True),
+                         [frames[2:]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunk_cache_test
+   :platform: Unix
+   :synopsis: Tests for the per-dataset hdf5 chunk cache settings.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.core.chunk_cache import get_cache_kwargs, \
+    get_file_cache_kwargs, get_cache_limit, _CacheCounter, _next_prime, \
+    DEFAULT_NBYTES
+
+
+class _MetaData(object):
+    def __init__(self, options):
+        self.options = options
+
+    def get_dictionary(self):
+        return self.options
+
+
+class _PluginList(object):
+    def __init__(self, datasets_list):
+        self.datasets_list = datasets_list
+
+    def _get_datasets_list(self):
+        return self.datasets_list
+
+
+class _Experiment(object):
+    def __init__(self, chunk_cache=None, datasets_list=None):
+        self.meta_data = _MetaData({'chunk_cache': chunk_cache})
+        if datasets_list is not None:
+            self.meta_data.plugin_list = _PluginList(datasets_list)
+
+
+def _datasets(in_names, out_names):
+    return {'in_datasets': [{'name': n} for n in in_names],
+            'out_datasets': [{'name': n} for n in out_names]}
+
+
+class ChunkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_kwargs(self):
+        shape, chunks = (2000, 300, 400), (5, 10, 400)
+        proj = {'slice_dir': (0,), 'max_frames': 8}
+        sino = {'slice_dir': (1,), 'max_frames': 1}
+        exp = _Experiment()
+        chunk_bytes = 5*10*400*4
+        # two chunks deep (unaligned blocks) and all of each core dimension
+        kwargs = get_cache_kwargs(exp, shape, np.float32, chunks, [proj])
+        self.assertEqual(kwargs['rdcc_nbytes'],
+                         max(3*30*chunk_bytes, DEFAULT_NBYTES))
+        self.assertEqual(kwargs['rdcc_nslots'], _next_prime(90*100))
+        # the pattern touching the most chunks is used, up to the limit
+        kwargs = get_cache_kwargs(exp, shape, np.float32, chunks,
+                                  [proj, sino])
+        self.assertEqual(kwargs['rdcc_nbytes'], 400*chunk_bytes)
+        kwargs = get_cache_kwargs(_Experiment(1), shape, np.float32, chunks,
+                                  [proj, sino])
+        self.assertEqual(kwargs['rdcc_nbytes'], 1024**2)
+        self.assertEqual(get_cache_kwargs(exp, shape, np.float32, None,
+                                          [proj]), {})
+        self.assertEqual(get_cache_kwargs(exp, shape, np.float32, chunks,
+                                          []), {})
+
+    def test_cache_limit(self):
+        self.assertEqual(get_cache_limit(_Experiment()), 256*1024**2)
+        self.assertEqual(get_cache_limit(_Experiment(64)), 64*1024**2)
+        # the budget is shared by the datasets open at once: tomo, sino and
+        # dark are open while the last plugin replaces tomo
+        datasets_list = [_datasets(['tomo'], ['tomo']),
+                         _datasets(['tomo'], ['sino']),
+                         _datasets(['tomo', 'dark'], ['tomo'])]
+        self.assertEqual(get_cache_limit(_Experiment(64, datasets_list)),
+                         64*1024**2//4)
+        shape, chunks = (2000, 300, 400), (5, 10, 400)
+        sino = {'slice_dir': (1,), 'max_frames': 1}
+        kwargs = get_cache_kwargs(_Experiment(64, datasets_list), shape,
+                                  np.float32, chunks, [sino])
+        self.assertEqual(kwargs['rdcc_nbytes'], 16*1024**2)
+
+    def test_file_cache_kwargs(self):
+        filename = os.path.join(self.tmpdir, 'test.h5')
+        with h5py.File(filename, 'w') as f:
+            f.create_dataset('entry/data', (200, 30, 40), np.float32,
+                             chunks=(5, 30, 40))
+        pattern = {'slice_dir': (1,), 'max_frames': 1}
+        kwargs = get_file_cache_kwargs(_Experiment(), filename,
+                                       'entry/data', [pattern])
+        # the datasets of the file are opened with the cache
+        with h5py.File(filename, 'r', **kwargs) as f:
+            self.assertEqual(
+                f['entry/data'].id.get_access_plist().get_chunk_cache(),
+                (kwargs['rdcc_nslots'], kwargs['rdcc_nbytes'],
+                 kwargs['rdcc_w0']))
+        self.assertEqual(get_file_cache_kwargs(_Experiment(), filename,
+                                               'missing', [pattern]), {})
+
+    def test_counter(self):
+        counter = _CacheCounter('data', (4, 10, 10), 3, 0, 0, 1.0)
+        # blocks of two frames in chunks of four: every other block hits
+        for start in range(0, 16, 2):
+            counter.access([[start, start + 2], [0, 10], [0, 10]])
+        self.assertEqual((counter.hits, counter.misses), (4, 4))
+
+        # a block touching more chunks than the cache holds always misses
+        counter = _CacheCounter('data', (1, 5, 10), 1, 0, 0, 1.0)
+        for start in range(4):
+            counter.access([[start, start + 1], [0, 10], [0, 10]])
+            counter.access([[start, start + 1], [0, 10], [0, 10]])
+        self.assertEqual((counter.hits, counter.misses), (0, 16))
+
+    def test_next_prime(self):
+        self.assertEqual([_next_prime(n) for n in [1, 8, 100, 521]],
+                         [2, 11, 101, 521])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,11 +41,14 @@ class ChunkingTests(unittest.TestCase):
 #            }
 #        run_protected_plugin_runner(options)
 
-    def create_chunking_instance(self, current_list, nnext_list, nProcs):
+    def create_chunking_instance(self, current_list, nnext_list, nProcs,
+                                 block_size=None, chunk_cache=1):
         current = self.create_pattern('a', current_list)
         nnext = self.create_pattern('b', nnext_list)
         options = tu.set_experiment('tomoRaw')
         options['processes'] = range(nProcs)
+        options['block_size'] = block_size
+        options['chunk_cache'] = chunk_cache
         # set a dummy process list
         options['process_file'] = \
             tu.get_test_process_path('basic_tomo_process.nxs')
@@ -102,12 +105,12 @@ class ChunkingTests(unittest.TestCase):
         shape = (5000, 5000, 5000)
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (1, 625, 313))
+        self.assertEqual(self.amend_chunks(chunks), (1, 40, 5000))
 
         shape = (5000, 5000, 5000)
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (1, 625, 313))
+        self.assertEqual(self.amend_chunks(chunks), (1, 40, 5000))
 
         shape = (1, 800, 500)
         chunking = self.create_chunking_instance(current, nnext, nProcs)
@@ -121,18 +124,18 @@ class ChunkingTests(unittest.TestCase):
         nProcs = 1
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (50, 50, 100))
+        self.assertEqual(self.amend_chunks(chunks), (8, 38, 100))
 
         current = [8, (0,), (1, 2)]
         nnext = [4, (1,), (0, 2)]
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (48, 52, 100))
+        self.assertEqual(self.amend_chunks(chunks), (50, 38, 100))
 
         nProcs = 10
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (8, 28, 100))
+        self.assertEqual(self.amend_chunks(chunks), (8, 38, 100))
 
     def test_chunks_4D_1(self):
         current = [1, (0, 1), (2, 3)]
@@ -147,26 +150,54 @@ class ChunkingTests(unittest.TestCase):
         nnext = [1, (2, 3), (0, 1)]
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (23, 22, 22, 22))
+        self.assertEqual(self.amend_chunks(chunks), (200, 2, 5, 125))
 
         current = [1, (0,), (1, 2, 3)]
         nnext = [1, (0,), (1, 2, 3)]
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (1, 44, 75, 63))
+        self.assertEqual(self.amend_chunks(chunks), (1, 3, 150, 500))
 
         current = [4, (0,), (1, 2, 3)]
         nnext = [8, (1, 2), (0, 3)]
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (8, 8, 7, 500))
+        self.assertEqual(self.amend_chunks(chunks), (16, 16, 2, 500))
 
         nProcs = 200
         current = [4, (0,), (1, 2, 3)]
         nnext = [8, (1, 2), (0, 3)]
         chunking = self.create_chunking_instance(current, nnext, nProcs)
         chunks = chunking._calculate_chunking(shape, np.float32)
-        self.assertEqual(self.amend_chunks(chunks), (4, 8, 15, 500))
+        self.assertEqual(self.amend_chunks(chunks), (4, 64, 2, 500))
+
+    def test_block_size(self):
+        current = [1, (0,), (1, 2)]
+        nnext = [1, (1,), (0, 2)]
+        shape = (5000, 500, 500)
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        chunks = chunking._calculate_chunking(shape, np.float32)
+        self.assertEqual(chunks, (16, 32, 500))
+
+        # smaller blocks make small chunks cheaper to read
+        chunking = self.create_chunking_instance(current, nnext, 1, 4096)
+        chunks = chunking._calculate_chunking(shape, np.float32)
+        self.assertEqual(chunks, (1, 2, 500))
+
+        chunking = self.create_chunking_instance(current, nnext, 1)
+        self.assertEqual(chunking._calculate_chunking((50, 300), np.float32),
+                         True)
+
+    def test_chunk_cache(self):
+        current = [1, (0,), (1, 2)]
+        nnext = [1, (1,), (0, 2)]
+        shape = (5000, 500, 500)
+        # chunks that fit in a larger chunk cache are read once
+        chunking = self.create_chunking_instance(current, nnext, 1,
+                                                 chunk_cache=None)
+        self.assertEqual(chunking.cache_size, 256*1024**2)
+        chunks = chunking._calculate_chunking(shape, np.float32)
+        self.assertGreater(np.prod(chunks), 16*32*500)
 
 if __name__ == "__main__":
     unittest.main()
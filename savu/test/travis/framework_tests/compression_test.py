@@ -0,0 +1,199 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: compression_test
+   :platform: Unix
+   :synopsis: Tests for compressed output datasets.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from distutils.spawn import find_executable
+import h5py
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+from savu.data.compression import parse_compression, CompressedWriter
+
+
+class _Data(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_name(self):
+        return 'test'
+
+
+class _Experiment(object):
+    def __init__(self):
+        from savu.data.meta_data import MetaData
+        self.meta_data = MetaData({'process_names': 'CPU0'})
+
+
+def _run(out_path, compression, process_names='CPU0', **kwargs):
+    """ Run the no_process_plugin twice on mm.nxs, writing to out_path. """
+    data_file = tu.get_test_data_path('mm.nxs')
+    options = tu.set_options(data_file, out_path=out_path,
+                             process_names=process_names)
+    options['loader'] = \
+        'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+    options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+    options['compression'] = compression
+    options.update(kwargs)
+    plugin = 'savu.plugins.filters.no_process_plugin'
+    data = {'in_datasets': [], 'out_datasets': []}
+    run_protected_plugin_runner_no_process_list(
+        options, [plugin]*2, data=[{}, data, data, {}])
+
+
+def _mpirun(out_path, compression, **kwargs):
+    """ Run _run on two processes, returning the exit code and output. """
+    script = "from savu.test.travis.framework_tests.compression_test " \
+        "import _run; _run(%r, %r, 'CPU0,CPU1', **%r)" % \
+        (out_path, compression, kwargs)
+    # os.environ leaves out the variables set by initialising MPI in this
+    # process, which would stop mpirun
+    proc = subprocess.Popen(
+        ['mpirun', '-np', '2', sys.executable, '-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        env=dict(os.environ))
+    output = proc.communicate()[0]
+    return proc.returncode, output
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_parse_compression(self):
+        self.assertEqual(parse_compression('gzip'), {None: ('gzip', 4)})
+        self.assertEqual(parse_compression('tomo=gzip:6, lz4'),
+                         {'tomo': ('gzip', 6), None: ('lz4', None)})
+        self.assertEqual(parse_compression('tomo=none'),
+                         {'tomo': (None, None)})
+        self.assertRaises(ValueError, parse_compression, 'zip')
+
+    def test_direct_chunk_write(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            expected = np.random.rand(10, 7, 9).astype(np.float32)
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as f:
+                dset = f.create_dataset('data', (10, 7, 9), np.float32,
+                                        chunks=(4, 7, 9), compression='gzip',
+                                        compression_opts=4, shuffle=True)
+                writer = CompressedWriter(_Experiment(), [_Data(dset)])
+                # chunk aligned blocks (including the edge chunk), then an
+                # unaligned block through the filter pipeline
+                for sl in [slice(0, 4), slice(4, 8), slice(8, 10)]:
+                    writer.write(0, (sl,), expected[sl])
+                self.assertTrue(writer.direct[0])
+                writer.write(0, (slice(1, 3),), expected[1:3]*2)
+                writer.close('test')
+            expected[1:3] *= 2
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'r') as f:
+                self.assertTrue(np.array_equal(f['data'][...], expected))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_direct_filters(self):
+        # only gzip, with or without shuffle, is compressed on threads
+        tmpdir = tempfile.mkdtemp()
+        try:
+            expected = np.random.rand(8, 7, 9).astype(np.float32)
+            for kwargs, direct in [({}, True), ({'shuffle': True}, True),
+                                   ({'shuffle': True, 'fletcher32': True},
+                                    False)]:
+                with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as f:
+                    dset = f.create_dataset('data', (8, 7, 9), np.float32,
+                                            chunks=(4, 7, 9),
+                                            compression='gzip', **kwargs)
+                    writer = CompressedWriter(_Experiment(), [_Data(dset)])
+                    self.assertEqual(writer.direct[0], direct)
+                    writer.write(0, (slice(0, 8),), expected)
+                    writer.close('test')
+                with h5py.File(os.path.join(tmpdir, 'test.h5'), 'r') as f:
+                    self.assertTrue(np.array_equal(f['data'][...], expected))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_single_chunk_write(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            expected = np.random.rand(10, 7, 9).astype(np.float32)
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as f:
+                dset = f.create_dataset('data', (10, 7, 9), np.float32,
+                                        chunks=(10, 7, 9), compression='gzip')
+                writer = CompressedWriter(_Experiment(), [_Data(dset)])
+                self.assertFalse(writer.direct[0])
+                writer.write(0, (slice(0, 10),), expected)
+                writer.close('test')
+                # read while the dataset is still open
+                self.assertTrue(np.array_equal(dset[...], expected))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def __read(self, out_path, fname='NXstxm_p2_no_process_plugin.h5'):
+        with h5py.File(os.path.join(out_path, fname), 'r') as f:
+            dset = f[f.keys()[0]]['data']
+            return dset[...], dset.compression
+
+    def __get_result(self, compression):
+        out_path = tempfile.mkdtemp()
+        _run(out_path, compression)
+        return self.__read(out_path)
+
+    def test_compressed_output(self):
+        expected, compression = self.__get_result(None)
+        self.assertEqual(compression, None)
+        result, compression = self.__get_result('gzip:1')
+        self.assertEqual(compression, 'gzip')
+        self.assertTrue(np.array_equal(result, expected))
+
+    @unittest.skipUnless(h5py.get_config().mpi and find_executable('mpirun'),
+                         "requires parallel h5py and mpirun")
+    def test_mpi_compressed_output(self):
+        expected, _ = self.__get_result(None)
+        # a file shared by both processes, written collectively
+        out_path = tempfile.mkdtemp()
+        code, output = _mpirun(out_path, 'gzip:1')
+        self.assertEqual(code, 0, output)
+        result, compression = self.__read(out_path)
+        self.assertEqual(compression, 'gzip')
+        self.assertTrue(np.array_equal(result, expected))
+        # a file per process with directly written chunks, joined by a
+        # virtual dataset
+        out_path = tempfile.mkdtemp()
+        code, output = _mpirun(out_path, 'gzip:1', vds=True)
+        self.assertEqual(code, 0, output)
+        result, _ = self.__read(out_path)
+        self.assertTrue(np.array_equal(result, expected))
+        _, compression = self.__read(
+            out_path, 'NXstxm_p2_no_process_plugin_000.h5')
+        self.assertEqual(compression, 'gzip')
+        # a shared file can not be written collectively with dynamic
+        # scheduling
+        code, output = _mpirun(tempfile.mkdtemp(), 'gzip:1', dynamic_chunk=1)
+        self.assertNotEqual(code, 0)
+        self.assertIn('Use the vds option', output)
+
+if __name__ == "__main__":
+    unittest.main()
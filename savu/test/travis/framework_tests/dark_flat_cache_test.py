@@ -0,0 +1,108 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: dark_flat_cache_test
+   :platform: Unix
+   :synopsis: Tests for the cache of dark and flat field averages.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+import savu.data.dark_flat_cache as dfc
+from savu.data.meta_data import MetaData
+from savu.data.data_structures.data_types.data_plus_darks_and_flats import \
+    ImageKey
+
+
+class _Experiment(object):
+    def __init__(self, cache):
+        self.meta_data = MetaData({'cache': cache})
+
+
+class _Data(object):
+    def __init__(self, data, cache):
+        self.data = data
+        self.exp = _Experiment(cache)
+        self.meta_data = MetaData()
+
+    def get_preview(self):
+        raise AttributeError('no preview')
+
+
+class DarkFlatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'test.h5')
+        self.key = np.array([2]*2 + [1]*3 + [0]*10 + [1]*3)
+        self.data = np.random.rand(len(self.key), 4, 5).astype(np.float32)
+        self.__write()
+        dfc._memory.clear()
+
+    def tearDown(self):
+        dfc._memory.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self):
+        with h5py.File(self.filename, 'w') as f:
+            f['data'] = self.data
+
+    def __means(self, cache):
+        with h5py.File(self.filename, 'r') as f:
+            data_obj = _Data(f['data'], cache)
+            image_key = ImageKey(data_obj, self.key, 0)
+            data_obj.data = image_key
+            image_key.dark_flat_slice_list = (slice(None),)*3
+            return image_key.dark_mean(), image_key.flat_mean()
+
+    def test_cache(self):
+        mtime = int(os.path.getmtime(self.filename))
+        os.utime(self.filename, (mtime, mtime))
+        dark, flat = self.__means(self.cache)
+        self.assertTrue(np.allclose(dark, self.data[0:2].mean(0)))
+        self.assertTrue(np.allclose(flat, self.data[self.key == 1].mean(0)))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache,
+                                                     'dark_flat'))), 2)
+
+        # from the cache directory, not the (changed) file with the same
+        # modification time
+        dfc._memory.clear()
+        self.data[0:2] = 0
+        self.__write()
+        os.utime(self.filename, (mtime, mtime))
+        self.assertTrue(np.array_equal(self.__means(self.cache)[0], dark))
+
+        # a modified file is read again
+        dfc._memory.clear()
+        os.utime(self.filename, (mtime + 1, mtime + 1))
+        self.assertTrue(np.all(self.__means(self.cache)[0] == 0))
+
+    def test_memory(self):
+        dark = self.__means(None)[0]
+        dark[...] = -1
+        self.assertEqual(len(dfc._memory), 2)
+        self.assertFalse(np.any(self.__means(None)[0] == -1))
+
+if __name__ == "__main__":
+    unittest.main()
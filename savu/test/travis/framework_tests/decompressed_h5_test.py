@@ -0,0 +1,196 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: decompressed_h5_test
+   :platform: Unix
+   :synopsis: Tests for reading compressed hdf5 datasets by decompressing \
+       raw chunks on a pool of threads.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import zlib
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.data.meta_data import MetaData
+from savu.data.compression import get_decoders, decode_chunk, _shuffle
+from savu.data.data_structures.data_types.decompressed_h5 import \
+    decompressed_h5, DecompressedH5, _can_read_raw_chunks
+
+# the filters the stubbed raw chunks can be encoded with
+_ENCODERS = {
+    h5py.h5z.FILTER_DEFLATE: lambda data, cd: zlib.compress(data, cd[0]),
+    h5py.h5z.FILTER_SHUFFLE: lambda data, cd: _shuffle(
+        np.frombuffer(data, dtype=cd[0])),
+    h5py.h5z.FILTER_FLETCHER32: lambda data, cd: data + b'\0'*4}
+
+
+class _Experiment(object):
+    def __init__(self, chunk_cache=None):
+        self.meta_data = MetaData({'process_names': 'CPU0,CPU1',
+                                   'chunk_cache': chunk_cache})
+
+
+class _RawChunks(object):
+    """ Stands in for the identifier of an hdf5 dataset, returning its chunks
+    encoded as hdf5 stores them, for h5py builds that cannot read raw
+    chunks.  Chunks holding only the fill value are unwritten.
+    """
+
+    def __init__(self, dataset):
+        self.data = dataset[...]
+        self.chunks = dataset.chunks
+        self.fillvalue = dataset.fillvalue
+        self.storage_size = dataset.id.get_storage_size()
+        dcpl = dataset.id.get_create_plist()
+        self.filters = [dcpl.get_filter(i)[::2]
+                        for i in range(dcpl.get_nfilters())]
+
+    def read_direct_chunk(self, offset):
+        chunk = np.empty(self.chunks, dtype=self.data.dtype)
+        chunk.fill(self.fillvalue)
+        block = self.data[tuple(slice(o, o + c) for o, c in
+                                zip(offset, self.chunks))]
+        if np.all(block == self.fillvalue):
+            raise RuntimeError("Chunk %s is not allocated" % (offset,))
+        chunk[tuple(slice(0, s) for s in block.shape)] = block
+        data = chunk.tobytes()
+        for code, cd_values in self.filters:
+            cd_values = (chunk.dtype,) if code == h5py.h5z.FILTER_SHUFFLE \
+                else cd_values
+            data = _ENCODERS[code](data, cd_values)
+        return 0, data
+
+    def get_storage_size(self):
+        return self.storage_size
+
+
+class _Dataset(object):
+    """ An h5py dataset read through stubbed raw chunks. """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.id = _RawChunks(dataset)
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def __getitem__(self, idx):
+        return self.dataset[idx]
+
+
+def _decompressed(dataset, exp=None):
+    """ Read dataset through a DecompressedH5 object, with stubbed raw
+    chunks if this h5py cannot read them.  The dataset is returned if it
+    cannot be decoded, as by decompressed_h5.
+    """
+    exp = exp if exp else _Experiment()
+    if _can_read_raw_chunks():
+        return decompressed_h5(exp, dataset)
+    decoders = get_decoders(dataset)
+    if not decoders or any(code not in _ENCODERS for code, _ in
+                           _RawChunks(dataset).filters):
+        return dataset
+    return DecompressedH5(exp, _Dataset(dataset), decoders)
+
+
+class DecompressedH5Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.h5')
+        self.expected = \
+            np.random.randint(0, 4000, (13, 7, 9)).astype(np.uint16)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __open(self, **kwargs):
+        with h5py.File(self.filename, 'w') as f:
+            f.create_dataset('data', data=self.expected, chunks=(4, 3, 9),
+                             **kwargs)
+            f.create_dataset('empty', (8, 8), np.float32, chunks=(4, 4),
+                             compression='gzip', fillvalue=3)
+            partial = f.create_dataset('partial', (8, 8), np.float32,
+                                       chunks=(4, 4), compression='gzip')
+            partial[0:4, 0:4] = 1
+        return h5py.File(self.filename, 'r')
+
+    def __check(self, data, expected):
+        for idx in [(slice(None),), (slice(2, 3),), 5, (slice(None), 4),
+                    (slice(1, 12, 3), slice(None), slice(2, 8)),
+                    ([0, 2, 3, 9, 12], slice(None), slice(1, 2)),
+                    (slice(None), slice(-3, None), -1)]:
+            self.assertTrue(np.array_equal(data[idx], expected[idx]))
+
+    def test_filters(self):
+        for kwargs in [{'compression': 'gzip', 'shuffle': True,
+                        'fletcher32': True}, {'compression': 'lzf'}]:
+            with self.__open(**kwargs) as f:
+                data = _decompressed(f['data'])
+                if not isinstance(data, DecompressedH5):
+                    # no decoder for this filter is installed
+                    continue
+                self.__check(data, self.expected)
+                self.assertEqual(data.name, '/data')
+
+    def test_cache(self):
+        with self.__open(compression='gzip') as f:
+            data = _decompressed(f['data'])
+            data[0:4]
+            data[2:6]
+            # chunks decompressed, chunks found in the cache
+            self.assertEqual(data.stats[2:4], [6, 3])
+
+    def test_unwritten(self):
+        with self.__open(compression='gzip') as f:
+            data = _decompressed(f['empty'])
+            self.assertTrue(np.all(data[:] == 3))
+            data = _decompressed(f['partial'])
+            self.assertTrue(np.array_equal(data[:], f['partial'][...]))
+
+    def test_no_cache(self):
+        with self.__open(compression='gzip') as f:
+            data = _decompressed(f['data'], _Experiment(1e-6))
+            self.__check(data, self.expected)
+            self.assertFalse(data.cache)
+
+    def test_decode(self):
+        # chunks as written directly by the CompressedWriter
+        with self.__open(compression='gzip', shuffle=True) as f:
+            decoders = get_decoders(f['data'])
+        chunk = self.expected[0:4, 0:3]
+        data = zlib.compress(_shuffle(chunk), 4)
+        decoded = decode_chunk(data, 0, decoders, chunk.nbytes, chunk.dtype)
+        self.assertTrue(np.array_equal(
+            np.frombuffer(decoded, chunk.dtype).reshape(chunk.shape), chunk))
+        # the filter was skipped for this chunk
+        decoded = decode_chunk(_shuffle(chunk), 2, decoders, chunk.nbytes,
+                               chunk.dtype)
+        self.assertEqual(decoded, chunk.tobytes())
+
+    def test_uncompressed(self):
+        with self.__open() as f:
+            self.assertIsInstance(decompressed_h5(_Experiment(), f['data']),
+                                  h5py.Dataset)
+
+if __name__ == "__main__":
+    unittest.main()
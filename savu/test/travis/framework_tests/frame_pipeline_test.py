@@ -0,0 +1,71 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_pipeline_test
+   :platform: Unix
+   :synopsis: Tests for the read-ahead/write-behind frame pipeline.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+
+from savu.test import test_utils as tu
+from savu.core.frame_pipeline import FramePipeline
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class FramePipelineTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        written = []
+        pipeline = FramePipeline(2)
+        pipeline.run(range(20), lambda c: c*2, lambda c, d: d + 1,
+                     lambda c, r: written.append((c, r)))
+        self.assertEqual(written, [(c, c*2 + 1) for c in range(20)])
+        self.assertEqual(sorted(pipeline.stalls.keys()),
+                         ['process', 'read', 'write'])
+
+    def test_exception_is_raised(self):
+        def process(count, data):
+            if count == 5:
+                raise ValueError("failed frame")
+            return data
+
+        pipeline = FramePipeline(1)
+        with self.assertRaises(ValueError):
+            pipeline.run(range(20), lambda c: c, process, lambda c, r: None)
+
+    def test_read_exception_is_raised(self):
+        def read(count):
+            if count == 3:
+                raise IOError("failed read")
+            return count
+
+        pipeline = FramePipeline(4)
+        with self.assertRaises(IOError):
+            pipeline.run(range(20), read, lambda c, d: d, lambda c, r: None)
+
+    def test_pipelined_process_list(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        process_file = tu.get_test_process_path('stats_test.nxs')
+        options = tu.set_options(data_file, process_file=process_file)
+        options['pipeline_depth'] = 2
+        run_protected_plugin_runner(options)
+
+if __name__ == "__main__":
+    unittest.main()
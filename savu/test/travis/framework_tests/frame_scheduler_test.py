@@ -0,0 +1,64 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: frame_scheduler_test
+   :platform: Unix
+   :synopsis: Tests for the dynamic frame scheduler.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+from mpi4py import MPI
+
+from savu.test import test_utils as tu
+from savu.core.frame_scheduler import FrameScheduler
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class FrameSchedulerTest(unittest.TestCase):
+
+    def test_claim_all_frames(self):
+        scheduler = FrameScheduler(3, comm=MPI.COMM_SELF)
+        frames = list(scheduler.claim(10))
+        for frame in frames:
+            scheduler.record(frame, 0.1)
+        scheduler.close('test')
+        self.assertEqual(frames, range(10))
+        self.assertEqual(scheduler.frames, range(10))
+        self.assertEqual(sorted(scheduler.costs.keys()), range(10))
+
+    def test_claim_skip(self):
+        scheduler = FrameScheduler(3, comm=MPI.COMM_SELF)
+        frames = list(scheduler.claim(10, skip=lambda f: f in [2, 3, 7]))
+        scheduler.close('test')
+        self.assertEqual(frames, [0, 1, 4, 5, 6, 8, 9])
+        self.assertEqual(scheduler.frames, frames)
+
+    def test_invalid_chunk(self):
+        with self.assertRaises(ValueError):
+            FrameScheduler(0, comm=MPI.COMM_SELF)
+
+    def test_dynamic_process_list(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        process_file = tu.get_test_process_path('stats_test.nxs')
+        options = tu.set_options(data_file, process_file=process_file)
+        options['dynamic_chunk'] = 2
+        run_protected_plugin_runner(options)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: halo_cache_test
+   :platform: Unix
+   :synopsis: Tests for re-using the overlapping frames of padded blocks.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import h5py
+import numpy as np
+import scipy.signal.signaltools as sig
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class HaloCacheTest(unittest.TestCase):
+
+    def test_median_filter(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        plugin = 'savu.plugins.filters.median_filter'
+        params = {'in_datasets': [], 'out_datasets': [],
+                  'kernel_size': (5, 3, 3), 'pattern': 'PROJECTION'}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin], data=[{}, params, {}])
+
+        fname = [f for f in os.listdir(options['out_path'])
+                 if f.endswith('.h5')][0]
+        with h5py.File(os.path.join(options['out_path'], fname), 'r') as f:
+            result = f[f.keys()[0]]['data'][...]
+        with h5py.File(data_file, 'r') as f:
+            data = f['entry1/stxm_entry/data/data'][...]
+
+        padded = np.pad(data, ((2, 2), (0, 0), (0, 0)), mode='edge')
+        expected = sig.medfilt(padded, (5, 3, 3))[2:-2]
+        self.assertTrue(np.allclose(result, expected))
+
+if __name__ == "__main__":
+    unittest.main()
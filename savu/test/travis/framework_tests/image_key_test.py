@@ -0,0 +1,68 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: image_key_test
+   :platform: Unix
+   :synopsis: Tests for reading projections selected by an image key as \
+       runs of hyperslabs.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.data.data_structures.data_types.data_plus_darks_and_flats import \
+    ImageKey, _get_runs
+
+
+class _Data(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class ImageKeyTest(unittest.TestCase):
+
+    def test_runs(self):
+        self.assertEqual(_get_runs(np.array([1, 2, 3, 7, 9, 11, 12, 20])),
+                         [(0, 3, slice(1, 4, 1)), (3, 6, slice(7, 12, 2)),
+                          (6, 8, slice(12, 21, 8))])
+        self.assertEqual(_get_runs(np.array([4])), [(0, 1, slice(4, 5, 1))])
+
+    def test_read(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            key = np.array([2]*2 + [1]*3 + [0]*20 + [1]*3 + [0]*20 + [2]*2)
+            data = np.random.rand(len(key), 4, 5).astype(np.float32)
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as f:
+                f.create_dataset('data', data=data)
+                image_key = ImageKey(_Data(f['data']), key, 0)
+                expected = data[key == 0]
+                for idx in [(slice(None),), (slice(15, 30), slice(1, 3)),
+                            (slice(0, 40, 3), 2), (slice(18, 23), 1, 4),
+                            (7,), (slice(22, 23),)]:
+                    idx += (slice(None),)*(3 - len(idx))
+                    self.assertTrue(np.array_equal(image_key[idx],
+                                                   expected[idx]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
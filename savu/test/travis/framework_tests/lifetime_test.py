@@ -0,0 +1,101 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: lifetime_test
+   :platform: Unix
+   :synopsis: Tests for finding the last plugin to read each dataset.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from savu.test import test_utils as tu
+from savu.core.lifetime import get_releases
+from savu.data.transport_data.hdf5_transport_data import Hdf5TransportData
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+def _plugin(in_names, out_names):
+    return {'in_datasets': [{'name': n, 'pattern': {}} for n in in_names],
+            'out_datasets': [{'name': n, 'pattern': {}} for n in out_names]}
+
+
+class LifetimeTest(unittest.TestCase):
+
+    def test_chain(self):
+        # each plugin replaces tomo, so each version is read once
+        datasets = [_plugin(['tomo'], ['tomo'])]*3
+        self.assertEqual(get_releases(datasets, 1),
+                         {2: [(1, 'tomo')], 3: [(2, 'tomo')]})
+
+    def test_several_readers(self):
+        datasets = [_plugin(['tomo'], ['tomo']),
+                    _plugin(['tomo'], ['sino']),
+                    _plugin(['sino'], ['recon']),
+                    _plugin(['tomo', 'recon'], ['result'])]
+        self.assertEqual(get_releases(datasets, 2),
+                         {4: [(3, 'sino')], 5: [(2, 'tomo'), (4, 'recon')]})
+
+    def test_never_read(self):
+        # the final result and unused datasets are kept
+        datasets = [_plugin(['tomo'], ['tomo', 'centre']),
+                    _plugin(['tomo'], ['recon'])]
+        self.assertEqual(get_releases(datasets, 1), {2: [(1, 'tomo')]})
+
+    def test_two_passes(self):
+        # the plugins are set up in two passes, the first ending after the
+        # first plugin, whose output is read in the second
+        load_data = Hdf5TransportData._load_data.im_func
+
+        def split_load_data(data, start):
+            plugin_list = data.exp.meta_data.plugin_list
+            full = plugin_list.plugin_list
+            if start == plugin_list._get_n_loaders():
+                plugin_list.plugin_list = full[:start + 1] + full[-1:]
+            try:
+                return load_data(data, start)
+            finally:
+                plugin_list.plugin_list = full
+
+        tmpdir = tempfile.mkdtemp()
+        Hdf5TransportData._load_data = split_load_data
+        try:
+            options = tu.set_options(tu.get_test_data_path('mm.nxs'),
+                                     out_path=tmpdir)
+            options['loader'] = \
+                'savu.plugins.loaders.multi_modal_loaders.nxmonitor_loader'
+            options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+            options['delete_intermediates'] = True
+            plugin = 'savu.plugins.filters.no_process_plugin'
+            data = {'in_datasets': [], 'out_datasets': []}
+            run_protected_plugin_runner_no_process_list(
+                options, [plugin]*3, data=[{}, data, data, data, {}])
+            files = sorted(f for f in os.listdir(tmpdir)
+                           if f.endswith('.h5'))
+        finally:
+            Hdf5TransportData._load_data = load_data
+            shutil.rmtree(tmpdir)
+        # only the final result is kept
+        self.assertEqual(len(files), 1)
+        self.assertIn('_p3_', files[0])
+
+if __name__ == "__main__":
+    unittest.main()
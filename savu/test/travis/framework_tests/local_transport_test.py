@@ -0,0 +1,76 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: local_transport_test
+   :platform: Unix
+   :synopsis: Tests for the local (multi-process, no MPI) transport.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import h5py
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner, run_protected_plugin_runner_no_process_list
+
+
+class LocalTransportTest(unittest.TestCase):
+
+    def __get_results(self, transport, **kwargs):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file, transport=transport)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        options.update(kwargs)
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin]*2, data=[{}, data, data, {}])
+        # the files written by each worker are joined in the output file
+        results, sources = {}, set()
+        for fname in os.listdir(options['out_path']):
+            if fname.endswith('.h5'):
+                with h5py.File(os.path.join(options['out_path'], fname),
+                               'r') as f:
+                    dset = f[f.keys()[0]]['data']
+                    results[fname] = dset[...]
+                    if dset.is_virtual:
+                        sources.update(os.path.basename(v.file_name) for v
+                                       in dset.virtual_sources())
+        return dict((k, v) for k, v in results.items() if k not in sources)
+
+    def test_stxm(self):
+        expected = self.__get_results('hdf5')
+        results = self.__get_results('local', local_workers=3)
+        self.assertEqual(sorted(results.keys()), sorted(expected.keys()))
+        for key in expected.keys():
+            self.assertTrue(np.array_equal(results[key], expected[key]))
+
+    def test_post_process_plugin(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        process_file = tu.get_test_process_path('stats_test.nxs')
+        options = tu.set_options(data_file, process_file=process_file,
+                                 transport='local')
+        options['local_workers'] = 2
+        run_protected_plugin_runner(options)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memmap_h5_test
+   :platform: Unix
+   :synopsis: Tests for reading hdf5 datasets through a memory map.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.data.data_structures.data_types.memmap_h5 import memmap_h5, \
+    MemmapH5
+
+
+class MemmapH5Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.h5')
+        self.expected = np.random.rand(6, 5, 4).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __read(self, **kwargs):
+        with h5py.File(self.filename, 'w', userblock_size=512) as f:
+            f.create_dataset('data', data=self.expected, **kwargs)
+            f.create_dataset('empty', (4, 4), np.float32)
+        return h5py.File(self.filename, 'r')
+
+    def test_contiguous(self):
+        with self.__read() as f:
+            data = memmap_h5(f['data'])
+            self.assertIsInstance(data, MemmapH5)
+            self.assertEqual(data.get_shape(), self.expected.shape)
+            self.assertEqual(data.dtype, np.float32)
+            for idx in [(slice(1, 3),), (slice(None), slice(2, 3)),
+                        (slice(0, 6, 2), slice(None), slice(1, 4))]:
+                self.assertTrue(np.array_equal(data[idx], self.expected[idx]))
+            # plugins may modify their input in place
+            frame = data[0:1]
+            frame[...] = 0
+            self.assertTrue(np.array_equal(data[0:1], self.expected[0:1]))
+            self.assertEqual(data.name, '/data')
+            # not allocated
+            self.assertNotIsInstance(memmap_h5(f['empty']), MemmapH5)
+
+    def test_chunked(self):
+        with self.__read(chunks=(1, 5, 4)) as f:
+            self.assertIsInstance(memmap_h5(f['data']), h5py.Dataset)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memory_transport_test
+   :platform: Unix
+   :synopsis: Tests for the in-memory transport of intermediate datasets.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
+
+
+class MemoryTransportTest(unittest.TestCase):
+
+    def test_mm(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        process_file = tu.get_test_process_path('MMtest.nxs')
+        options = tu.set_options(data_file, process_file=process_file,
+                                 transport='memory')
+        run_protected_plugin_runner(options)
+        h5_files = [f for f in os.listdir(options['out_path'])
+                    if f.endswith('.h5')]
+        self.assertEqual(len(h5_files), 1)
+
+    def test_stats(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        process_file = tu.get_test_process_path('stats_test.nxs')
+        options = tu.set_options(data_file, process_file=process_file,
+                                 transport='memory')
+        run_protected_plugin_runner(options)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,10 +23,16 @@
 
 """
 
+import os
 import unittest
+import h5py
+import numpy as np
 
 import savu.plugins.utils as pu
 import savu.test.test_utils as tu
+from savu.plugins.filters.band_pass import BandPass
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner
 
 
 class MultipleParameterTest(unittest.TestCase):
@@ -96,6 +102,29 @@ class MultipleParameterTest(unittest.TestCase):
         out_dataset = plugin.get_out_datasets()[0]
         self.assertEqual((160, 1, 160, 3, 2), out_dataset.get_shape())
 
+    def __run_band_pass(self, params, one_pass=True):
+        options = tu.set_experiment('tomo')
+        plugin = 'savu.plugins.filters.band_pass'
+        params.update({'in_datasets': ['tomo'], 'out_datasets': ['tomo']})
+        tu.set_plugin_list(options, plugin, [{}, params, {}])
+        BandPass.tune_in_one_pass = one_pass
+        try:
+            run_protected_plugin_runner(options)
+        finally:
+            del BandPass.tune_in_one_pass
+        h5_file = [f for f in os.listdir(options['out_path'])
+                   if f.endswith('.h5')][0]
+        with h5py.File(os.path.join(options['out_path'], h5_file), 'r') as f:
+            return f[f.keys()[0]]['data'][...]
+
+    def test_parameter_tuning_in_one_pass(self):
+        result = self.__run_band_pass({'type': 'High;Low'})
+        self.assertEqual(result.shape[-1], 2)
+        self.assertTrue(np.array_equal(
+            result, self.__run_band_pass({'type': 'High;Low'}, False)))
+        self.assertTrue(np.allclose(
+            result[..., 1], self.__run_band_pass({'type': 'Low'})))
+
 #    def test_parameter_space_full_run(self):
 #        options = self.framework_options_setup()
 #        tu.plugin_runner_real_plugin_run(options)
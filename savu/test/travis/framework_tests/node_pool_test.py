@@ -0,0 +1,105 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: node_pool_test
+   :platform: Unix
+   :synopsis: Tests for sharing blocks of frames between the processes on a \
+       node.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import sys
+import unittest
+import threading
+import subprocess
+from distutils.spawn import find_executable
+import numpy as np
+from mpi4py import MPI
+
+from savu.core.node_pool import NodePool
+
+
+def _run_pool():
+    """ Run by every process under mpirun: the master maps a block whose
+    own share fails, then a block that succeeds, over a pool of all the
+    processes.
+    """
+    comm = MPI.COMM_WORLD
+    pool = NodePool(comm)
+
+    def double(data):
+        if data[0][0] < 0:
+            raise ValueError("negative frames")
+        return data[0]*2
+
+    if comm.rank == 0:
+        frames = np.arange(3.)
+        try:
+            pool.map(double, [[frames - 10]] + [[frames]]*(comm.size - 1))
+            raise AssertionError("The failure of the master was not raised")
+        except ValueError:
+            pass
+        results = pool.map(double, [[frames]]*comm.size)
+        assert all(np.array_equal(r, frames*2) for r in results)
+    else:
+        pool.serve(double)
+    pool.close()
+    comm.barrier()
+    if comm.rank == 0:
+        print("node pool completed")
+
+
+class NodePoolTest(unittest.TestCase):
+
+    def test_map(self):
+        pool = NodePool(MPI.COMM_SELF)
+        data = [np.arange(12.).reshape(3, 4), np.ones(3)]
+        results = pool.map(lambda d: [d[0]*2, d[1]], [data])
+        pool.close()
+        self.assertEqual(len(results), 1)
+        self.assertTrue(np.array_equal(results[0][0], data[0]*2))
+        self.assertTrue(np.array_equal(results[0][1], data[1]))
+
+    def test_too_many_blocks(self):
+        pool = NodePool(MPI.COMM_SELF)
+        with self.assertRaises(ValueError):
+            pool.map(lambda d: d[0], [[np.ones(2)], [np.ones(2)]])
+        pool.close()
+
+    @unittest.skipUnless(find_executable('mpirun'), "requires mpirun")
+    def test_master_failure(self):
+        script = "from savu.test.travis.framework_tests.node_pool_test " \
+            "import _run_pool; _run_pool()"
+        # os.environ leaves out the variables set by initialising MPI in this
+        # process, which would stop mpirun
+        proc = subprocess.Popen(
+            ['mpirun', '-np', '2', sys.executable, '-c', script],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            env=dict(os.environ))
+        # the processes would otherwise hang in the collective calls
+        timer = threading.Timer(120, proc.kill)
+        timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            timer.cancel()
+        self.assertEqual(proc.returncode, 0, output)
+        self.assertIn("node pool completed", output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: output_cache_test
+   :platform: Unix
+   :synopsis: Tests for the cache of plugin outputs between runs.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import savu.core.output_cache as oc
+from savu.test import test_utils as tu
+from savu.core.output_cache import get_keys
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+PLUGIN = 'savu.plugins.filters.no_process_plugin'
+
+
+class OutputCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __get_keys(self, params):
+        plugin_list = [{'id': 'savu.plugins.loaders.nxtomo_loader',
+                        'data': {'preview': []}}]
+        plugin_list += [{'id': PLUGIN, 'data': p} for p in params]
+        tomo = [{'name': 'tomo'}]
+        datasets_list = [{'in_datasets': tomo, 'out_datasets': tomo}] * \
+            len(params)
+        return get_keys(tu.get_test_data_path('mm.nxs'), plugin_list,
+                        datasets_list, 1)
+
+    def test_keys(self):
+        keys = self.__get_keys([{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertEqual(sorted(keys), [1, 2, 3])
+        self.assertEqual(len(set(keys.values())), 3)
+        self.assertEqual(keys, self.__get_keys([{'a': 1}, {'a': 2},
+                                                {'a': 3}]))
+        # only the plugins after the change are affected
+        changed = self.__get_keys([{'a': 1}, {'a': 4}, {'a': 3}])
+        self.assertEqual(changed[1], keys[1])
+        self.assertNotEqual(changed[2], keys[2])
+        self.assertNotEqual(changed[3], keys[3])
+
+    def test_version(self):
+        keys = self.__get_keys([{'a': 1}])
+        get_source_digest = oc._get_source_digest
+
+        def changed(module):
+            digest = get_source_digest(module)
+            return 'changed' if module == \
+                'savu.plugins.driver.cpu_plugin' else digest
+
+        # a change to the driver of a plugin (a base class) changes its key
+        oc._versions.clear()
+        oc._get_source_digest = changed
+        try:
+            self.assertNotEqual(self.__get_keys([{'a': 1}])[1], keys[1])
+        finally:
+            oc._get_source_digest = get_source_digest
+            oc._versions.clear()
+        self.assertEqual(self.__get_keys([{'a': 1}]), keys)
+
+    def __run(self, folder, **kwargs):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file, out_path=os.path.join(
+            self.tmpdir, folder))
+        os.makedirs(options['out_path'])
+        options['cache'] = self.cache
+        options.update(kwargs)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxmonitor_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [PLUGIN]*3, data=[{}, data, data, data, {}])
+        return dict((f, os.stat(os.path.join(options['out_path'], f)))
+                    for f in os.listdir(options['out_path'])
+                    if f.endswith('.h5'))
+
+    def __get_cached(self):
+        path = os.path.join(self.cache, 'outputs')
+        return dict((f, os.stat(os.path.join(path, key, f))) for key in
+                    os.listdir(path) for f in os.listdir(os.path.join(
+                        path, key)) if f.endswith('.h5'))
+
+    def test_reuse(self):
+        first = self.__run('first')
+        cached = self.__get_cached()
+        self.assertEqual(sorted(cached), sorted(first))
+
+        second = self.__run('second')
+        self.assertEqual(sorted(second), sorted(first))
+        for name, stat in second.items():
+            # the output files are the cached files
+            self.assertEqual(stat.st_ino, cached[name].st_ino)
+            self.assertEqual(stat.st_nlink, 3)
+
+    def test_reuse_virtual(self):
+        # the local workers' files, joined by a virtual dataset, are cached
+        # with the output file
+        first = self.__run('first', transport='local', local_workers=2)
+        self.assertGreater(len(first), 3)
+        cached = self.__get_cached()
+        self.assertEqual(sorted(cached), sorted(first))
+
+        second = self.__run('second', transport='local', local_workers=2)
+        self.assertEqual(sorted(second), sorted(first))
+        for name, stat in second.items():
+            self.assertEqual(stat.st_ino, cached[name].st_ino)
+
+    def test_eviction(self):
+        self.__run('first', cache_size=1e-12)
+        # only the entry of the last plugin, just added, is kept
+        self.assertEqual(len(os.listdir(os.path.join(self.cache,
+                                                     'outputs'))), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: partition_test
+   :platform: Unix
+   :synopsis: Tests for splitting frames between processes at chunk \
+       boundaries.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.core.partition import Partition
+from savu.data.data_structures.slice_list import SliceList
+
+
+class _Data(object):
+    def __init__(self, dset, dim):
+        self.data = dset
+        n = dset.shape[dim]
+        self.slice_list = SliceList(
+            [slice(None)]*len(dset.shape), [dim], np.arange(n)[:, None],
+            np.arange(1, n + 1)[:, None], np.ones((n, 1)))
+
+    def get_name(self):
+        return self.data.name
+
+    def get_shape(self):
+        return self.data.shape
+
+    def _get_full_slice_list(self):
+        return self.slice_list
+
+
+class PartitionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.f = h5py.File(os.path.join(self.tmpdir, 'test.h5'), 'w')
+
+    def tearDown(self):
+        self.f.close()
+        shutil.rmtree(self.tmpdir)
+
+    def __data(self, name, chunks):
+        return _Data(self.f.create_dataset(name, (100, 8, 8), np.float32,
+                                           chunks=chunks), 0)
+
+    def test_chunk_aligned(self):
+        in_data = self.__data('in', (10, 8, 8))
+        out_data = self.__data('out', (5, 8, 8))
+        partition = Partition([in_data, out_data], 4)
+        self.assertEqual(list(partition.even), [0, 25, 50, 75, 100])
+        self.assertEqual(list(partition.bounds), [0, 20, 50, 70, 100])
+        self.assertEqual(list(partition.get_frames(1)), range(20, 50))
+
+    def test_fewest_shared(self):
+        # only the output can be aligned within the tolerance
+        in_data = self.__data('in', (50, 8, 8))
+        out_data = self.__data('out', (4, 8, 8))
+        partition = Partition([in_data, out_data], 4)
+        self.assertEqual(list(partition.bounds), [0, 24, 50, 76, 100])
+
+    def test_even_split(self):
+        unchunked = _Data(self.f.create_dataset('in', (100, 8, 8),
+                                                np.float32), 0)
+        partition = Partition([unchunked], 3)
+        self.assertEqual(list(partition.bounds), [0, 34, 67, 100])
+        # no chunk boundary within the tolerance
+        partition = Partition([self.__data('out', (64, 8, 8))], 4)
+        self.assertEqual(list(partition.bounds), [0, 25, 50, 75, 100])
+
+    def test_single_chunk(self):
+        # every boundary shares the single chunk of the input
+        in_data = self.__data('in', (100, 1, 8))
+        out_data = self.__data('out', (10, 8, 8))
+        partition = Partition([in_data, out_data], 2)
+        self.assertEqual(list(partition.bounds), [0, 50, 100])
+        partition = Partition([in_data, out_data], 3)
+        self.assertEqual(list(partition.bounds), [0, 30, 70, 100])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: plugin_fusion_test
+   :platform: Unix
+   :synopsis: Tests for running chains of plugins fused in memory.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import h5py
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class PluginFusionTest(unittest.TestCase):
+
+    def __run_chain(self, fusion):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxmonitor_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        options['fusion'] = fusion
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        exp = run_protected_plugin_runner_no_process_list(
+            options, [plugin]*3, data=[{}, data, data, data, {}])
+        h5_files = sorted(f for f in os.listdir(options['out_path'])
+                          if f.endswith('.h5'))
+        with h5py.File(os.path.join(options['out_path'], h5_files[-1]),
+                       'r') as f:
+            result = f[f.keys()[0]]['data'][...]
+        return exp, h5_files, result
+
+    def test_fused_chain(self):
+        exp, h5_files, result = self.__run_chain(True)
+        self.assertEqual(exp.meta_data.plugin_list._get_fused_chains(),
+                         {1: 3})
+        self.assertEqual(len(h5_files), 1)
+
+        _, unfused_files, unfused_result = self.__run_chain(False)
+        self.assertEqual(len(unfused_files), 3)
+        self.assertEqual(h5_files[0], unfused_files[-1])
+        self.assertTrue(np.array_equal(result, unfused_result))
+
+if __name__ == "__main__":
+    unittest.main()
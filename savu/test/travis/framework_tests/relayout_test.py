@@ -0,0 +1,83 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: relayout_test
+   :platform: Unix
+   :synopsis: Tests for re-chunking datasets between plugins with different \
+       slice directions.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import h5py
+import numpy as np
+from mpi4py import MPI
+
+from savu.test import test_utils as tu
+from savu.core import relayout
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class RelayoutTest(unittest.TestCase):
+
+    def test_needs_relayout(self):
+        proj = {'PROJECTION': {'core_dir': (1, 2), 'slice_dir': (0,)}}
+        sino = {'SINOGRAM': {'core_dir': (0, 2), 'slice_dir': (1,)}}
+        self.assertTrue(relayout.needs_relayout(proj, sino))
+        self.assertFalse(relayout.needs_relayout(proj, proj))
+        self.assertFalse(relayout.needs_relayout(proj, []))
+
+    def test_transpose(self):
+        src = np.random.rand(13, 9, 5).astype(np.float32)
+        dst = np.zeros_like(src)
+        nbytes = relayout.transpose(src, dst, 0, 1, 4, comm=MPI.COMM_SELF)
+        self.assertTrue(np.array_equal(src, dst))
+        self.assertEqual(nbytes, src.nbytes)
+
+    def test_projection_to_sinogram(self):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        options['relayout'] = True
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = [{'in_datasets': [], 'out_datasets': [], 'pattern': pattern}
+                for pattern in ['PROJECTION', 'SINOGRAM']]
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin]*2, data=[{}] + data + [{}])
+
+        with h5py.File(data_file, 'r') as f:
+            expected = f['entry1/stxm_entry/data/data'][...]
+        for fname in os.listdir(options['out_path']):
+            if fname.endswith('.h5'):
+                with h5py.File(os.path.join(options['out_path'], fname),
+                               'r') as f:
+                    group = f[f.keys()[0]]
+                    self.assertFalse('data_relayout' in group)
+                    self.assertTrue(np.array_equal(group['data'][...],
+                                                   expected))
+                # the space of the dataset before the relayout is not kept
+                self.assertLess(os.path.getsize(os.path.join(
+                    options['out_path'], fname)), 1.5*expected.nbytes)
+        self.assertFalse([f for f in os.listdir(options['out_path'])
+                          if f.endswith('.relayout')])
+
+if __name__ == "__main__":
+    unittest.main()
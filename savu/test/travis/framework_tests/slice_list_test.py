@@ -0,0 +1,71 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: slice_list_test
+   :platform: Unix
+   :synopsis: Tests for the array backed slice list.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import unittest
+import numpy as np
+
+from savu.data.data_structures.slice_list import SliceList
+
+
+class SliceListTest(unittest.TestCase):
+
+    def __get_slice_list(self):
+        starts = np.array([[0, 5], [1, 5], [2, 6]])
+        return SliceList([slice(None), slice(0, 10, 1), slice(None)], [0, 2],
+                         starts, starts + 1, np.ones(starts.shape))
+
+    def test_entries(self):
+        sl = self.__get_slice_list()
+        self.assertEqual(len(sl), 3)
+        self.assertEqual(sl[1], (slice(1, 2, 1), slice(0, 10, 1),
+                                 slice(5, 6, 1)))
+        self.assertEqual(list(sl)[2], sl[2])
+
+    def test_slicing(self):
+        sl = self.__get_slice_list()
+        sub = sl[1:]
+        self.assertTrue(isinstance(sub, SliceList))
+        self.assertEqual(list(sub), list(sl)[1:])
+        self.assertEqual(len(sl[3:]), 0)
+
+    def test_new_dims(self):
+        sl = self.__get_slice_list()._take(np.array([0, 0, 2]))
+        col = sl._column(1)
+        sl.starts[:, col] = [0, 4, 0]
+        sl.stops[:, col] = [4, 8, 4]
+        sl.steps[:, col] = 0
+        self.assertEqual(sl[1], (slice(0, 1, 1), slice(4, 8, None),
+                                 slice(5, 6, 1)))
+        self.assertEqual(sl._remove_dim(1)[2], (slice(2, 3, 1),
+                                                slice(6, 7, 1)))
+
+    def test_template_dims(self):
+        sl = SliceList([slice(None), slice(2, None, 3)], [], np.zeros((2, 0)),
+                       np.zeros((2, 0)), np.zeros((2, 0)))
+        sl._column(0)
+        sl._column(1)
+        # the template values are kept until they are overwritten
+        self.assertEqual(sl[1], (slice(None), slice(2, None, 3)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: thread_pool_test
+   :platform: Unix
+   :synopsis: Tests for splitting blocks of frames between threads in thread \
+       safe plugins.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import unittest
+import h5py
+import numpy as np
+
+import savu.core.utils as cu
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+from savu.plugins.filters.no_process_plugin import NoProcessPlugin
+
+
+class ThreadPoolTest(unittest.TestCase):
+
+    def __get_result(self, threads):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        options['threads'] = threads
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin], data=[{}, data, {}])
+        fname = [f for f in os.listdir(options['out_path'])
+                 if f.endswith('.h5')][0]
+        with h5py.File(os.path.join(options['out_path'], fname), 'r') as f:
+            return f[f.keys()[0]]['data'][...]
+
+    def test_thread_safe_plugin(self):
+        calls = []
+        process_frames = NoProcessPlugin.process_frames.im_func
+
+        def record_call(plugin, data):
+            calls.append(data[0].shape)
+            return process_frames(plugin, data)
+
+        NoProcessPlugin.thread_safe = True
+        NoProcessPlugin.process_frames = record_call
+        try:
+            expected = self.__get_result(1)
+            nCalls = len(calls)
+            del calls[:]
+            result = self.__get_result(2)
+        finally:
+            NoProcessPlugin.thread_safe = False
+            NoProcessPlugin.process_frames = process_frames
+        # each multi-frame block is processed in two halves
+        self.assertTrue(len(calls) > nCalls)
+        self.assertTrue(np.array_equal(result, expected))
+
+    def test_get_thread_pool(self):
+        pool = cu.get_thread_pool(2)
+        self.assertIs(cu.get_thread_pool(2), pool)
+        self.assertIsNot(cu.get_thread_pool(3), pool)
+        # a forked process does not inherit the pool's threads, so has a
+        # pool of its own
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = cu.get_thread_pool(2)
+                ok = child is not pool and child.map(abs, [-1, 2]) == [1, 2]
+                os.write(write_fd, '1' if ok else '0')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read_fd, 1), '1')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: trace_test
+   :platform: Unix
+   :synopsis: Tests for the trace of the time spent in each step of a run.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from savu.test import test_utils as tu
+from savu.core.trace import get_trace_events, TRACE_FILE
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_trace_events(self):
+        records = [{'pid': 0, 'label': 'rank 0', 'start': 10.0,
+                    'threads': [(0, 'MainThread')],
+                    'events': [('read', 'io', 10.5, 0.25, 0, {'block': 0})]}]
+        events = get_trace_events(records)['traceEvents']
+        spans = [e for e in events if e['ph'] == 'X']
+        self.assertEqual(len(spans), 1)
+        self.assertEqual((spans[0]['ts'], spans[0]['dur']), (5e5, 2.5e5))
+        self.assertEqual(spans[0]['args'], {'block': 0})
+        names = [(e['name'], e['args']) for e in events if e['ph'] == 'M']
+        self.assertIn(('process_name', {'name': 'rank 0'}), names)
+        self.assertIn(('thread_name', {'name': 'MainThread'}), names)
+
+    def __run(self, **kwargs):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file, out_path=self.tmpdir)
+        options.update(kwargs)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxmonitor_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin]*2, data=[{}, data, data, {}])
+        return os.path.join(self.tmpdir, TRACE_FILE)
+
+    def test_no_trace(self):
+        self.assertFalse(os.path.exists(self.__run()))
+
+    def test_trace(self):
+        with open(self.__run(trace=True), 'r') as f:
+            events = json.load(f)['traceEvents']
+        names = set(e['name'] for e in events if e['ph'] == 'X')
+        for name in ['read', 'process_frames', 'write', 'create files',
+                     'NoProcessPlugin.process', 'NoProcessPlugin.setup']:
+            self.assertIn(name, names)
+        self.assertTrue(any(e['name'] == 'process_name' for e in events))
+        self.assertTrue(all(e['dur'] >= 0 for e in events if e['ph'] == 'X'))
+
+    def test_fused_chain(self):
+        with open(self.__run(trace=True, fusion=True), 'r') as f:
+            events = json.load(f)['traceEvents']
+        names = [e['name'] for e in events if e['ph'] == 'X']
+        # the fused plugins are run through the driver
+        for method in ['pre_process', 'post_process']:
+            self.assertEqual(names.count('NoProcessPlugin.' + method), 2)
+        self.assertIn('NoProcessPlugin+NoProcessPlugin.process', names)
+
+    def test_local_workers(self):
+        with open(self.__run(trace=True, transport='local',
+                             local_workers=2), 'r') as f:
+            events = json.load(f)['traceEvents']
+        # each worker has a track of its own, on which the frames are read
+        workers = set(e['pid'] for e in events if e['name'] ==
+                      'process_name' and 'worker' in e['args']['name'])
+        self.assertEqual(workers, set([1000, 1001]))
+        pids = set(e['pid'] for e in events if e['name'] == 'read')
+        self.assertTrue(pids and pids.issubset(workers))
+        # and the files holding the workers' spans are removed
+        self.assertEqual([f for f in os.listdir(self.tmpdir) if
+                          f.startswith('trace_')], [])
+
+if __name__ == "__main__":
+    unittest.main()
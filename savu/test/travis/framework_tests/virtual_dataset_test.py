@@ -0,0 +1,78 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: virtual_dataset_test
+   :platform: Unix
+   :synopsis: Tests for output datasets written to a file per process and \
+       joined by a virtual dataset.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import re
+import unittest
+import h5py
+import numpy as np
+
+from savu.test import test_utils as tu
+from savu.test.travis.framework_tests.plugin_runner_test import \
+    run_protected_plugin_runner_no_process_list
+from savu.data.virtual_dataset import _merge
+
+
+class VirtualDatasetTest(unittest.TestCase):
+
+    def test_merge(self):
+        a = ((0, 4, 1), (0, 10, 1))
+        self.assertEqual(_merge(a, ((4, 6, 1), (0, 10, 1))),
+                         ((0, 6, 1), (0, 10, 1)))
+        self.assertEqual(_merge(a, ((5, 6, 1), (0, 10, 1))), None)
+        self.assertEqual(_merge(a, ((4, 6, 1), (0, 5, 1))), None)
+
+    def __get_result(self, vds, compression=None):
+        data_file = tu.get_test_data_path('mm.nxs')
+        options = tu.set_options(data_file)
+        options['loader'] = \
+            'savu.plugins.loaders.multi_modal_loaders.nxstxm_loader'
+        options['saver'] = 'savu.plugins.savers.hdf5_tomo_saver'
+        options['vds'] = vds
+        options['compression'] = compression
+        plugin = 'savu.plugins.filters.no_process_plugin'
+        data = {'in_datasets': [], 'out_datasets': []}
+        run_protected_plugin_runner_no_process_list(
+            options, [plugin]*2, data=[{}, data, data, {}])
+        files = os.listdir(options['out_path'])
+        sources = [f for f in files if re.search(r'_\d{3}\.h5$', f)]
+        # the output of the final plugin
+        fname = sorted(f for f in files if f.endswith('.h5') and
+                       f not in sources)[-1]
+        with h5py.File(os.path.join(options['out_path'], fname), 'r') as f:
+            dset = f[f.keys()[0]]['data']
+            return dset[...], dset.is_virtual, sources
+
+    def test_virtual_output(self):
+        expected, virtual, sources = self.__get_result(False)
+        self.assertFalse(virtual)
+        self.assertEqual(sources, [])
+        for compression in [None, 'gzip']:
+            result, virtual, sources = self.__get_result(True, compression)
+            self.assertTrue(virtual)
+            self.assertEqual(len(sources), 2)  # one per plugin
+            self.assertTrue(np.array_equal(result, expected))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: write_buffer_test
+   :platform: Unix
+   :synopsis: Tests for the aggregation of writes into chunk aligned blocks.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from savu.data.write_buffer import WriteBuffer
+from savu.data.compression import CompressedWriter
+from savu.data.meta_data import MetaData
+
+
+class _Data(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_name(self):
+        return 'test'
+
+
+class _Experiment(object):
+    def __init__(self):
+        self.meta_data = MetaData({'process_names': 'CPU0'})
+
+
+class WriteBufferTest(unittest.TestCase):
+
+    def __written(self, ready):
+        return [tuple((sl.start, sl.stop) for sl in s) for s, b in ready]
+
+    def test_whole_chunks(self):
+        buf = WriteBuffer((10, 4, 5), (3, 4, 5), np.float32)
+        written = []
+        for i in range(10):
+            written += self.__written(buf.add((slice(i, i + 1),),
+                                              np.ones((1, 4, 5))))
+        self.assertEqual([w[0] for w in written],
+                         [(0, 3), (3, 6), (6, 9), (9, 10)])
+        self.assertEqual(buf.flush(), [])
+
+    def test_two_slice_directions(self):
+        # frames ordered by the first slice direction, then the second
+        buf = WriteBuffer((4, 3, 6), (4, 3, 2), np.float32)
+        written = []
+        for j in range(6):
+            for i in range(0, 4, 2):
+                written += self.__written(buf.add(
+                    (slice(i, i + 2), slice(None), slice(j, j + 1)),
+                    np.ones((2, 3, 1))))
+        self.assertEqual(written, [((0, 4), (0, 3), (0, 2)),
+                                   ((0, 4), (0, 3), (2, 4)),
+                                   ((0, 4), (0, 3), (4, 6))])
+
+    def test_result_array_reused(self):
+        buf = WriteBuffer((4, 2), (4, 2), np.float32)
+        result = np.zeros((1, 2))
+        ready = []
+        for i in range(4):
+            result[...] = i
+            ready += buf.add((slice(i, i + 1),), result)
+        self.assertEqual(len(ready), 1)
+        self.assertTrue(np.array_equal(ready[0][1][:, 0], np.arange(4)))
+
+    def test_writer_output(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            expected = np.random.rand(11, 6, 7).astype(np.float32)
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as f:
+                dset = f.create_dataset('data', expected.shape, np.float32,
+                                        chunks=(4, 3, 7))
+                writer = CompressedWriter(_Experiment(), [_Data(dset)])
+                # blocks in order, then a jump back
+                for i in range(0, 6, 2) + [8, 10, 6]:
+                    sl = (slice(i, min(i + 2, 11)), slice(None))
+                    writer.write(0, sl, expected[sl])
+                writer.close('test')
+                self.assertTrue(np.array_equal(dset[...], expected))
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -39,7 +39,9 @@ def __option_parser():
     parser.add_option("-n", "--names", dest="names", help="Process names",
                       default="CPU0")
     parser.add_option("-t", "--transport", dest="transport",
-                      help="Set the transport mechanism", default="hdf5")
+                      help="Set the transport mechanism (hdf5, memory or "
+                      "local)",
+                      default="hdf5")
     parser.add_option("-f", "--folder", dest="folder",
                       help="Override the output folder name")
     parser.add_option("-d", "--tmp", dest="temp_dir",
@@ -56,12 +58,80 @@ def __option_parser():
                       help="Location of syslog server", default='localhost')
     parser.add_option("-p", "--syslog_port", dest="syslog_port",
                       help="Port to connect to syslog server on", default=514)
+    parser.add_option("--keep", dest="keep",
+                      help="Comma separated names of intermediate datasets "
+                      "to write to disk when using the memory transport, "
+                      "or not to delete with --delete-intermediates")
+    parser.add_option("--pipeline", dest="pipeline", type="int",
+                      help="Overlap reading, processing and writing of frames"
+                      " using queues of this depth (0 to disable)", default=0)
+    parser.add_option("--fuse", action="store_true", dest="fuse",
+                      help="Pass frames through chains of compatible plugins "
+                      "in memory, writing only the final output of each chain",
+                      default=False)
+    parser.add_option("--dynamic", dest="dynamic", type="int",
+                      help="Hand out frames to processes on demand, this many "
+                      "at a time, instead of splitting them evenly (0 to "
+                      "disable)", default=0)
+    parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                      help="Number of worker processes for the local "
+                      "transport (defaults to the number of cores)",
+                      default=0)
+    parser.add_option("--threads", dest="threads", type="int",
+                      help="Split each block of frames between this many "
+                      "threads in thread safe plugins", default=1)
+    parser.add_option("--relayout", action="store_true", dest="relayout",
+                      help="Re-chunk datasets between plugins that slice "
+                      "them in different directions", default=False)
+    parser.add_option("--explain-chunking", action="store_true",
+                      dest="explain_chunking", help="Report the predicted "
+                      "cost of the best chunk shapes for each dataset",
+                      default=False)
+    parser.add_option("--block-size", dest="block_size", type="int",
+                      help="File system block (or stripe) size in bytes, "
+                      "used to choose chunk shapes", default=1024**2)
+    parser.add_option("--chunk-cache", dest="chunk_cache", type="int",
+                      help="Limit on the hdf5 chunk cache memory, in MB, of "
+                      "each process, shared by the datasets open at once",
+                      default=256)
+    parser.add_option("--compression", dest="compression",
+                      help="Compression of the output datasets, e.g. gzip, "
+                      "gzip:6 or tomo=lz4,gzip (see Hdf5TomoSaver).  Only "
+                      "gzip is compressed on a pool of threads, the other "
+                      "filters are applied by hdf5 as the data is written",
+                      default=None)
+    parser.add_option("--vds", action="store_true", dest="vds",
+                      help="Write the output of each process to a file of "
+                      "its own, joined by a virtual dataset", default=False)
+    parser.add_option("--collective-io", action="store_true",
+                      dest="collective_io", help="Write the output datasets "
+                      "with collective MPI-IO", default=False)
+    parser.add_option("--cache", dest="cache", help="Directory in which to "
+                      "cache results between runs (dark and flat field "
+                      "averages and plugin outputs)", default=None)
+    parser.add_option("--no-cache", action="store_true", dest="no_cache",
+                      help="Ignore the cache directory, running every "
+                      "plugin", default=False)
+    parser.add_option("--cache-size", dest="cache_size", type="float",
+                      help="Limit on the size of the plugin outputs in the "
+                      "cache directory, in GB", default=50)
+    parser.add_option("--delete-intermediates", action="store_true",
+                      dest="delete_intermediates", help="Delete each "
+                      "intermediate file once the last plugin to read it "
+                      "has finished", default=False)
+    parser.add_option("--resume", dest="resume", help="Resume a failed run "
+                      "in this output folder, from the first plugin it did "
+                      "not complete", default=None)
+    parser.add_option("--trace", action="store_true", dest="trace",
+                      help="Write a trace (trace.json) of the time spent in "
+                      "each step of the run, by each process and thread, "
+                      "to view in Perfetto", default=False)
 
     (options, args) = parser.parse_args()
     return [options, args]
 
 
-def __check_input_params(args):
+def __check_input_params(args, opt):
     """ Check for required input arguments.
     """
     if len(args) is not 3:
@@ -84,6 +154,11 @@ def __check_input_params(args):
         print("Exiting with error code 4 - Output Directory missing")
         sys.exit(4)
 
+    if opt.resume and not os.path.isdir(opt.resume):
+        print("Output folder '%s' to resume does not exist" % opt.resume)
+        print("Exiting with error code 5 - Output folder to resume missing")
+        sys.exit(5)
+
 
 def _set_options(opt, args):
     """ Set run specific information in options dictionary.
@@ -103,10 +178,32 @@ def _set_options(opt, args):
     options['cluster'] = opt.cluster
     options['syslog_server'] = opt.syslog
     options['syslog_port'] = opt.syslog_port
-
-    out_folder_name = \
-        opt.folder if opt.folder else __get_folder_name(options['data_file'])
-    out_folder_path = __create_output_folder(args[2], out_folder_name)
+    options['pipeline_depth'] = opt.pipeline
+    options['keep_datasets'] = opt.keep.split(',') if opt.keep else []
+    options['fusion'] = opt.fuse
+    options['dynamic_chunk'] = opt.dynamic
+    options['local_workers'] = opt.jobs
+    options['threads'] = opt.threads
+    options['relayout'] = opt.relayout
+    options['explain_chunking'] = opt.explain_chunking
+    options['block_size'] = opt.block_size
+    options['chunk_cache'] = opt.chunk_cache
+    options['compression'] = opt.compression
+    options['vds'] = opt.vds
+    options['collective_io'] = opt.collective_io
+    options['cache'] = None if opt.no_cache else opt.cache
+    options['cache_size'] = opt.cache_size
+    options['delete_intermediates'] = opt.delete_intermediates
+    options['resume'] = bool(opt.resume)
+    options['trace'] = opt.trace
+
+    if opt.resume:
+        out_folder_path = os.path.abspath(opt.resume)
+        out_folder_name = os.path.basename(out_folder_path)
+    else:
+        out_folder_name = opt.folder if opt.folder else \
+            __get_folder_name(options['data_file'])
+        out_folder_path = __create_output_folder(args[2], out_folder_name)
     options['out_path'] = out_folder_path
 
     inter_folder_path = __create_output_folder(opt.temp_dir, out_folder_name)\
@@ -147,7 +244,7 @@ def main(input_args=None):
     if input_args:
         args = input_args
 
-    __check_input_params(args)
+    __check_input_params(args, options)
 
     options = _set_options(options, args)
     plugin_runner = PluginRunner(options)
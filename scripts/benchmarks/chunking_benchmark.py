@@ -0,0 +1,161 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: chunking_benchmark
+   :platform: Unix
+   :synopsis: Times writing and reading hdf5 datasets, with the pattern \
+       changes found in the test process lists, using the chunks chosen by \
+       the previous heuristic and by the cost model in savu.data.chunking.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+Usage: python chunking_benchmark.py [block_size [revision]]
+
+The previous heuristic is the savu.data.chunking module of revision (by
+default, the last revision before the cost model), taken from the git
+history.  The files are opened with the chunk cache the pipeline gives them
+(see savu.core.chunk_cache).
+"""
+
+import os
+import imp
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import h5py
+import numpy as np
+
+from savu.core.chunk_cache import get_cache_kwargs
+from savu.data.chunking import Chunking
+from savu.data.meta_data import MetaData
+
+REPO = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+CHUNKING = 'savu/data/chunking.py'
+
+
+def pattern(name, max_frames, slice_dir, core_dir):
+    return {name: {'max_frames': max_frames, 'slice_dir': slice_dir,
+                   'core_dir': core_dir}}
+
+PROJ = lambda mf: pattern('PROJECTION', mf, (0,), (1, 2))
+SINO = lambda mf: pattern('SINOGRAM', mf, (1,), (0, 2))
+VOL_XZ = lambda mf: pattern('VOLUME_XZ', mf, (1,), (0, 2))
+VOL_YZ = lambda mf: pattern('VOLUME_YZ', mf, (2,), (0, 1))
+SPECTRUM = lambda mf: pattern('SPECTRUM', mf, (0, 1, 2), (3,))
+SINO_4D = lambda mf: pattern('SINOGRAM', mf, (1, 3), (0, 2))
+
+# (description, shape, current, next, processes)
+SCENARIOS = [
+    ('dark/flat correction (i12_tomo_pipeline)', (180, 256, 320), PROJ(1),
+     PROJ(1), 1),
+    ('projections to reconstruction (i12_tomo_pipeline)', (180, 256, 320),
+     PROJ(1), SINO(1), 1),
+    ('projections to reconstruction, 4 processes', (180, 256, 320), PROJ(8),
+     SINO(4), 4),
+    ('sinogram filters (vo_centering_process)', (320, 256, 320), SINO(8),
+     SINO(1), 4),
+    ('volume slices (B16_pipeline)', (320, 256, 320), VOL_XZ(1), VOL_YZ(1),
+     1),
+    ('fluorescence spectra to sinograms (xrf_tomo_i18)', (60, 16, 64, 256),
+     SPECTRUM(1), SINO_4D(1), 1)]
+
+
+def get_previous_chunking(revision=None):
+    """ The Chunking class of savu.data.chunking at revision, by default the
+    revision before the cost model was introduced.
+    """
+    if revision is None:
+        first = subprocess.check_output(
+            ['git', 'log', '--format=%H', '--reverse', '-S', 'BLOCK_SIZE',
+             '--', CHUNKING], cwd=REPO).split()[0]
+        revision = first + '^'
+    source = subprocess.check_output(
+        ['git', 'show', '%s:%s' % (revision, CHUNKING)], cwd=REPO)
+    # kept in sys.modules, as the globals of a discarded module are cleared
+    module = sys.modules.setdefault('previous_chunking',
+                                    imp.new_module('previous_chunking'))
+    exec source in module.__dict__
+    return module.Chunking
+
+
+class _Experiment(object):
+    def __init__(self, nProcs, block_size):
+        self.meta_data = MetaData({'processes': range(nProcs),
+                                   'block_size': block_size})
+
+
+def slabs(shape, patt):
+    """ The slices of each block of frames accessed by a pattern, in the
+    order they are processed. """
+    patt = patt.values()[0]
+    sdirs, max_frames = patt['slice_dir'], patt['max_frames']
+    ranges = [range(0, shape[d], max_frames) if i == 0 else range(shape[d])
+              for i, d in enumerate(sdirs)]
+    for index in np.ndindex(*[len(r) for r in ranges][::-1]):
+        sl = [slice(None)]*len(shape)
+        for d, r, i in zip(sdirs, ranges, index[::-1]):
+            sl[d] = slice(r[i], min(r[i] + max_frames, shape[d])) \
+                if d == sdirs[0] else slice(r[i], r[i] + 1)
+        yield tuple(sl)
+
+
+def time_chunks(exp, path, shape, current, nnext, chunks):
+    data = np.random.rand(*shape).astype(np.float32)
+    # the cache the saver and the loaders open the file with
+    cache = get_cache_kwargs(exp, shape, np.float32, chunks,
+                             [current.values()[0], nnext.values()[0]])
+    with h5py.File(path, 'w', **cache) as f:
+        dset = f.create_dataset('data', shape, np.float32, chunks=chunks)
+        start = time.time()
+        for sl in slabs(shape, current):
+            dset[sl] = data[sl]
+        write = time.time() - start
+    with h5py.File(path, 'r', **cache) as f:
+        dset = f['data']
+        start = time.time()
+        for sl in slabs(shape, nnext):
+            dset[sl]
+        read = time.time() - start
+    os.remove(path)
+    return write, read
+
+
+def run(block_size, revision=None):
+    Previous = get_previous_chunking(revision)
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'chunks.h5')
+    print "%-50s %-18s %8s %8s" % ('scenario', 'chunks', 'write(s)',
+                                   'read(s)')
+    try:
+        for name, shape, current, nnext, nProcs in SCENARIOS:
+            exp = _Experiment(nProcs, block_size)
+            patterns = {'current': current, 'next': nnext}
+            previous = Previous(exp, patterns)._calculate_chunking(
+                shape, np.float32)
+            chunks = Chunking(exp, patterns)._calculate_chunking(
+                shape, np.float32)
+            for label, c in [(name, previous), ('', chunks)]:
+                write, read = time_chunks(exp, path, shape, current, nnext,
+                                          c)
+                print "%-50s %-18s %8.2f %8.2f" % (label, c, write, read)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1024**2,
+        sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,121 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: decompression_benchmark
+   :platform: Unix
+   :synopsis: Times reading blocks of projections and sinograms from a \
+       compressed hdf5 dataset through h5py and by decompressing the raw \
+       chunks on increasing numbers of threads, as read by the NxtomoLoader.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+Usage: python decompression_benchmark.py [nxs_file] [data_path]
+
+Without a file, a (128, 1024, 2048) uint16 dataset is created with each
+filter available (gzip, and the hdf5plugin filters if installed).
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+import h5py
+import numpy as np
+
+from savu.data.meta_data import MetaData
+from savu.data.compression import get_filter_kwargs, hdf5plugin
+from savu.data.data_structures.data_types.decompressed_h5 import \
+    decompressed_h5, DecompressedH5
+
+SHAPE = (128, 1024, 2048)
+CHUNKS = (1, 256, 2048)
+BLOCK = 8
+
+
+class _Experiment(object):
+    def __init__(self):
+        self.meta_data = MetaData({'process_names': 'CPU0'})
+
+
+def create(tmpdir):
+    filters = [('gzip', 4)]
+    if hdf5plugin:
+        filters += [('lz4', None), ('blosc', 5), ('bitshuffle', None)]
+    filename = os.path.join(tmpdir, 'compressed.h5')
+    frame = np.random.poisson(200, SHAPE[1:]).astype(np.uint16)
+    with h5py.File(filename, 'w') as f:
+        for ffilter, level in filters:
+            dset = f.create_dataset(ffilter, SHAPE, np.uint16, chunks=CHUNKS,
+                                    **get_filter_kwargs(ffilter, level))
+            for i in range(SHAPE[0]):
+                dset[i] = np.roll(frame, i, axis=1)
+    return filename, [ffilter for ffilter, level in filters]
+
+
+def time_reads(data, frames):
+    nbytes = 0
+    start = time.time()
+    for first in range(0, frames[1], BLOCK):
+        nbytes += data[frames[0](first)].nbytes
+    return nbytes/1e6/(time.time() - start)
+
+
+def main():
+    tmpdir = None
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+        paths = [sys.argv[2] if len(sys.argv) > 2 else
+                 'entry1/tomo_entry/data/data']
+    else:
+        tmpdir = tempfile.mkdtemp()
+        filename, paths = create(tmpdir)
+
+    nThreads = [1, 2, 4, 8, 16]
+    nThreads = [n for n in nThreads if n < multiprocessing.cpu_count()] + \
+        [multiprocessing.cpu_count()]
+    try:
+        with h5py.File(filename, 'r') as f:
+            for path in paths:
+                dset = f[path]
+                shape = dset.shape
+                data = decompressed_h5(_Experiment(), dset)
+                if not isinstance(data, DecompressedH5):
+                    print("%s can not be decompressed directly." % path)
+                    continue
+                print("%s %s chunks %s, read in MB/s" % (path, shape,
+                                                         dset.chunks))
+                print("%-12s %8s" % ('frames', 'h5py') +
+                      ''.join(['%8s' % ('%i thr' % n) for n in nThreads]))
+                for name, frames in [
+                        ('projections', (lambda i: slice(i, i + BLOCK),
+                                         shape[0])),
+                        ('sinograms', (lambda i: (slice(None),
+                                                  slice(i, i + BLOCK)),
+                                       shape[1]))]:
+                    rates = [time_reads(dset, frames)]
+                    for n in nThreads:
+                        data = decompressed_h5(_Experiment(), dset)
+                        data.nThreads = n
+                        rates.append(time_reads(data, frames))
+                    print("%-12s" % name +
+                          ''.join(['%8.1f' % r for r in rates]))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
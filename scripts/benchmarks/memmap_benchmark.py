@@ -0,0 +1,103 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: memmap_benchmark
+   :platform: Unix
+   :synopsis: Times the per-frame reads of a contiguous, uncompressed, hdf5 \
+       dataset through h5py and through a memory map of the file, as read \
+       by the loaders.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+Usage: python memmap_benchmark.py [nxs_file] [data_path]
+
+Without a file, a (200, 1024, 1024) uint16 dataset is created in a temporary
+directory.  Run on a file that is not in the page cache to include the cost
+of reading from disk.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import h5py
+import numpy as np
+
+from savu.data.data_structures.data_types.memmap_h5 import memmap_h5
+
+SHAPE = (200, 1024, 1024)
+REPEATS = 50
+
+
+def create(filename):
+    with h5py.File(filename, 'w') as f:
+        dset = f.create_dataset('data', SHAPE, np.uint16)
+        for start in range(0, SHAPE[0], 20):
+            dset[start:start+20] = \
+                np.random.randint(0, 4000, (20,) + SHAPE[1:])
+    return filename, 'data'
+
+
+def frames(shape):
+    """ (name, frame index function) pairs for frames of a 3D dataset. """
+    return [('projection', lambda i: (slice(i, i+1),)),
+            ('8 projections', lambda i: (slice(i, i+8),)),
+            ('sinogram', lambda i: (slice(None), slice(i, i+1))),
+            ('64x64 tile', lambda i: (slice(i, i+1), slice(0, 64),
+                                      slice(0, 64)))]
+
+
+def time_reads(data, index, nFrames):
+    times = []
+    for i in np.linspace(0, nFrames - 8, REPEATS).astype(int):
+        start = time.time()
+        data[index(i)]
+        times.append(time.time() - start)
+    return np.median(times)*1e3
+
+
+def main():
+    tmpdir = None
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+        path = sys.argv[2] if len(sys.argv) > 2 else \
+            'entry1/tomo_entry/data/data'
+    else:
+        tmpdir = tempfile.mkdtemp()
+        filename, path = create(os.path.join(tmpdir, 'memmap.h5'))
+
+    try:
+        with h5py.File(filename, 'r') as f:
+            dset = f[path]
+            mapped = memmap_h5(dset)
+            if mapped is dset:
+                print("%s is not contiguous and uncompressed: h5py is used."
+                      % path)
+                return
+            print("%s %s %s" % (path, dset.shape, dset.dtype))
+            print("%-16s %12s %12s %8s" % ('frame', 'h5py(ms)', 'memmap(ms)',
+                                           'speedup'))
+            nFrames = min(dset.shape[0], dset.shape[1])
+            for name, index in frames(dset.shape):
+                h5 = time_reads(dset, index, nFrames)
+                mm = time_reads(mapped, index, nFrames)
+                print("%-16s %12.3f %12.3f %8.1f" % (name, h5, mm, h5/mm))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
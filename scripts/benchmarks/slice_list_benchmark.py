@@ -0,0 +1,115 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: slice_list_benchmark
+   :platform: Unix
+   :synopsis: Compares the time and memory taken to set up the slice lists \
+       of a 4D time series, as materialised lists of tuples and as SliceLists.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+Usage: python slice_list_benchmark.py [max_frames_per_block]
+"""
+
+import sys
+import time
+import numpy as np
+
+from savu.data.data_structures.slice_list import SliceList
+
+# (time, rotation, y) slice dimensions with x as the single core dimension
+SLICE_SHAPES = [(10, 100, 100), (10, 1000, 100), (100, 1000, 100)]
+
+
+def index_arrays(sshape):
+    """ The index of each frame in each slice dimension, as built by
+    Hdf5TransportData.__get_slice_dirs_index.
+    """
+    nFrames = int(np.prod(sshape))
+    idx = []
+    for dim in range(len(sshape)):
+        chunk = int(np.prod(sshape[:dim]))
+        repeat = int(np.prod(sshape[dim+1:]))
+        idx.append(np.tile(np.repeat(np.arange(sshape[dim]), chunk),
+                           repeat))
+    return np.array(idx).reshape(len(sshape), nFrames)
+
+
+def tuple_lists(index, slice_dirs, nDims, max_frames, length):
+    """ The previous implementation: a tuple per frame, then grouped. """
+    single = []
+    for i in range(index.shape[1]):
+        getitem = np.array([slice(None)]*nDims)
+        for sdir in range(len(slice_dirs)):
+            getitem[slice_dirs[sdir]] = slice(index[sdir, i],
+                                              index[sdir, i] + 1, 1)
+        single.append(tuple(getitem))
+
+    grouped = []
+    banks = [single[x:x+length] for x in xrange(0, len(single), length)]
+    for bank in banks:
+        for sub in [bank[x:x+max_frames] for x in
+                    xrange(0, len(bank), max_frames)]:
+            entry = list(sub[0])
+            entry[slice_dirs[0]] = slice(sub[0][slice_dirs[0]].start,
+                                         sub[-1][slice_dirs[0]].stop, 1)
+            grouped.append(tuple(entry))
+    return grouped
+
+
+def slice_lists(index, slice_dirs, nDims, max_frames, length):
+    """ The SliceList implementation. """
+    starts = np.transpose(index)
+    single = SliceList([slice(None)]*nDims, slice_dirs, starts, starts + 1,
+                       np.ones(starts.shape, dtype=np.int64))
+    first = np.arange(len(single))
+    first = first[first % length % max_frames == 0]
+    last = np.minimum(first + max_frames, (first/length + 1)*length) - 1
+    grouped = single._take(first)
+    grouped.stops[:, 0] = single.stops[last, 0]
+    return grouped
+
+
+def tuple_list_bytes(slice_list):
+    entry = slice_list[0]
+    return len(slice_list)*(sys.getsizeof(entry) + sum(
+        sys.getsizeof(s) for s in entry)) + sys.getsizeof(slice_list)
+
+
+def slice_list_bytes(slice_list):
+    return slice_list.starts.nbytes*3
+
+
+def run(max_frames):
+    slice_dirs = [1, 2, 0]
+    print "%12s %14s %12s %14s %12s" % ('frames', 'tuples (s)', 'MB',
+                                        'SliceList (s)', 'MB')
+    for sshape in SLICE_SHAPES:
+        index = index_arrays(sshape)
+        nFrames = index.shape[1]
+        results = []
+        for func, size in [(tuple_lists, tuple_list_bytes),
+                           (slice_lists, slice_list_bytes)]:
+            if func is tuple_lists and nFrames > 1e6:
+                results += [float('nan')]*2
+                continue
+            start = time.time()
+            sl = func(index, slice_dirs, 4, max_frames, sshape[0])
+            results += [time.time() - start, size(sl)/1e6]
+            del sl
+        print "%12i %14.3f %12.1f %14.3f %12.1f" % tuple([nFrames] + results)
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
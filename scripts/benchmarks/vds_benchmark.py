@@ -0,0 +1,129 @@
+# Copyright 2014 Diamond Light Source Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. module:: vds_benchmark
+   :platform: Unix
+   :synopsis: Times each process writing its contiguous range of frames to \
+       one shared file (mpio driver) and to a file of its own joined by a \
+       virtual dataset, as written by the Hdf5TomoSaver.
+
+.. moduleauthor:: Nicola Wadeson <scientificsoftware@diamond.ac.uk>
+
+Usage: mpirun -np <n> python vds_benchmark.py [out_dir] [nFrames] [repeats]
+
+Run with increasing numbers of nodes to compare the scaling, e.g. on the
+cluster file system used for the intermediate files.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import h5py
+import numpy as np
+from mpi4py import MPI
+
+from savu.data.meta_data import MetaData
+from savu.data.virtual_dataset import VirtualDataset
+
+FRAME = (2560, 2160)
+MAX_FRAMES = 8
+
+
+class _Experiment(object):
+    def __init__(self, process):
+        self.meta_data = MetaData({'process': process})
+
+
+def open_shared(filename, comm):
+    if comm.size == 1:
+        return h5py.File(filename, 'w')
+    info = MPI.Info.Create()
+    info.Set("romio_ds_write", "disable")
+    return h5py.File(filename, 'w', driver='mpio', comm=comm, info=info)
+
+
+def write_frames(dataset, frames):
+    block = np.random.rand(MAX_FRAMES, *FRAME).astype(np.float32)
+    for start in range(frames[0], frames[-1] + 1, MAX_FRAMES):
+        stop = min(start + MAX_FRAMES, frames[-1] + 1)
+        dataset[start:stop] = block[:stop - start]
+
+
+def run(out_dir, nFrames, virtual, comm):
+    shape = (nFrames,) + FRAME
+    chunks = (MAX_FRAMES, FRAME[0]//8, FRAME[1])
+    frames = np.array_split(np.arange(nFrames), comm.size)[comm.rank]
+    filename = os.path.join(out_dir, 'vds.h5' if virtual else 'shared.h5')
+
+    comm.barrier()
+    start = time.time()
+    backing_file = open_shared(filename, comm)
+    group = backing_file.create_group('entry')
+    if virtual:
+        vds = VirtualDataset(_Experiment(comm.rank), group, shape,
+                             np.float32, chunks=chunks)
+        dataset = vds.source
+    else:
+        dataset = group.create_dataset('data', shape, np.float32,
+                                       chunks=chunks)
+    setup = time.time()
+    write_frames(dataset, frames)
+    if virtual:
+        for first in range(frames[0], frames[-1] + 1, MAX_FRAMES):
+            vds.add((slice(first, min(first + MAX_FRAMES, frames[-1] + 1)),))
+        vds.close(comm)
+    backing_file.close()
+    comm.barrier()
+    stop = time.time()
+    return setup - start, stop - setup, \
+        np.prod(shape)*np.dtype(np.float32).itemsize
+
+
+def main():
+    comm = MPI.COMM_WORLD
+    if comm.size > 1 and not h5py.get_config().mpi:
+        if comm.rank == 0:
+            print("The shared file requires h5py built with mpi.")
+        return
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    nFrames = int(sys.argv[2]) if len(sys.argv) > 2 else 16*comm.size
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    tmpdir = comm.bcast(tempfile.mkdtemp(dir=out_dir) if comm.rank == 0
+                        else None)
+    try:
+        if comm.rank == 0:
+            print("%i processes, %i frames of %s" % (comm.size, nFrames,
+                                                     FRAME))
+            print("%-28s %9s %9s %9s" % ('output', 'setup(s)', 'write(s)',
+                                         'MB/s'))
+        for virtual in [False, True]:
+            times = [run(tmpdir, nFrames, virtual, comm)
+                     for r in range(repeats)]
+            setup, write, nbytes = min(times, key=lambda t: t[0] + t[1])
+            if comm.rank == 0:
+                name = 'file per process + vds' if virtual else \
+                    'shared file'
+                print("%-28s %9.2f %9.2f %9.1f" % (name, setup, write,
+                                                   nbytes/1e6/write))
+    finally:
+        comm.barrier()
+        if comm.rank == 0:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()